@@ -0,0 +1,71 @@
+"""
+Benchmark of warm starts for the eigensolvers in cooltools.lib.numutils.
+
+Solves a compartment-like matrix at a coarse resolution, upsamples the
+eigenvectors and compares cold and warm starts of the block eigensolvers at
+the fine resolution, as done by eigdecomp.eigs_cis_multires:
+
+    python benchmarks/bench_eigs.py --sizes 2000 4000 --noise 20
+
+ARPACK is only timed from a cold start for reference.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cooltools.lib import numutils
+
+
+def make_matrix(n, noise, n_eigs=3, seed=0):
+    # a low-rank plaid pattern with decaying eigenvalues plus symmetric noise
+    rng = np.random.RandomState(seed)
+    x = np.arange(n)
+    tracks = np.c_[np.sin(x / 40), np.cos(x / 13), np.sin(x / 7 + 1)][:, :n_eigs]
+    scales = np.linspace(2.0, 1.0, tracks.shape[1]) * np.sqrt(n)
+    mat = (tracks * scales) @ tracks.T + rng.standard_normal((n, n)) * noise
+    return (mat + mat.T) / 2
+
+
+def coarsen(mat, factor):
+    n = mat.shape[0] // factor * factor
+    mat = mat[:n, :n].reshape(n // factor, factor, n // factor, factor)
+    return mat.sum(axis=(1, 3))
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 4000])
+    parser.add_argument("--noise", type=float, default=20.0)
+    parser.add_argument("--n-eigs", type=int, default=3)
+    parser.add_argument("--factor", type=int, default=2)
+    args = parser.parse_args()
+
+    solvers = [
+        ("lobpcg", numutils._eigsh_lobpcg),
+        ("randomized", numutils._eigsh_randomized),
+    ]
+
+    print(f"{'size':>8}  {'solver':<12}{'start':<8}{'iterations':>12}{'time, s':>10}")
+    for n in args.sizes:
+        mat = make_matrix(n, args.noise, args.n_eigs)
+        elapsed, _ = timeit(numutils.get_eig, mat, args.n_eigs)
+        print(f"{n:>8}  {'arpack':<12}{'cold':<8}{'':>12}{elapsed:>10.2f}")
+
+        mat_coarse = coarsen(mat, args.factor)
+        for name, solver in solvers:
+            _, eigvecs_coarse, _ = solver(mat_coarse, args.n_eigs)
+            v0 = np.repeat(eigvecs_coarse.T, args.factor, axis=1)[:, :n]
+            for start, kwargs in [("cold", {}), ("warm", {"v0": v0})]:
+                elapsed, (_, _, n_iter) = timeit(solver, mat, args.n_eigs, **kwargs)
+                print(f"{n:>8}  {name:<12}{start:<8}{n_iter:>12}{elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of the topographic prominence of peaks in cooltools.lib.peaks.
+
+Compares find_peak_prominence against the direct search of the adjacent
+higher peaks with nested Python loops (the implementation it replaced) and
+against find_peak_prominence_iterative, on insulation-like tracks:
+
+    python benchmarks/bench_peaks.py --sizes 1000000 10000000
+
+The slow implementations are only timed on tracks up to --max-size-slow.
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+import scipy.signal
+
+from cooltools.lib import peaks
+
+
+def find_peak_prominence_loops(arr, max_dist=None):
+    # the nested-loop search of the higher peaks, as in cooltools <= 0.5.0
+    arr = np.asarray(arr)
+    n = len(arr)
+    max_dist = n if max_dist is None else int(max_dist)
+    idxs_nonans = np.where(~np.isnan(arr))[0]
+    arr_nonans = arr[idxs_nonans]
+    is_loc_max = np.r_[False, arr_nonans[:-1] < arr_nonans[1:]] & np.r_[
+        arr_nonans[:-1] > arr_nonans[1:], False
+    ]
+    loc_max_poss = idxs_nonans[is_loc_max]
+
+    proms = np.full(len(loc_max_poss), np.nan)
+    for i, pos in enumerate(loc_max_poss):
+        left_prom, right_prom = np.nan, np.nan
+        for j in range(pos - 1, -1, -1):
+            if (arr[j] > arr[pos]) or (pos - j > max_dist):
+                left_prom = arr[pos] - np.nanmin(arr[j:pos])
+                break
+        for j in range(pos + 1, n):
+            if (arr[j] > arr[pos]) or (j - pos > max_dist):
+                right_prom = arr[pos] - np.nanmin(arr[pos:j])
+                break
+        proms[i] = np.nanmin([left_prom, right_prom])
+    return loc_max_poss, proms
+
+
+def make_track(n, seed=0):
+    # a mean-reverting AR(1) process with a few NaNs, like an insulation track
+    rng = np.random.RandomState(seed)
+    track = scipy.signal.lfilter([1.0], [1.0, -0.95], rng.randn(n))
+    track[rng.rand(n) < 0.01] = np.nan
+    return track
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10 ** 6, 10 ** 7])
+    parser.add_argument("--max-size-slow", type=int, default=10 ** 6)
+    parser.add_argument("--max-dist", type=int, default=None)
+    args = parser.parse_args()
+
+    # compile the numba kernels outside of the timings
+    peaks.find_peak_prominence(make_track(1000))
+
+    benchmarks = [
+        ("find_peak_prominence", peaks.find_peak_prominence, False),
+        ("nested loops", find_peak_prominence_loops, True),
+        (
+            "find_peak_prominence_iterative",
+            lambda arr, max_dist: peaks.find_peak_prominence_iterative(arr),
+            True,
+        ),
+    ]
+
+    print(f"{'size':>10}  {'function':<32}{'time, s':>10}")
+    for n in args.sizes:
+        track = make_track(n)
+        for name, func, slow in benchmarks:
+            if slow and n > args.max_size_slow:
+                print(f"{n:>10}  {name:<32}{'skipped':>10}")
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                elapsed = timeit(func, track, max_dist=args.max_dist)
+            print(f"{n:>10}  {name:<32}{elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,7 @@ from .lib import (
 
 from .api.expected import expected_cis, expected_trans
 from .api.coverage import coverage
+from .api.balance import balance
 from .api.eigdecomp import eigs_cis, eigs_trans
 from .api.saddle import digitize, saddle
 from .api.sample import sample
@@ -0,0 +1,177 @@
+import numpy as np
+
+from ..lib import numutils
+
+
+def _filter_bins(
+    marg, nnz, chrom_offsets, min_nnz=10, min_count=0, mad_max=5, blacklist=None
+):
+    """
+    Mask of bins to balance, with the same filters as cooler.balance_cooler.
+    """
+    mask = marg > 0
+
+    # Drop bins with too few nonzeros
+    if min_nnz > 0:
+        mask &= nnz >= min_nnz
+
+    # Drop bins with too few total counts
+    if min_count:
+        mask &= marg >= min_count
+
+    # MAD-max filter on the marginals normalized by the chromosome median
+    if mad_max > 0:
+        marg = marg.astype(float)
+        for lo, hi in zip(chrom_offsets[:-1], chrom_offsets[1:]):
+            c_marg = marg[lo:hi]
+            if np.any(c_marg > 0):
+                marg[lo:hi] /= np.median(c_marg[c_marg > 0])
+        logNzMarg = np.log(marg[marg > 0])
+        med_logNzMarg = np.median(logNzMarg)
+        dev_logNzMarg = numutils.MAD(logNzMarg)
+        cutoff = np.exp(med_logNzMarg - mad_max * dev_logNzMarg)
+        mask &= marg >= cutoff
+
+    # Filter out pre-determined bad bins
+    if blacklist is not None:
+        mask[blacklist] = False
+
+    return mask
+
+
+def balance(
+    clr,
+    method="ice",
+    ignore_diags=2,
+    min_nnz=10,
+    min_count=0,
+    mad_max=5,
+    blacklist=None,
+    tol=1e-5,
+    max_iter=200,
+    chunksize=10_000_000,
+    nproc=1,
+    verbose=False,
+    store=False,
+    store_name="weight",
+):
+    """
+    Balance a sparse Hi-C contact map in Cooler HDF5 format genome-wide.
+
+    The matrix is never loaded as a whole: every iteration streams the pixel
+    table in chunks and computes the matrix-vector products needed by the
+    solver, optionally in a process pool. Memory use is bounded by the number
+    of bins and `chunksize` pixels per process.
+
+    Parameters
+    ----------
+    clr : cooler.Cooler
+        Cooler object
+    method : str
+        Balancing algorithm:
+        'ice' - iterative correction, as in cooler balance,
+        'kr' - Knight-Ruiz matrix balancing (bnewt), which typically needs
+        far fewer passes over the data to converge.
+    ignore_diags : int
+        Drop elements occurring on the first ``ignore_diags`` diagonals of the
+        matrix (including the main diagonal).
+    min_nnz : int
+        Ignore bins with fewer nonzero pixels.
+    min_count : int
+        Ignore bins with a lower total count.
+    mad_max : int
+        Ignore bins whose log marginal sum is more than ``mad_max`` median
+        absolute deviations below the median log marginal sum.
+    blacklist : array-like, optional
+        Bin IDs to ignore.
+    tol : float
+        Convergence criterion: variance of the marginals for 'ice', residual
+        norm of the marginals for 'kr'.
+    max_iter : int
+        The maximal number of iterations to take.
+    chunksize : int, optional
+        The number of pixels per chunk.
+    nproc : int, optional
+        How many processes to use for calculation.
+    verbose : bool
+        If True, print convergence information at each iteration.
+    store : bool, optional
+        If True, store the weights and balancing statistics in the bin table
+        of the cooler.
+    store_name : str, optional
+        Name of the column of the bin table to save the weights to.
+
+    Returns
+    -------
+    bias : 1D array, whose shape is the number of bins in ``clr``.
+        Vector of multiplicative balancing weights, NaN for bins that were
+        filtered out.
+    stats : dict
+        Summary of parameters used and convergence, including the "trace" of
+        the convergence criterion at each iteration.
+
+    """
+    if method not in ("ice", "kr"):
+        raise ValueError("Unknown balancing method: {}".format(method))
+
+    # execution details
+    if nproc > 1:
+        pool = numutils.get_mp_context().Pool(nproc)
+        map_ = pool.map
+    else:
+        map_ = map
+
+    # using try-clause to close mp.Pool properly
+    try:
+        matvec = numutils.CoolerMatVec(
+            clr, chunksize=chunksize, map=map_, ignore_diags=ignore_diags
+        )
+        marg, nnz = matvec.marginals()
+        mask = _filter_bins(
+            marg,
+            nnz,
+            clr._load_dset("indexes/chrom_offset"),
+            min_nnz=min_nnz,
+            min_count=min_count,
+            mad_max=mad_max,
+            blacklist=blacklist,
+        )
+
+        if method == "ice":
+            bias, report = numutils.iterative_correction_matvec(
+                matvec, mask, max_iter=max_iter, tol=tol, verbose=verbose
+            )
+        else:
+            bias, report = numutils.bnewt(
+                matvec, mask, tol=tol, max_iter=max_iter, verbose=verbose
+            )
+    finally:
+        if nproc > 1:
+            pool.close()
+
+    stats = {
+        "method": method,
+        "tol": tol,
+        "min_nnz": min_nnz,
+        "min_count": min_count,
+        "mad_max": mad_max,
+        "cis_only": False,
+        "ignore_diags": ignore_diags,
+        "scale": report.get("scale", 1.0),
+        "converged": report["converged"],
+        "iternum": report["iternum"],
+        "divisive_weights": False,
+        "trace": report["trace"],
+    }
+
+    if store:
+        with clr.open("r+") as grp:
+            if store_name in grp["bins"]:
+                del grp["bins"][store_name]
+            h5opts = dict(compression="gzip", compression_opts=6)
+            grp["bins"].create_dataset(store_name, data=bias, **h5opts)
+            grp["bins"][store_name].attrs.update(
+                {k: v for k, v in stats.items() if k != "trace"}
+            )
+
+    return bias, stats
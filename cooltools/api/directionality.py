@@ -1,77 +1,82 @@
+import logging
 import warnings
 import numpy as np
 import pandas as pd
-from ..lib import peaks, numutils
 
+from ..lib._query import CSRSelector
+from ..lib import peaks, numutils
 
-def _dirscore(
-    pixels, bins, window=10, ignore_diags=2, balanced=True, signed_chi2=False
-):
-    lo_bin_id = bins.index.min()
-    hi_bin_id = bins.index.max() + 1
-    N = hi_bin_id - lo_bin_id
+from ..lib.checks import is_compatible_viewframe
+from ..lib.common import make_cooler_view
 
-    bad_bin_mask = (
-        bins["weight"].isnull().values if balanced else np.zeros(N, dtype=bool)
-    )
+logging.basicConfig(level=logging.INFO)
 
-    diag_pixels = pixels[pixels["bin2_id"] - pixels["bin1_id"] <= (window - 1) * 2]
-    if balanced:
-        diag_pixels = diag_pixels[~diag_pixels["balanced"].isnull()]
 
-    i = diag_pixels["bin1_id"].values - lo_bin_id
-    j = diag_pixels["bin2_id"].values - lo_bin_id
-    val = diag_pixels["balanced"].values if balanced else diag_pixels["count"].values
-
-    sum_pixels_left = np.zeros(N)
-    n_pixels_left = np.zeros(N)
-    for i_shift in range(0, window):
-        if i_shift < ignore_diags:
-            continue
+def _dirsums(pixel_query, weights, windows, ignore_diags=2, prefetch=0):
+    """
+    Sums of the pixels upstream ("left") and downstream ("right") of every
+    bin of a region, within each of the windows.
 
-        mask = (i + i_shift == j) & (i + i_shift < N) & (j >= 0)
-        sum_pixels_left += np.bincount(i[mask] + i_shift, val[mask], minlength=N)
+    Pixels are streamed from a range query chunk by chunk and only the
+    diagonal band narrower than the largest window is used, so that the
+    memory footprint is set by the query chunksize and the band width.
 
-        loc_bad_bin_mask = np.zeros(N, dtype=bool)
-        if i_shift == 0:
-            loc_bad_bin_mask |= bad_bin_mask
-        else:
-            loc_bad_bin_mask[i_shift:] |= bad_bin_mask[:-i_shift]
-            loc_bad_bin_mask |= bad_bin_mask
-        n_pixels_left[i_shift:] += 1 - loc_bad_bin_mask[i_shift:]
+    Parameters
+    ----------
+    pixel_query : RangeQuery
+        A query of the pixels of a square cis region.
+    weights : 1D array or None
+        Balancing weights of the bins of the region, NaN for bad bins.
+        If None, raw counts are summed.
+    windows : list of int
+        Window sizes, in bins.
+    ignore_diags : int
+        The number of diagonals to ignore.
+    prefetch : int
+        The number of chunks to read ahead in a background thread.
 
-    sum_pixels_right = np.zeros(N)
-    n_pixels_right = np.zeros(N)
-    for j_shift in range(0, window):
-        if j_shift < ignore_diags:
-            continue
+    Returns
+    -------
+    sum_left, sum_right : 2D arrays of shape (len(windows), N)
+    """
+    lo_bin_id = pixel_query.ispan[0]
+    N = pixel_query.ispan[1] - lo_bin_id
+    max_window = max(windows)
+    sum_left = np.zeros((len(windows), N))
+    sum_right = np.zeros((len(windows), N))
 
-        mask = (i == j - j_shift) & (i < N) & (j - j_shift >= 0)
+    for chunk in pixel_query.read_chunked(prefetch=prefetch):
+        i = chunk["bin1_id"] - lo_bin_id
+        j = chunk["bin2_id"] - lo_bin_id
+        dist = j - i
+        band = (dist >= ignore_diags) & (dist < max_window)
+        i, j, dist = i[band], j[band], dist[band]
+        val = chunk["count"][band].astype(np.float64)
+        if weights is not None:
+            val *= weights[i] * weights[j]
+            valid = ~np.isnan(val)
+            i, j, dist, val = i[valid], j[valid], dist[valid], val[valid]
 
-        sum_pixels_right += np.bincount(i[mask], val[mask], minlength=N)
+        for k, window in enumerate(windows):
+            mask = dist < window
+            sum_left[k] += np.bincount(j[mask], val[mask], minlength=N)
+            sum_right[k] += np.bincount(i[mask], val[mask], minlength=N)
 
-        loc_bad_bin_mask = np.zeros(N, dtype=bool)
-        loc_bad_bin_mask |= bad_bin_mask
-        if j_shift == 0:
-            loc_bad_bin_mask |= bad_bin_mask
-        else:
-            loc_bad_bin_mask[:-j_shift] |= bad_bin_mask[j_shift:]
+    return sum_left, sum_right
 
-        n_pixels_right[: (-j_shift if j_shift else None)] += (
-            1 - loc_bad_bin_mask[: (-j_shift if j_shift else None)]
-        )
 
+def _dirscore(a, b, signed_chi2=False):
+    """
+    Directionality scores from the upstream (a) and downstream (b) sums:
+    the ratio (b - a) / (a + b) or the signed chi2 directionality index.
+    """
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
-
-        a = sum_pixels_left
-        b = sum_pixels_right
         if signed_chi2:
             e = (a + b) / 2.0
             score = np.sign(b - a) * ((a - e) ** 2 + (b - e) ** 2) / e
         else:
             score = (b - a) / (a + b)
-
     return score
 
 
@@ -93,93 +98,199 @@ def _dirscore_dense(A, window=10, signed_chi2=False):
     return di
 
 
+def _bad_bin_neighbors(is_bad_bin, min_dist_bad_bin):
+    """
+    Mask bins closer than `min_dist_bad_bin` to a bad bin or a region edge.
+    """
+    bad_bin_neighbor = np.zeros_like(is_bad_bin)
+    for i in range(0, min_dist_bad_bin):
+        if i == 0:
+            bad_bin_neighbor = bad_bin_neighbor | is_bad_bin
+        else:
+            bad_bin_neighbor = bad_bin_neighbor | np.r_[[True] * i, is_bad_bin[:-i]]
+            bad_bin_neighbor = bad_bin_neighbor | np.r_[is_bad_bin[i:], [True] * i]
+    return bad_bin_neighbor
+
+
+def _directionality_region(
+    region,
+    clr,
+    window_bp,
+    balance,
+    min_dist_bad_bin,
+    ignore_diags,
+    chunksize,
+    prefetch=0,
+):
+    """
+    Directionality tracks for all windows within a single region of a view.
+    """
+    chrom, start, end, name = region
+    bin_size = clr.info["bin-size"]
+    windows = [w // bin_size for w in window_bp]
+
+    region_bins = clr.bins().fetch([chrom, start, end])
+    dir_region = region_bins[["chrom", "start", "end"]].copy()
+    dir_region["region"] = name
+
+    weights = region_bins[balance].values if balance else None
+    is_bad_bin = (
+        np.isnan(weights) if balance else np.zeros(len(region_bins), dtype=bool)
+    )
+    bad_bin_neighbor = _bad_bin_neighbors(is_bad_bin, min_dist_bad_bin)
+    dir_region["bad_bin_masked"] = bad_bin_neighbor
+
+    # open the file in the (possibly forked) worker
+    nbins = clr.info["nbins"]
+    selector = CSRSelector(
+        clr.open("r"),
+        shape=(nbins, nbins),
+        field="count",
+        chunksize=chunksize,
+        max_diag=max(windows),
+    )
+    c0, c1 = clr.extent([chrom, start, end])
+    sum_left, sum_right = _dirsums(
+        selector[c0:c1, c0:c1],
+        weights,
+        windows,
+        ignore_diags=ignore_diags,
+        prefetch=prefetch,
+    )
+
+    for k, w in enumerate(window_bp):
+        for key, signed_chi2 in [("ratio", False), ("index", True)]:
+            dir_track = _dirscore(sum_left[k], sum_right[k], signed_chi2=signed_chi2)
+            dir_track[bad_bin_neighbor] = np.nan
+            dir_track[~np.isfinite(dir_track)] = np.nan
+            dir_region[f"directionality_{key}_{w}"] = dir_track
+
+    return dir_region
+
+
 def directionality(
     clr,
     window_bp=100000,
+    view_df=None,
     balance="weight",
     min_dist_bad_bin=2,
     ignore_diags=None,
     chromosomes=None,
+    chunksize=20000000,
+    prefetch=0,
+    nproc=1,
+    verbose=False,
 ):
-    """Calculate the diamond insulation scores and call insulating boundaries.
+    """Calculate the directionality ratio and the directionality index.
+
+    For every bin, the balanced contacts made with the bins upstream and
+    downstream of it within a window are summed up in a single streaming pass
+    over the diagonal band of each region. These sums yield the
+    directionality ratio (b - a) / (a + b) and the signed chi2 directionality
+    index of Dixon et al. (2012) for all windows at once.
 
     Parameters
     ----------
     clr : cooler.Cooler
         A cooler with balanced Hi-C data.
-    window_bp : int
-        The size of the sliding diamond window used to calculate the insulation
-        score.
+    window_bp : int or list
+        The size of the window upstream and downstream of a bin to sum
+        contacts over. If a list is provided, the scores are calculated for
+        each value of window_bp.
+    view_df : bioframe.viewframe or None
+        Viewframe for independent calculation of directionality for regions.
+        By default, the full chromosomes are used.
+    balance : str or None
+        Name of the column in the bin table with weight.
+        Using unbalanced data with `None` will avoid masking "bad" bins.
     min_dist_bad_bin : int
-        The minimal allowed distance to a bad bin. Do not calculate insulation
-        scores for bins having a bad bin closer than this distance.
+        The minimal allowed distance to a bad bin. Do not calculate
+        directionality scores for bins having a bad bin closer than this
+        distance.
     ignore_diags : int
         The number of diagonals to ignore. If None, equals the number of
         diagonals ignored during IC balancing.
+    chromosomes : list of str, optional
+        Restrict the calculation to these chromosomes, when view_df is None.
+    chunksize : int
+        The number of pixels to read at a time.
+    prefetch : int
+        The number of chunks of pixels to read ahead in a background thread,
+        overlapping I/O with computation. 0 disables prefetching.
+    nproc : int
+        How many processes to use for calculation, one region per process.
+    verbose : bool
+        If True, report real-time progress.
 
     Returns
     -------
-    ins_table : pandas.DataFrame
-        A table containing the insulation scores of the genomic bins and
-        the insulating boundary strengths.
+    dir_table : pandas.DataFrame
+        A table containing the directionality ratios and indices of the genomic
+        bins, with a pair of columns per window size.
     """
-    if chromosomes is None:
-        chromosomes = clr.chromnames
+    if view_df is None:
+        view_df = make_cooler_view(clr)
+        if chromosomes is not None:
+            view_df = view_df[view_df["chrom"].isin(chromosomes)]
+    else:
+        # Make sure view_df is a proper viewframe
+        try:
+            _ = is_compatible_viewframe(
+                view_df,
+                clr,
+                check_sorting=True,
+                raise_errors=True,
+            )
+        except Exception as e:
+            raise ValueError("view_df is not a valid viewframe or incompatible") from e
 
     bin_size = clr.info["bin-size"]
-    ignore_diags = (
-        ignore_diags
-        if ignore_diags is not None
-        else clr._load_attrs(clr.root.rstrip("/") + "/bins/weight")["ignore_diags"]
-    )
-    window_bins = window_bp // bin_size
+    if ignore_diags is None:
+        if not balance:
+            raise ValueError("Please, specify ignore_diags for unbalanced data")
+        ignore_diags = clr._load_attrs(clr.root.rstrip("/") + f"/bins/{balance}")[
+            "ignore_diags"
+        ]
 
-    if window_bp % bin_size != 0:
-        raise Exception(
-            "The window size ({}) has to be a multiple of the bin size {}".format(
-                window_bp, bin_size
-            )
+    if np.isscalar(window_bp):
+        window_bp = [window_bp]
+    window_bp = [int(w) for w in window_bp]
+
+    bad_win_sizes = [w for w in window_bp if w % bin_size != 0]
+    if bad_win_sizes:
+        raise ValueError(
+            f"The window sizes {bad_win_sizes} have to be a multiple of the bin size {bin_size}"
         )
 
-    dir_chrom_tables = []
-    for chrom in chromosomes:
-        chrom_bins = clr.bins().fetch(chrom)
-        chrom_pixels = clr.matrix(as_pixels=True, balance=balance).fetch(chrom)
-
-        # mask neighbors of bad bins
-        is_bad_bin = np.isnan(chrom_bins["weight"].values)
-        bad_bin_neighbor = np.zeros_like(is_bad_bin)
-        for i in range(0, min_dist_bad_bin):
-            if i == 0:
-                bad_bin_neighbor = bad_bin_neighbor | is_bad_bin
-            else:
-                bad_bin_neighbor = bad_bin_neighbor | np.r_[[True] * i, is_bad_bin[:-i]]
-                bad_bin_neighbor = bad_bin_neighbor | np.r_[is_bad_bin[i:], [True] * i]
-
-        dir_chrom = chrom_bins[["chrom", "start", "end"]].copy()
-        dir_chrom["bad_bin_masked"] = bad_bin_neighbor
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", RuntimeWarning)
-            dir_track = _dirscore(
-                chrom_pixels, chrom_bins, window=window_bins, ignore_diags=ignore_diags
-            )
-            dir_track[bad_bin_neighbor] = np.nan
-            dir_track[~np.isfinite(dir_track)] = np.nan
-            dir_chrom["directionality_ratio_{}".format(window_bp)] = dir_track
-
-            dir_track = _dirscore(
-                chrom_pixels,
-                chrom_bins,
-                window=window_bins,
-                ignore_diags=ignore_diags,
-                signed_chi2=True,
-            )
-            dir_track[bad_bin_neighbor] = np.nan
-            dir_track[~np.isfinite(dir_track)] = np.nan
-            dir_chrom["directionality_index_{}".format(window_bp)] = dir_track
+    regions = view_df[["chrom", "start", "end", "name"]].values.tolist()
+
+    def _each(region):
+        if verbose:
+            logging.info(f"Processing region {region[3]}")
+        return _directionality_region(
+            region,
+            clr,
+            window_bp,
+            balance,
+            min_dist_bad_bin,
+            ignore_diags,
+            chunksize,
+            prefetch,
+        )
+
+    # execution details
+    if nproc > 1:
+        pool = numutils.get_mp_context().Pool(nproc)
+        map_ = pool.map
+    else:
+        map_ = map
 
-        dir_chrom_tables.append(dir_chrom)
+    # using try-clause to close mp.Pool properly
+    try:
+        dir_region_tables = list(map_(_each, regions))
+    finally:
+        if nproc > 1:
+            pool.close()
 
-    dir_table = pd.concat(dir_chrom_tables)
+    dir_table = pd.concat(dir_region_tables)
     return dir_table
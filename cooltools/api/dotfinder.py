@@ -3,21 +3,28 @@ Collection of functions related to dot-calling
 
 """
 from functools import partial, reduce
-import multiprocess as mp
 import logging
+import os
+import os.path as op
+import glob
+import pickle
+import time
 
 from scipy.linalg import toeplitz
 from scipy.ndimage import convolve
 from scipy.stats import poisson
 from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 import numpy as np
 import pandas as pd
 from sklearn.cluster import Birch
 import cooler
 
-from ..lib.numutils import LazyToeplitz, get_kernel
+from ..lib.numutils import LazyToeplitz, get_kernel, get_mp_context
 from ..lib.checks import is_compatible_viewframe, is_cooler_balanced
-from ..lib.common import make_cooler_view
+from ..lib.common import make_cooler_view, assign_regions
+from .expected import expected_cis
 
 import bioframe
 
@@ -76,16 +83,18 @@ def recommend_kernel_params(binsize):
 
 
 def annotate_pixels_with_qvalues(
-    pixels_df, qvalues, kernels, inplace=False, obs_raw_name=observed_count_name
+    pixels_df,
+    qvalues,
+    kernels,
+    inplace=False,
+    obs_raw_name=observed_count_name,
+    ledges=None,
 ):
     """
     Add columns with the qvalues to a DataFrame of pixels
-    ... detailed but unedited notes ...
-    Extract q-values using l-chunks and IntervalIndex.
-    we'll do it in an ugly but workign fashion, by simply
-    iteration over pairs of obs, la_exp and extracting needed qvals
-    one after another
-    ...
+
+    Pixels are assigned to the lambda-chunks with np.searchsorted, and their
+    q-values are gathered from the dense arrays of q-values at once.
 
     Parameters
     ----------
@@ -93,14 +102,22 @@ def annotate_pixels_with_qvalues(
         a DataFrame with pixel coordinates that must have at least 2 columns
         named 'bin1_id' and 'bin2_id', where first is pixels's row and the
         second is pixel's column index.
-    qvalues : dict of DataFrames
-        A dictionary with keys being kernel names and values DataFrames
-        storing q-values for each observed count values in each lambda-
-        chunk. Colunms are Intervals defined by 'ledges' boundaries.
-        Rows corresponding to a range of observed count values.
+    qvalues : dict of ndarrays
+        A dictionary with keys being kernel names and values 2D arrays
+        storing q-values for each lambda-chunk (rows) and each observed
+        count value (columns), as returned by 'determine_thresholds'.
     kernels : dict
         A dictionary with keys being kernels names and values being ndarrays
         representing those kernels.
+    inplace : bool
+        Add the columns to `pixels_df` itself, instead of a copy.
+    obs_raw_name : str
+        Name of the column with the observed raw counts.
+    ledges : ndarray
+        An ndarray with bin lambda-edges for groupping loc. adj. expecteds,
+        i.e., classifying statistical hypothesis into lambda-classes.
+        Left-most bin (-inf, 1], and right-most one (value,+inf]. The same
+        as passed to 'determine_thresholds', required.
 
     Returns
     -------
@@ -115,29 +132,41 @@ def annotate_pixels_with_qvalues(
     Should be applied to a filtered DF of pixels, otherwise would
     be too resource-hungry.
     """
+    if ledges is None:
+        raise ValueError(
+            "ledges, the lambda-chunk edges passed to 'determine_thresholds',"
+            " are required to look up q-values"
+        )
     if inplace:
         pixels_qvalue_df = pixels_df
     else:
         # let's do it "safe" - using a copy:
         pixels_qvalue_df = pixels_df.copy()
-    # attempting to extract q-values using l-chunks and IntervalIndex:
-    # we'll do it in an ugly but workign fashion, by simply
-    # iteration over pairs of obs, la_exp and extracting needed qvals
-    # one after another ...
+    counts = pixels_df[obs_raw_name].values
     for k in kernels:
-        pixels_qvalue_df[f"la_exp.{k}.qval"] = [
-            qvalues[k].loc[o, e]
-            for o, e in pixels_df[[obs_raw_name, f"la_exp.{k}.value"]].itertuples(
-                index=False
-            )
-        ]
-    # qvalues : dict
-    #   A dictionary with keys being kernel names and values pandas.DataFrame-s
-    #   storing q-values: each column corresponds to a lambda-chunk,
-    #   while rows correspond to observed pixels values.
+        # pd.cut-like assignment of lambda-chunks, intervals are closed on the
+        # right, and the row 0 of q-values is the chunk (ledges[0], ledges[1]]:
+        la_exp_bin = np.searchsorted(ledges, pixels_df[f"la_exp.{k}.value"].values)
+        pixels_qvalue_df[f"la_exp.{k}.qval"] = qvalues[k][la_exp_bin - 1, counts]
     return pixels_qvalue_df
 
 
+def _radius_components(points, radius):
+    """
+    Connected components of the graph linking the points that are at most
+    `radius` apart, i.e. single-linkage clusters, found with a KD-tree.
+
+    """
+    n = len(points)
+    pairs = cKDTree(points).query_pairs(radius, output_type="ndarray")
+    graph = coo_matrix(
+        (np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])),
+        shape=(n, n),
+    )
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
 def clust_2D_pixels(
     pixels_df,
     threshold_cluster=2,
@@ -146,12 +175,15 @@ def clust_2D_pixels(
     clust_label_name="c_label",
     clust_size_name="c_size",
     verbose=True,
+    method="kdtree",
 ):
     """
-    Group significant pixels by proximity using Birch clustering. We use
-    "n_clusters=None", which implies no AgglomerativeClustering, and thus
-    simply reporting "blobs" of pixels of radii <="threshold_cluster" along
-    with corresponding blob-centroids as well.
+    Group significant pixels by proximity. By default, pixels that are at most
+    "threshold_cluster" apart are linked, and the connected components of the
+    resulting graph are reported as "blobs" of pixels along with corresponding
+    blob-centroids. With method="birch", blobs are the subclusters of radii
+    <="threshold_cluster" of Birch clustering with "n_clusters=None", which
+    implies no AgglomerativeClustering.
 
     Parameters
     ----------
@@ -160,8 +192,8 @@ def clust_2D_pixels(
         named 'bin1_id' and 'bin2_id', where first is pixels's row and the
         second is pixel's column index.
     threshold_cluster : int
-        clustering radius for Birch clustering derived from ~40kb radius of
-        clustering and bin size.
+        clustering radius derived from ~40kb radius of clustering and bin
+        size.
     bin1_id_name : str
         Name of the 1st coordinate (row index) in 'pixel_df', by default
         'bin1_id'. 'start1/end1' could be usefull as well.
@@ -174,6 +206,11 @@ def clust_2D_pixels(
         Name of the cluster of pixels size. "c_size" by default.
     verbose : bool
         Print verbose clustering summary report defaults is True.
+    method : str
+        'kdtree' - connected components of the pixels within the clustering
+        radius of each other, found with a KD-tree, which scales to large
+        numbers of pixels,
+        'birch' - Birch clustering from scikit-learn.
 
     Returns
     -------
@@ -192,35 +229,41 @@ def clust_2D_pixels(
     # and int32 is not enough for some operations, i.e., integer overflow.
     pixel_idxs = pixels_df.index
 
-    # perform BIRCH clustering of pixels:
-    # "n_clusters=None" implies using BIRCH without AgglomerativeClustering,
-    # thus simply reporting "blobs" of pixels of radius "threshold_cluster"
-    # along with blob-centroids as well:
-    brc = Birch(
-        n_clusters=None,
-        threshold=threshold_cluster,
-        # branching_factor=50, (it's default)
-        compute_labels=True,
-    )
-    brc.fit(pixels)
-    # # following is redundant,
-    # # as it's done here:
-    # # https://github.com/scikit-learn/scikit-learn/blob/a24c8b464d094d2c468a16ea9f8bf8d42d949f84/sklearn/cluster/birch.py#L638
-    # clustered_labels = brc.predict(pixels)
-
-    # labels of nearest centroid, assigned to each pixel,
-    # BEWARE: labels might not be continuous, i.e.,
-    # "np.unique(clustered_labels)" isn't same as "brc.subcluster_labels_", because:
-    # https://github.com/scikit-learn/scikit-learn/blob/a24c8b464d094d2c468a16ea9f8bf8d42d949f84/sklearn/cluster/birch.py#L576
-    clustered_labels = brc.labels_
-    # centroid coordinates ( <= len(clustered_labels)):
-    clustered_centroids = brc.subcluster_centers_
-    # count unique labels and get their continuous indices
-    uniq_labels, inverse_idx, uniq_counts = np.unique(
-        clustered_labels, return_inverse=True, return_counts=True
-    )
-    # cluster sizes taken to match labels:
-    cluster_sizes = uniq_counts[inverse_idx]
+    if method == "kdtree":
+        # continuous labels of the connected components:
+        clustered_labels = _radius_components(pixels, threshold_cluster)
+        uniq_counts = np.bincount(clustered_labels)
+        # centroids are the mean coordinates of the pixels of a cluster:
+        sums = [np.bincount(clustered_labels, weights=x) for x in pixels.T]
+        clustered_centroids = np.column_stack(sums) / uniq_counts[:, None]
+        cluster_sizes = uniq_counts[clustered_labels]
+    elif method == "birch":
+        # perform BIRCH clustering of pixels:
+        # "n_clusters=None" implies using BIRCH without AgglomerativeClustering,
+        # thus simply reporting "blobs" of pixels of radius "threshold_cluster"
+        # along with blob-centroids as well:
+        brc = Birch(
+            n_clusters=None,
+            threshold=threshold_cluster,
+            # branching_factor=50, (it's default)
+            compute_labels=True,
+        )
+        brc.fit(pixels)
+        # labels of nearest centroid, assigned to each pixel,
+        # BEWARE: labels might not be continuous, i.e.,
+        # "np.unique(clustered_labels)" isn't same as "brc.subcluster_labels_", because:
+        # https://github.com/scikit-learn/scikit-learn/blob/a24c8b464d094d2c468a16ea9f8bf8d42d949f84/sklearn/cluster/birch.py#L576
+        clustered_labels = brc.labels_
+        # centroid coordinates ( <= len(clustered_labels)):
+        clustered_centroids = brc.subcluster_centers_
+        # count unique labels and get their continuous indices
+        uniq_labels, inverse_idx, uniq_counts = np.unique(
+            clustered_labels, return_inverse=True, return_counts=True
+        )
+        # cluster sizes taken to match labels:
+        cluster_sizes = uniq_counts[inverse_idx]
+    else:
+        raise ValueError(f"Unknown clustering method: {method}")
     # take centroids corresponding to labels (as many as needed):
     centroids_per_pixel = np.take(clustered_centroids, clustered_labels, axis=0)
 
@@ -361,12 +404,99 @@ def square_matrix_tiling(start, stop, step, edge, square=False, verbose=False):
             yield (lwx + start, rwx + start), (lwy + start, rwy + start)
 
 
-def heatmap_tiles_generator_diag(clr, view_df, pad_size, tile_size, band_to_cover):
+def adaptive_matrix_tiling(start, stop, step, edge, band=None, valid=None):
+    """
+    Generate a stream of tiling coordinates that guarantee to cover the upper
+    diagonal band of a matrix, with tiles that are smaller near the diagonal,
+    larger further from it and in sparse areas. cis-signal only!
+
+    The matrix is split into segments with ``min(step, band)`` valid bins each,
+    but at most ``step`` bins long, so that masked stretches are absorbed into
+    the neighbouring segments. Every row of segments is covered by a square
+    tile on the diagonal, followed by tiles merging 1, 2, 4, ... segments of
+    columns away from the diagonal, as long as their area does not exceed
+    ``step**2``. Hence, the tiles on the diagonal shrink to the width of a
+    narrow band, which they would otherwise mostly waste.
+
+    Parameters
+    ----------
+    start : int
+        Starting position of the matrix slice to be tiled (inclusive, bins,
+        0-based).
+    stop : int
+        End position of the matrix slice to be tiled (exclusive, bins, 0-based).
+    step : int
+        Nominal size of the tiles.
+    edge : int
+        Small edge around each tile to be included in the yielded coordinates.
+    band : int, optional
+        Size of the diagonal band to be covered. The whole upper triangle is
+        covered by default.
+    valid : numpy.ndarray, optional
+        Boolean mask of the bins of the matrix slice to be scored, i.e. with
+        finite balancing weights. All bins are valid by default.
+
+    Yields
+    ------
+    Pairs of indices for every tile, use those indices [cstart:cstop) to fetch
+    tiles from the cooler-object, just like for `square_matrix_tiling`.
+    Tiles are non-overlapping, except for their edges.
+
+    """
+    size = stop - start
+    if valid is None:
+        valid = np.ones(size, dtype=bool)
+    if band is None:
+        band = size
+    n_valid = np.r_[0, np.cumsum(valid)]
+
+    # segments with min(step, band) valid bins, but not longer than step
+    seg_valid = max(min(step, band), 2 * edge, 1)
+    bounds = [0]
+    while bounds[-1] < size:
+        lo = bounds[-1]
+        hi = np.searchsorted(n_valid, n_valid[lo] + seg_valid)
+        bounds.append(int(min(max(hi, lo + 1), lo + step, size)))
+    n_segments = len(bounds) - 1
+
+    for k in range(n_segments):
+        r0, r1 = bounds[k], bounds[k + 1]
+        max_width = max(step * step // (r1 - r0), r1 - r0)
+        l = k
+        # stop once the tiles do not reach into the band anymore
+        while l < n_segments and bounds[l] - (r1 - 1) < band:
+            m = l + 1
+            while (
+                m < min(l + max(l - k, 1), n_segments)
+                and bounds[m + 1] - bounds[l] <= max_width
+            ):
+                m += 1
+            c0, c1 = bounds[l], bounds[m]
+            yield (
+                (max(0, r0 - edge) + start, min(size, r1 + edge) + start),
+                (max(0, c0 - edge) + start, min(size, c1 + edge) + start),
+            )
+            l = m
+
+
+def heatmap_tiles_generator_diag(
+    clr,
+    view_df,
+    pad_size,
+    tile_size,
+    band_to_cover,
+    clr_weight_name="weight",
+    adaptive=False,
+):
     """
     A generator yielding heatmap tiles that are needed to cover the requested
     band_to_cover around diagonal. Each tile is "padded" with pad_size edge to
     allow proper kernel-convolution of pixels close to boundary.
 
+    Tiles without valid (i.e. with finite balancing weight) rows or columns,
+    and tiles without any pixels, e.g. over gaps in the assembly, are skipped
+    as no pixel of theirs can be scored.
+
     Parameters
     ----------
     clr : cooler
@@ -381,6 +511,14 @@ def heatmap_tiles_generator_diag(clr, view_df, pad_size, tile_size, band_to_cove
     band_to_cover : int
         Size of the diagonal band to be covered by the generated tiles.
         Typically correspond to the max_loci_separation for called dots.
+    clr_weight_name : str or None
+        Name of the column with balancing weights in clr.bins(), used to skip
+        tiles without valid bins. None to only skip tiles without pixels.
+    adaptive : bool
+        If True, use `adaptive_matrix_tiling` with tiles that are smaller near
+        the diagonal and larger away from it and over masked bins, instead of
+        the square tiles of `square_matrix_tiling`.
+
     Returns
     -------
     tile : tuple
@@ -389,12 +527,27 @@ def heatmap_tiles_generator_diag(clr, view_df, pad_size, tile_size, band_to_cove
         column index of the tile (region_name, tilei, tilej).
 
     """
+    # number of pixels in every row of the upper triangle:
+    bin1_offset = clr._load_dset("indexes/bin1_offset")
 
     for chrom, start, end, region_name in view_df.itertuples(index=False):
         region_begin, region_end = clr.extent((chrom, start, end))
-        for tilei, tilej in square_matrix_tiling(
-            region_begin, region_end, tile_size, pad_size
-        ):
+        # cumulative numbers of valid bins and of pixels to check the tiles
+        if clr_weight_name is None:
+            valid = np.ones(region_end - region_begin, dtype=bool)
+        else:
+            weights = clr.bins()[region_begin:region_end][clr_weight_name].values
+            valid = np.isfinite(weights)
+        n_valid = np.r_[0, np.cumsum(valid)]
+        n_pixels = bin1_offset[region_begin : region_end + 1]
+
+        if adaptive:
+            tiling = adaptive_matrix_tiling(
+                region_begin, region_end, tile_size, pad_size, band_to_cover, valid
+            )
+        else:
+            tiling = square_matrix_tiling(region_begin, region_end, tile_size, pad_size)
+        for tilei, tilej in tiling:
             # check if a given tile intersects with
             # with the diagonal band of interest ...
             diag_from = tilej[0] - tilei[1]
@@ -404,13 +557,123 @@ def heatmap_tiles_generator_diag(clr, view_df, pad_size, tile_size, band_to_cove
             band_to = band_to_cover
             # we are using this >2*padding trick to exclude
             # tiles from the lower triangle from calculations ...
-            if (min(band_to, diag_to) - max(band_from, diag_from)) > 2 * pad_size:
-                yield region_name, tilei, tilej
+            if (min(band_to, diag_to) - max(band_from, diag_from)) <= 2 * pad_size:
+                continue
+            # scored pixels need valid rows and columns:
+            i0, i1 = tilei[0] - region_begin, tilei[1] - region_begin
+            j0, j1 = tilej[0] - region_begin, tilej[1] - region_begin
+            if n_valid[i1] == n_valid[i0] or n_valid[j1] == n_valid[j0]:
+                continue
+            # pixels of the tile are stored in the rows of either span:
+            if n_pixels[i1] == n_pixels[i0] and n_pixels[j1] == n_pixels[j0]:
+                continue
+            yield region_name, tilei, tilej
 
 
 ##################################
 # kernel-convolution related:
 ##################################
+def _tile_band_area(tile, band_to_cover):
+    """
+    Number of pixels of a tile within 'band_to_cover' diagonals.
+    """
+    _, (i0, i1), (j0, j1) = tile
+    rows = np.arange(i0, i1)
+    row_areas = np.minimum(j1, rows + band_to_cover) - np.maximum(j0, rows)
+    return np.clip(row_areas, 0, None).sum()
+
+
+def estimate_tile_costs(clr, tiles, band_to_cover):
+    """
+    Estimate relative costs of scoring tiles of a Hi-C heatmap: the number of
+    pixels stored in the rows of a tile, that are read from the cooler, plus
+    the number of pixels of a tile within 'band_to_cover' diagonals, that are
+    convolved and scored.
+
+    Parameters
+    ----------
+    clr : cooler.Cooler
+        Cooler object the tiles are generated for.
+    tiles : list
+        Tiles, as generated by 'heatmap_tiles_generator_diag'.
+    band_to_cover : int
+        Number of diagonals pixels are scored within.
+
+    Returns
+    -------
+    costs : ndarray
+        Estimated cost of every tile, in the units of pixels.
+
+    """
+    bin1_offset = clr._load_dset("indexes/bin1_offset")
+    return np.array(
+        [
+            bin1_offset[tile[1][1]]
+            - bin1_offset[tile[1][0]]
+            + _tile_band_area(tile, band_to_cover)
+            for tile in tiles
+        ],
+        dtype=np.int64,
+    )
+
+
+def _footprint_rectangles(kernel):
+    """
+    Decompose the nonzero footprint of a kernel, as it is applied by
+    `convolve`, i.e. flipped, into rectangles (row_start, row_end, col_start,
+    col_end) relative to the center of the kernel, with the ends excluded.
+    Runs of nonzero elements are merged across consecutive rows with the
+    same runs.
+
+    """
+    footprint = np.asarray(kernel)[::-1, ::-1] != 0
+    # centers of the flipped kernel, as used by `convolve`:
+    ci, cj = (footprint.shape[0] - 1) // 2, (footprint.shape[1] - 1) // 2
+    rectangles = []
+    open_runs = {}
+    for i, row in enumerate(np.vstack([footprint, np.zeros_like(footprint[:1])])):
+        edges = np.flatnonzero(np.diff(np.r_[0, row.astype(np.int8), 0]))
+        runs = set(zip(edges[::2], edges[1::2]))
+        for j0, j1 in set(open_runs) - runs:
+            i0 = open_runs.pop((j0, j1))
+            rectangles.append((i0 - ci, i - ci, j0 - cj, j1 - cj))
+        for run in runs - set(open_runs):
+            open_runs[run] = i
+    return sorted(rectangles)
+
+
+def _nans_integral_image(N, pad):
+    """
+    Summed-area table of a boolean matrix of NaNs, padded with `pad` NaNs on
+    every side, and with a leading row and column of zeros, i.e.
+    S[i, j] = N_padded[:i, :j].sum().
+
+    """
+    n, m = N.shape
+    dtype = np.int32 if (n + 2 * pad + 1) * (m + 2 * pad + 1) < 2 ** 31 else np.int64
+    S = np.zeros((n + 2 * pad + 1, m + 2 * pad + 1), dtype=dtype)
+    S[1:, 1:] = 1
+    S[pad + 1 : pad + n + 1, pad + 1 : pad + m + 1] = N
+    S.cumsum(axis=0, out=S)
+    S.cumsum(axis=1, out=S)
+    return S
+
+
+def _count_nans_in_footprint(S, pad, rectangles, ii, jj):
+    """
+    Number of NaNs in the kernel footprint, decomposed into `rectangles`
+    (see `_footprint_rectangles`), around pixels (ii, jj), queried from
+    the summed-area table `S` (see `_nans_integral_image`).
+
+    """
+    nnans = np.zeros(np.broadcast(ii, jj).shape, dtype=np.int64)
+    for i0, i1, j0, j1 in rectangles:
+        r0, r1 = ii + (i0 + pad), ii + (i1 + pad)
+        c0, c1 = jj + (j0 + pad), jj + (j1 + pad)
+        nnans += S[r1, c1] - S[r0, c1] - S[r1, c0] + S[r0, c0]
+    return nnans
+
+
 def _convolve_and_count_nans(O_bal, E_bal, E_raw, N_bal, kernel):
     """
     Dense versions of a bunch of matrices needed for convolution and
@@ -429,23 +692,20 @@ def _convolve_and_count_nans(O_bal, E_bal, E_raw, N_bal, kernel):
     # based on the NaN-matrix N_bal.
     # N_bal is shared NaNs between O_bal E_bal,
     # is it redundant ?
-    NN = convolve(
-        N_bal.astype(np.int64),
-        # we have to use kernel's
-        # nonzero footprint:
-        (kernel != 0).astype(np.int64),
-        mode="constant",
-        # there are only NaNs
-        # beyond the boundary:
-        cval=1,
-        origin=0,
-    )
     ######################################
     # using cval=0 for actual data and
-    # cval=1 for NaNs matrix reduces
+    # NaNs beyond the boundary reduces
     # "boundary issue" to the "number of
     # NaNs"-issue
     # ####################################
+    pad = max(kernel.shape)
+    NN = _count_nans_in_footprint(
+        _nans_integral_image(N_bal, pad),
+        pad,
+        _footprint_rectangles(kernel),
+        np.arange(N_bal.shape[0])[:, None],
+        np.arange(N_bal.shape[1])[None, :],
+    )
 
     # now finally, E_raw*(KO/KE), as the
     # locally-adjusted expected with raw counts as values:
@@ -455,11 +715,154 @@ def _convolve_and_count_nans(O_bal, E_bal, E_raw, N_bal, kernel):
     return Ek_raw, NN
 
 
+def _band_pixels(origin, shape, band_to_cover=None):
+    """
+    Row and column indices of the pixels of a tile that lie strictly above the
+    main diagonal and, optionally, closer than `band_to_cover` to it, in the
+    row-major order. Only the selected pixels are enumerated.
+
+    """
+    io, jo = origin
+    n_i, n_j = shape
+    rows = np.arange(n_i)
+    # global diagonal offset j - i of each pixel must be in [1, band_to_cover)
+    lo = np.clip(rows + io + 1 - jo, 0, n_j)
+    if band_to_cover is None:
+        hi = np.full(n_i, n_j)
+    else:
+        hi = np.clip(rows + io + int(band_to_cover) - jo, 0, n_j)
+    counts = np.maximum(hi - lo, 0)
+    ii = np.repeat(rows, counts)
+    offsets = np.cumsum(counts) - counts
+    jj = lo[ii] + np.arange(len(ii)) - offsets[ii]
+    return ii, jj
+
+
+def _adjusted_expected_tile_arrays(
+    origin,
+    observed,
+    expected,
+    bal_weights,
+    kernels,
+    band_to_cover=None,
+    nans_tolerated=None,
+    balance_factor=None,
+    verbose=False,
+    dtype=np.float64,
+):
+    """
+    Locally adjusted expected for the pixels of a tile, as a dict of 1D arrays.
+
+    The convolutions are dense, but everything else is computed only for the
+    pixels of the upper triangle inside the `band_to_cover`, and the pixels
+    with non-finite locally adjusted expected or with `nans_tolerated` or more
+    NaNs in the footprint of any kernel are dropped kernel by kernel. See
+    `get_adjusted_expected_tile_some_nans` for the parameters and columns.
+
+    The dense matrices and convolutions are of the float `dtype`.
+
+    """
+    # extract origin coordinate of this tile:
+    io, jo = origin
+    # 'bal_weights': ndarray or a couple of those ...
+    if isinstance(bal_weights, np.ndarray):
+        v_bal_i = bal_weights
+        v_bal_j = bal_weights
+    elif isinstance(bal_weights, (tuple, list)):
+        v_bal_i, v_bal_j = bal_weights
+    else:
+        raise ValueError(
+            "'bal_weights' must be an numpy.ndarray"
+            "for slices of a matrix with diagonal-origin or"
+            "a tuple/list of a couple of numpy.ndarray-s"
+            "for a slice of matrix with an arbitrary origin."
+        )
+    # kernels must be a dict with kernel-names as keys
+    # and kernel ndarrays as values.
+    if not isinstance(kernels, dict):
+        raise ValueError(
+            "'kernels' must be a dictionary" "with name-keys and ndarrays-values."
+        )
+
+    # balanced observed and expected, with the lower triangle filled with NaNs
+    # in order to prevent peak calling from the lower triangle and also to
+    # provide fair locally adjusted expected estimation for pixels very close
+    # to diagonal, whose "donuts"(kernels) would be crossing the main diagonal.
+    v_bal_ij = np.outer(v_bal_i.astype(dtype), v_bal_j.astype(dtype))
+    lower = np.tril_indices_from(v_bal_ij, k=(io - jo) - 1)
+    O_bal = np.multiply(observed, v_bal_ij, dtype=dtype)
+    E_bal = np.array(expected, dtype=dtype)
+    O_bal[lower] = np.nan
+    E_bal[lower] = np.nan
+    # raw E_bal: element-wise division of E_bal[i,j] and v_bal[i]*v_bal[j]:
+    E_raw = np.divide(E_bal, v_bal_ij)
+    del v_bal_ij
+
+    # common NaNs shared between observed and expected, filled in with zeroes
+    # to prevent NaNs during convolution:
+    N_bal = np.logical_or(np.isnan(O_bal), np.isnan(E_bal))
+    O_bal[N_bal] = 0.0
+    E_bal[N_bal] = 0.0
+    # NaNs in the footprints of all kernels are counted using a single
+    # summed-area table of NaNs, with only NaNs beyond the boundary:
+    pad = max(max(kernel.shape) for kernel in kernels.values())
+    S_nans = _nans_integral_image(N_bal, pad)
+    del N_bal
+
+    # only the candidate pixels are ever gathered from the dense matrices:
+    ii, jj = _band_pixels(origin, observed.shape, band_to_cover)
+    kernel_columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for kernel_name, kernel in kernels.items():
+            # kernel-weighted sums of the balanced observed and expected:
+            KO = convolve(O_bal, kernel, mode="constant", cval=0.0, origin=0)
+            KE = convolve(E_bal, kernel, mode="constant", cval=0.0, origin=0)
+            # E_raw*(KO/KE), the locally-adjusted expected in raw counts:
+            Ek_raw = E_raw[ii, jj] * (KO[ii, jj] / KE[ii, jj])
+            # number of NaNs in the kernel's nonzero footprint:
+            nnans = _count_nans_in_footprint(
+                S_nans, pad, _footprint_rectangles(kernel), ii, jj
+            )
+            if verbose:
+                logging.info(f"Convolution with kernel {kernel_name} is complete.")
+
+            # a pixel is dropped as soon as it fails for one of the kernels:
+            keep = np.isfinite(Ek_raw)
+            if nans_tolerated is not None:
+                keep &= nnans < nans_tolerated
+            ii, jj = ii[keep], jj[keep]
+            for name in kernel_columns:
+                kernel_columns[name] = kernel_columns[name][keep]
+
+            # KO*balance_factor: to be compared with 16 ...
+            if balance_factor and (kernel_name == "lowleft"):
+                kernel_columns[f"factor_balance.{kernel_name}.KerObs"] = (
+                    balance_factor * KO[ii, jj]
+                )
+            kernel_columns[adjusted_exp_name(kernel_name)] = Ek_raw[keep]
+            kernel_columns[nans_inkernel_name(kernel_name)] = nnans[keep]
+
+    return {
+        bin1_id_name: ii + io,
+        bin2_id_name: jj + jo,
+        **kernel_columns,
+        expected_count_name: E_raw[ii, jj],
+        observed_count_name: observed[ii, jj],
+    }
+
+
 ########################################################################
 # this is the MAIN function to get locally adjusted expected
 ########################################################################
 def get_adjusted_expected_tile_some_nans(
-    origin, observed, expected, bal_weights, kernels, balance_factor=None, verbose=False
+    origin,
+    observed,
+    expected,
+    bal_weights,
+    kernels,
+    balance_factor=None,
+    verbose=False,
+    dtype=np.float64,
 ):
     """
     Get locally adjusted expected for a collection of local-filters (kernels).
@@ -554,6 +957,10 @@ def get_adjusted_expected_tile_some_nans(
     verbose: bool
         Set to True to print some progress
         messages to stdout.
+    dtype: numpy.dtype
+        Float type of the dense matrices and
+        convolutions, e.g. np.float32 to halve
+        the memory footprint of a tile.
 
     Returns
     -------
@@ -572,168 +979,18 @@ def get_adjusted_expected_tile_some_nans(
         obs.raw - observed values in raw-counts.
 
     """
-    # extract origin coordinate of this tile:
-    io, jo = origin
-    # let's extract full matrices and ice_vector:
-    O_raw = observed  # raw observed, no need to copy, no modifications.
-    E_bal = np.copy(expected)
-    # 'bal_weights': ndarray or a couple of those ...
-    if isinstance(bal_weights, np.ndarray):
-        v_bal_i = bal_weights
-        v_bal_j = bal_weights
-    elif isinstance(bal_weights, (tuple, list)):
-        v_bal_i, v_bal_j = bal_weights
-    else:
-        raise ValueError(
-            "'bal_weights' must be an numpy.ndarray"
-            "for slices of a matrix with diagonal-origin or"
-            "a tuple/list of a couple of numpy.ndarray-s"
-            "for a slice of matrix with an arbitrary origin."
-        )
-    # kernels must be a dict with kernel-names as keys
-    # and kernel ndarrays as values.
-    if not isinstance(kernels, dict):
-        raise ValueError(
-            "'kernels' must be a dictionary" "with name-keys and ndarrays-values."
-        )
-
-    # balanced observed, from raw-observed
-    # by element-wise multiply:
-    O_bal = np.multiply(O_raw, np.outer(v_bal_i, v_bal_j))
-    # O_bal is separate from O_raw memory-wise.
-
-    # fill lower triangle of O_bal and E_bal with NaNs
-    # in order to prevent peak calling from the lower triangle
-    # and also to provide fair locally adjusted expected
-    # estimation for pixels very close to diagonal, whose
-    # "donuts"(kernels) would be crossing the main diagonal.
-    # The trickiest thing here would be dealing with the origin: io,jo.
-    O_bal[np.tril_indices_from(O_bal, k=(io - jo) - 1)] = np.nan
-    E_bal[np.tril_indices_from(E_bal, k=(io - jo) - 1)] = np.nan
-
-    # raw E_bal: element-wise division of E_bal[i,j] and
-    # v_bal[i]*v_bal[j]:
-    E_raw = np.divide(E_bal, np.outer(v_bal_i, v_bal_j))
-
-    # let's calculate a matrix of common NaNs
-    # shared between observed and expected:
-    # check if it's redundant ? (is NaNs from O_bal sufficient? )
-    N_bal = np.logical_or(np.isnan(O_bal), np.isnan(E_bal))
-    # fill in common nan-s with zeroes, preventing
-    # NaNs during convolution part of '_convolve_and_count_nans':
-    O_bal[N_bal] = 0.0
-    E_bal[N_bal] = 0.0
-    # think about usinf copyto and where functions later:
-    # https://stackoverflow.com/questions/6431973/how-to-copy-data-from-a-numpy-array-to-another
-    #
-    #
-    # we are going to accumulate all the results
-    # into a DataFrame, keeping NaNs, and other
-    # unfiltered results (even the lower triangle for now):
-    i, j = np.indices(O_raw.shape)
-    # pack it into DataFrame to accumulate results:
-    peaks_df = pd.DataFrame({"bin1_id": i.flatten() + io, "bin2_id": j.flatten() + jo})
-
-    with np.errstate(divide="ignore", invalid="ignore"):
-        for kernel_name, kernel in kernels.items():
-            ###############################
-            # kernel-specific calculations:
-            ###############################
-            # kernel paramters such as width etc
-            # are taken into account implicitly ...
-            ########################################
-            #####################
-            # unroll _convolve_and_count_nans function back
-            # for us to test the dynamic donut criteria ...
-            #####################
-            # Ek_raw, NN = _convolve_and_count_nans(O_bal,
-            #                                     E_bal,
-            #                                     E_raw,
-            #                                     N_bal,
-            #                                     kernel)
-            # Dense versions of a bunch of matrices needed for convolution and
-            # calculation of number of NaNs in a vicinity of each pixel. And a kernel to
-            # be provided of course.
-            # a matrix filled with the kernel-weighted sums
-            # based on a balanced observed matrix:
-            KO = convolve(O_bal, kernel, mode="constant", cval=0.0, origin=0)
-            # a matrix filled with the kernel-weighted sums
-            # based on a balanced expected matrix:
-            KE = convolve(E_bal, kernel, mode="constant", cval=0.0, origin=0)
-            # get number of NaNs in a vicinity of every
-            # pixel (kernel's nonzero footprint)
-            # based on the NaN-matrix N_bal.
-            # N_bal is shared NaNs between O_bal E_bal,
-            NN = convolve(
-                N_bal.astype(np.int64),
-                # we have to use kernel's
-                # nonzero footprint:
-                (kernel != 0).astype(np.int64),
-                mode="constant",
-                # there are only NaNs
-                # beyond the boundary:
-                cval=1,
-                origin=0,
-            )
-            ######################################
-            # using cval=0 for actual data and
-            # cval=1 for NaNs matrix reduces
-            # "boundary issue" to the "number of
-            # NaNs"-issue
-            # ####################################
-            # now finally, E_raw*(KO/KE), as the
-            # locally-adjusted expected with raw counts as values:
-            Ek_raw = np.multiply(E_raw, np.divide(KO, KE))
-
-            # this is the place where we would need to extract
-            # some results of convolution and multuplt it by the
-            # appropriate factor "cooler._load_attrs(‘bins/weight’)[‘scale’]" ...
-            if balance_factor and (kernel_name == "lowleft"):
-                peaks_df[f"factor_balance.{kernel_name}.KerObs"] = (
-                    balance_factor * KO.flatten()
-                )
-                # KO*balance_factor: to be compared with 16 ...
-            if verbose:
-                logging.info(f"Convolution with kernel {kernel_name} is complete.")
-            #
-            # accumulation into single DataFrame:
-            # store locally adjusted expected for each kernel
-            # and number of NaNs in the footprint of each kernel
-            peaks_df[f"la_exp.{kernel_name}.value"] = Ek_raw.flatten()
-            peaks_df[f"la_exp.{kernel_name}.nnans"] = NN.flatten()
-            # do all the filter/logic/masking etc on the complete DataFrame ...
-    #####################################
-    # downstream stuff is supposed to be
-    # aggregated over all kernels ...
-    #####################################
-    peaks_df["exp.raw"] = E_raw.flatten()
-    # obs.raw -> count
-    peaks_df["count"] = O_raw.flatten()
-
-    # TO BE REFACTORED/deprecated ...
-    # compatibility with legacy API is completely BROKEN
-    # post-processing allows us to restore it, see tests,
-    # but we pay with the processing speed for it.
-    mask_ndx = pd.Series(0, index=peaks_df.index, dtype=np.bool)
-    for kernel_name, kernel in kernels.items():
-        # accummulating with a vector full of 'False':
-        mask_ndx_kernel = ~np.isfinite(peaks_df["la_exp." + kernel_name + ".value"])
-        mask_ndx = np.logical_or(mask_ndx_kernel, mask_ndx)
-
-    # returning only pixels from upper triangle of a matrix
-    # is likely here to stay:
-    upper_band = peaks_df["bin1_id"] < peaks_df["bin2_id"]
-    # Consider filling lower triangle of the OBSERVED matrix tile
-    # with NaNs, instead of this - we'd need this for a fair
-    # consideration of the pixels that are super close to the
-    # diagonal and in a case, when the corresponding donut would
-    # cross a diagonal line.
-    # selecting pixels in relation to diagonal - too far, too
-    # close etc, is now shifted to the outside of this function
-    # a way to simplify code.
-
+    columns = _adjusted_expected_tile_arrays(
+        origin,
+        observed,
+        expected,
+        bal_weights,
+        kernels,
+        balance_factor=balance_factor,
+        verbose=verbose,
+        dtype=dtype,
+    )
     # return good semi-sparsified DF:
-    return peaks_df[~mask_ndx & upper_band].reset_index(drop=True)
+    return pd.DataFrame(columns)
 
 
 ##################################
@@ -752,6 +1009,7 @@ def score_tile(
     band_to_cover,
     balance_factor,
     verbose,
+    dtype=np.float64,
 ):
     """
     The main working function that given a tile of a heatmap, applies kernels to
@@ -788,14 +1046,16 @@ def score_tile(
         use None value to disable dynamic-donut criteria calculation.
     verbose : bool
         Enable verbose output.
+    dtype : numpy.dtype
+        Float type of the dense matrices and convolutions of the tile,
+        np.float32 halves their memory footprint.
 
     Returns
     -------
     res_df : pandas.DataFrame
-        results: annotated pixels with calculated locally adjusted expected
-        for every kernels, observed, precalculated pvalues, number of NaNs in
-        footprint of every kernels, all of that in a form of an annotated
-        pixels DataFrame for eligible pixels of a given tile.
+        results: eligible pixels of a given tile with their bin ids (int32),
+        raw observed counts and calculated locally adjusted expected for
+        every kernel (float32).
 
     """
     # unpack tile's coordinates
@@ -805,69 +1065,46 @@ def score_tile(
     # we have to do it for every tile, because
     # region_name is not known apriori (maybe move outside)
     # use .loc[region, region] for symmetric cis regions to conform with expected v1.0
-    lazy_exp = LazyToeplitz(cis_exp.loc[region_name, region_name][exp_v_name].values)
+    lazy_exp = LazyToeplitz(
+        cis_exp.loc[region_name, region_name][exp_v_name].values.astype(dtype)
+    )
 
     # RAW observed matrix slice:
     observed = clr.matrix(balance=False)[slice(*tilei), slice(*tilej)]
     # expected as a rectangular tile :
-    expected = lazy_exp[slice(*tilei), slice(*tilej)]
+    expected = lazy_exp.view(tilei, tilej)
     # slice of balance_weight for row-span and column-span :
     bal_weight_i = clr.bins()[slice(*tilei)][clr_weight_name].values
     bal_weight_j = clr.bins()[slice(*tilej)][clr_weight_name].values
 
-    # do the convolutions
-    result = get_adjusted_expected_tile_some_nans(
+    # do the convolutions, keeping only pixels inside the band that pass the
+    # number of NaNs compliance test for ALL kernels:
+    result = _adjusted_expected_tile_arrays(
         origin=origin,
         observed=observed,
         expected=expected,
         bal_weights=(bal_weight_i, bal_weight_j),
         kernels=kernels,
+        band_to_cover=band_to_cover,
+        nans_tolerated=nans_tolerated,
         balance_factor=balance_factor,
         verbose=verbose,
+        dtype=dtype,
     )
 
-    # Post-processing filters
-    # (1) exclude pixels that connect loci further than 'band_to_cover' apart:
-    is_inside_band = result["bin1_id"] > (result["bin2_id"] - band_to_cover)
-
-    # (2) identify pixels that pass number of NaNs compliance test for ALL kernels:
-    does_comply_nans = np.all(
-        result[[f"la_exp.{k}.nnans" for k in kernels]] < nans_tolerated, axis=1
+    # return only bin_ids, observed-raw (count) and a bunch of locally adjusted
+    # expected estimates - 1 per kernel - that's the bare minimum, in compact
+    # dtypes to keep the per-tile results cheap to send back from the workers:
+    res_df = pd.DataFrame(
+        {
+            bin1_id_name: result[bin1_id_name].astype(np.int32),
+            bin2_id_name: result[bin2_id_name].astype(np.int32),
+            observed_count_name: result[observed_count_name],
+        }
     )
-    # so, selecting inside band and nNaNs compliant results:
-    # ( drop dropping index maybe ??? ) ...
-    res_df = result[is_inside_band & does_comply_nans].reset_index(drop=True)
-    # #######################################################################
-    # # the following should be rewritten such that we return
-    # # opnly bare minimum number of columns per chunk - i.e. annotating is too heavy
-    # # to be performed here ...
-    # #
-    # # I'll do it here - switch off annotation, it'll break "extraction" and other
-    # # downstream stuff - but we'll fix it afterwards ...
-    # #
-    # ########################################################################
-    # ########################################################################
-    # # consider retiring Poisson testing from here, in case we
-    # # stick with l-chunking or opposite - add histogramming business here(!)
-    # ########################################################################
-    # # do Poisson tests:
-    # get_pval = lambda la_exp : 1.0 - poisson.cdf(res_df["obs.raw"], la_exp)
-    # for k in kernels:
-    #     res_df["la_exp."+k+".pval"] = get_pval( res_df["la_exp."+k+".value"] )
-    # # annotate and return
-    # return cooler.annotate(res_df.reset_index(drop=True), clr.bins()[:])
-    #
-    # so return only bin_ids , observed-raw (rename to counts, by Nezar's suggestion)
-    # and a bunch of locally adjusted expected estimates - 1 per kernel -
-    # that's the bare minimum ...
-    #
-    # per Nezar's suggestion
-    # rename obs.raw -> count
-    # this would break A LOT of downstream stuff - but let it be ...
-    #
-    return res_df[
-        ["bin1_id", "bin2_id", "count"] + [f"la_exp.{k}.value" for k in kernels]
-    ].astype(dtype={f"la_exp.{k}.value": "float64" for k in kernels})
+    for k in kernels:
+        res_df[adjusted_exp_name(k)] = result[adjusted_exp_name(k)].astype(np.float32)
+    return res_df
 
 
 def histogram_scored_pixels(
@@ -987,9 +1224,9 @@ def determine_thresholds(kernels, ledges, gw_hist, fdr):
       (IntervalIndex) and it is all we need to extract "good" pixels from
       each chunk ...
     qvalues : dict
-      A dictionary with keys being kernel names and values pandas.DataFrames
-      storing q-values: each column corresponds to a lambda-chunk,
-      while rows correspond to observed pixels values.
+      A dictionary with keys being kernel names and values 2D ndarrays
+      storing q-values: each row corresponds to a lambda-chunk,
+      while columns correspond to observed pixels values.
 
 
     """
@@ -1027,7 +1264,9 @@ def determine_thresholds(kernels, ledges, gw_hist, fdr):
         # q-values
         # bear in mind some issues with lots of NaNs and Infs after
         # such a brave operation ...
-        qvalues[k] = rcs_Poisson[k] / rcs_hist[k]
+        # stored densely as lambda-chunks x observed counts, to be gathered
+        # by the annotate_pixels_with_qvalues:
+        qvalues[k] = np.ascontiguousarray((rcs_Poisson[k] / rcs_hist[k]).values.T)
 
     return threshold_df, qvalues
 
@@ -1096,6 +1335,55 @@ def extract_scored_pixels(
     return scored_df[comply_fdr_list]
 
 
+def extract_candidate_pixels(
+    scored_df, kernels, ledges, fdr, obs_raw_name=observed_count_name
+):
+    """
+    Extract a superset of the pixels that can comply with the FDR thresholds,
+    before the thresholds themselves are known.
+
+    A threshold of a lambda-chunk with the upper boundary mu is a count value
+    T, at which the fraction of pixels with at least T counts exceeds
+    poisson.sf(T-1, mu)/fdr. That fraction cannot exceed 1, so T is always
+    larger than poisson.isf(fdr, mu), and pixels with counts not exceeding
+    that bound for any of the kernels can never be extracted.
+
+    Parameters
+    ----------
+    scored_df : pd.DataFrame
+        A table with the scoring information for a group of pixels.
+    kernels : dict
+        A dictionary with keys being kernel names and values being ndarrays
+        representing those kernels.
+    ledges : ndarray
+        An ndarray with bin lambda-edges for groupping loc. adj. expecteds,
+        i.e., classifying statistical hypothesis into lambda-classes.
+        Left-most bin (-inf, 1], and right-most one (value,+inf].
+    fdr : float
+        False discovery rate that is going to be used to determine the
+        thresholds.
+    obs_raw_name : str
+        Name of the column/field that carry number of counts per pixel,
+        i.e. observed raw counts.
+
+    Returns
+    -------
+    scored_df_slice : pandas.DataFrame
+        Filtered DataFrame of candidate pixels.
+
+    """
+    # lower bounds of the thresholds for every lambda-chunk (ledges[i-1],
+    # ledges[i]], keeping everything when the bound is undefined:
+    bounds = np.nan_to_num(poisson.isf(fdr, ledges), nan=-1.0)
+    counts = scored_df[obs_raw_name].values
+    is_candidate = np.ones(len(scored_df), dtype=bool)
+    for k in kernels:
+        # pd.cut-like assignment of lambda-chunks, intervals are closed on the right:
+        la_exp_bin = np.searchsorted(ledges, scored_df[f"la_exp.{k}.value"].values)
+        is_candidate &= counts > bounds[la_exp_bin]
+    return scored_df[is_candidate]
+
+
 ##################################
 # large CLI-helper functions wrapping smaller step-specific ones:
 # basically - the dot-calling steps - ONE PASS DOT-CALLING:
@@ -1114,12 +1402,18 @@ def scoring_step(
     output_path,
     nproc,
     verbose,
+    dtype=np.float64,
 ):
     """
     Calculates locally adjusted expected
     for each pixel in a designated area of
     the heatmap and return it as a big
     single pixel-table (pandas.DataFrame)
+
+    Tiles are scored in a pool of 'nproc' workers, see '_map_tiles', and the
+    pixels are returned in the order of 'tiles'.
+
+    Tiles are convolved as matrices of 'dtype', see 'score_tile'.
     """
     if verbose:
         logging.info(f"Preparing to convolve {len(tiles)} tiles:")
@@ -1145,33 +1439,21 @@ def scoring_step(
         band_to_cover=loci_separation_bins,
         balance_factor=None,
         verbose=very_verbose,
+        dtype=dtype,
     )
 
-    if nproc > 1:
-        pool = mp.Pool(nproc)
-        map_ = pool.imap
-        map_kwargs = dict(chunksize=int(np.ceil(len(tiles) / nproc)))
-        if verbose:
-            logging.info(
-                f"creating a Pool of {nproc} workers to tackle {len(tiles)} tiles"
-            )
-    else:
-        map_ = map
-        if verbose:
-            logging.info("fallback to serial implementation.")
-        map_kwargs = {}
-    try:
-        # do the work here
-        chunks = map_(job, tiles, **map_kwargs)
-        # ###########################################
-        # # local - in memory copy of the dataframe (danger of RAM overuse)
-        # ###########################################
-        # reset index is required, otherwise there will be duplicate
-        # indices in the output of this function
-        return pd.concat(chunks).reset_index(drop=True)
-    finally:
-        if nproc > 1:
-            pool.close()
+    # do the work here
+    costs = estimate_tile_costs(clr, tiles, loci_separation_bins)
+    chunks = list(_map_tiles(job, tiles, nproc, verbose, costs=costs))
+    # the costliest tiles are scored first, restore the order of tiles:
+    order = np.argsort(-np.asarray(costs), kind="stable")
+    chunks = [chunks[i] for i in np.argsort(order)]
+    # ###########################################
+    # # local - in memory copy of the dataframe (danger of RAM overuse)
+    # ###########################################
+    # reset index is required, otherwise there will be duplicate
+    # indices in the output of this function
+    return pd.concat(chunks).reset_index(drop=True)
 
 
 def clustering_step(
@@ -1180,6 +1462,8 @@ def clustering_step(
     dots_clustering_radius,
     verbose,
     obs_raw_name=observed_count_name,
+    nproc=1,
+    method="kdtree",
 ):
     """
 
@@ -1190,7 +1474,8 @@ def clustering_step(
     that needs to be clustered, thus there is no additional 'comply_fdr' column
     and selection of compliant pixels.
 
-    This step is a clustering-only (using Birch from scikit).
+    This step is a clustering-only, see `clust_2D_pixels`, performed for
+    every region independently, in parallel if requested.
 
     Parameters
     ----------
@@ -1200,9 +1485,17 @@ def clustering_step(
     expected_regions : iterable
         An iterable of regions to be clustered.
     dots_clustering_radius : int
-        Birch-clustering threshold.
+        Clustering radius, in the units of 'start1' and 'start2'.
     verbose : bool
         Enable verbose output.
+    obs_raw_name : str
+        Name of the column with the raw observed counts, the pixel with the
+        highest count represents every cluster.
+    nproc : int, optional
+        How many processes to use for calculation.
+    method : str
+        Clustering method, 'kdtree' or 'birch', see `clust_2D_pixels`.
+
     Returns
     -------
     centroids : pandas.DataFrame
@@ -1212,7 +1505,8 @@ def clustering_step(
     -----
     'dots_clustering_radius' in Birch clustering algorithm corresponds to a
     double the clustering radius in the "greedy"-clustering used in HiCCUPS
-    (to be tested).
+    (to be tested). In the default 'kdtree' method pixels are linked when they
+    are at most 'dots_clustering_radius' apart.
 
     """
     # Annotate regions, if needed:
@@ -1224,23 +1518,39 @@ def clustering_step(
         scores_df["region"] = np.where(
             scores_df["chrom1"] == scores_df["chrom2"], scores_df["chrom1"], np.nan
         )
+    # Perform clustering for each region separately, only
+    # the coordinates are needed to cluster pixels:
+    region_names = scores_df["region"].astype(str)
+    region_dfs = []
+    for region in expected_regions:
+        df = scores_df.loc[region_names == str(region), ["start1", "start2"]]
+        if len(df):
+            region_dfs.append(df)
+
     # using different bin12_id_names since all
     # pixels are annotated at this point.
-    pixel_clust_list = []
-    for region in expected_regions:
-        # Perform clustering for each region separately.
-        df = scores_df[((scores_df["region"].astype(str) == str(region)))]
-        if not len(df):
-            continue
-
-        pixel_clust = clust_2D_pixels(
-            df,
-            threshold_cluster=dots_clustering_radius,
-            bin1_id_name="start1",
-            bin2_id_name="start2",
-            verbose=verbose,
-        )
-        pixel_clust_list.append(pixel_clust)
+    job = partial(
+        clust_2D_pixels,
+        threshold_cluster=dots_clustering_radius,
+        bin1_id_name="start1",
+        bin2_id_name="start2",
+        verbose=verbose,
+        method=method,
+    )
+
+    # execution details
+    if nproc > 1:
+        pool = get_mp_context().Pool(nproc)
+        map_ = pool.map
+    else:
+        map_ = map
+
+    # using try-clause to close mp.Pool properly
+    try:
+        pixel_clust_list = list(map_(job, region_dfs))
+    finally:
+        if nproc > 1:
+            pool.close()
     if verbose:
         logging.info("Clustering is over!")
     # concatenate clustering results ...
@@ -1380,18 +1690,200 @@ def thresholding_step(centroids, obs_raw_name=observed_count_name):
 ##################################
 
 
-def scoring_and_histogramming_step(
-    clr,
-    expected,
-    expected_name,
-    clr_weight_name,
-    tiles,
-    kernels,
-    ledges,
-    max_nans_tolerated,
+def _sum_hists(hx, hy):
+    """
+    Sum two dictionaries of per-kernel histograms of scored pixels.
+    """
+    # perform a DataFrame summation
+    # for every value of the dictionary:
+    return {k: hx[k].add(hy[k], fill_value=0).astype(np.int64) for k in hx}
+
+
+def _drop_top_lambda_chunk(final_hist):
+    """
+    Check that the top lambda-chunk (last_edge, +inf] of the genome-wide
+    histograms is empty and drop it.
+    """
+    # we have to make sure there is nothing in the
+    # top bin, i.e., there are no l.a. expecteds > base^(len(ledges)-1)
+    for k in final_hist:
+        last_la_exp_bin = final_hist[k].columns[-1]
+        last_la_exp_vals = final_hist[k].iloc[:, -1]
+        # checking the top bin:
+        if last_la_exp_vals.sum() != 0:
+            raise ValueError(
+                f"There are la_exp.{k}.value in {last_la_exp_bin}, please check the histogram"
+            )
+        # drop that last column/bin (last_edge, +inf]:
+        final_hist[k] = final_hist[k].drop(columns=last_la_exp_bin)
+        # consider dropping all of the columns that have zero .sum()
+    return final_hist
+
+
+def _sort_extracted_pixels(significant_pixels, bin1_id_name, bin2_id_name):
+    """
+    Check that there are no duplicated pixels among the extracted ones and
+    sort them by bin ids.
+    """
+    # there should be no duplicates in the "significant_pixels" DataFrame of pixels:
+    significant_pixels_dups = significant_pixels.duplicated()
+    if significant_pixels_dups.any():
+        raise ValueError(
+            f"Duplicated pixels detected during exctraction {significant_pixels[significant_pixels_dups]}"
+        )
+    # sort the result just in case and drop its index:
+    return significant_pixels.sort_values(by=[bin1_id_name, bin2_id_name]).reset_index(
+        drop=True
+    )
+
+
+def _timed_job(job, tile):
+    # run a job, recording the worker that ran it and for how long:
+    t0 = time.perf_counter()
+    result = job(tile)
+    return os.getpid(), time.perf_counter() - t0, result
+
+
+# the job of a pool worker, installed once per worker by the pool initializer,
+# so that only the tiles are pickled for every task, see '_map_tiles':
+_worker_job = None
+
+
+def _install_worker_job(job):
+    global _worker_job
+    _worker_job = job
+
+
+def _run_worker_job(tile):
+    return _timed_job(_worker_job, tile)
+
+
+def _map_tiles(job, tiles, nproc, verbose, costs=None, checkpoint_dir=None):
+    """
+    Map `job` over `tiles`, in a pool of `nproc` workers if `nproc` > 1, and
+    yield the results.
+
+    Tiles are handed out one at a time from the queue shared by the workers,
+    so that every worker takes the next tile as soon as it is idle, and with
+    `costs` (see 'estimate_tile_costs') the costliest tiles are queued first,
+    so that no worker is left with a long tile at the end. Results are
+    yielded in the order the tiles are queued. Utilization of the workers is
+    reported once all of the tiles are done, if `verbose`.
+
+    The `job` is handed to every worker once, when the pool starts, and only
+    the tiles are sent with the tasks: a job closing over the cooler, the
+    cis-expected and the kernels is costly to pickle for every tile.
+
+    If `checkpoint_dir` is provided, results are persisted there, see
+    '_checkpointed_map'.
+
+    """
+    if costs is not None:
+        order = np.argsort(-np.asarray(costs), kind="stable")
+        tiles = [tiles[i] for i in order]
+
+    if nproc > 1:
+        pool = get_mp_context().Pool(
+            nproc, initializer=_install_worker_job, initargs=(job,)
+        )
+        if verbose:
+            logging.info(
+                f"creating a Pool of {nproc} workers to tackle {len(tiles)} tiles"
+            )
+    else:
+        if verbose:
+            logging.info("fallback to serial implementation.")
+
+    busy_time, n_tiles = {}, {}
+
+    def _timed_map(job, tiles):
+        if nproc > 1:
+            # the workers run the job they were initialized with:
+            timed_results = pool.imap(_run_worker_job, tiles, chunksize=1)
+        else:
+            timed_results = map(partial(_timed_job, job), tiles)
+        for pid, elapsed, result in timed_results:
+            busy_time[pid] = busy_time.get(pid, 0.0) + elapsed
+            n_tiles[pid] = n_tiles.get(pid, 0) + 1
+            yield result
+
+    t0 = time.perf_counter()
+    try:
+        if checkpoint_dir is None:
+            yield from _timed_map(job, tiles)
+        else:
+            yield from _checkpointed_map(_timed_map, job, tiles, checkpoint_dir)
+    finally:
+        if nproc > 1:
+            pool.close()
+    wall_time = time.perf_counter() - t0
+
+    if verbose and busy_time:
+        utilization = sum(busy_time.values()) / (max(nproc, 1) * wall_time)
+        logging.info(
+            f"{sum(n_tiles.values())} tiles done in {wall_time:.1f}s,"
+            f" utilization of {nproc} workers {utilization:.0%}"
+        )
+        for i, pid in enumerate(sorted(busy_time)):
+            logging.info(
+                f"worker {i}: {n_tiles[pid]} tiles, busy {busy_time[pid]:.1f}s"
+                f" ({busy_time[pid] / wall_time:.0%})"
+            )
+
+
+def _checkpointed_map(map_, job, tiles, checkpoint_dir, batch_size=10, **map_kwargs):
+    """
+    Map `job` over `tiles`, persisting the results in batches of `batch_size`
+    tiles to `checkpoint_dir`. The tiles with results persisted by an earlier,
+    interrupted run are not processed again, their results are loaded instead.
+
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    batch_paths = sorted(glob.glob(op.join(checkpoint_dir, "tiles.*.pkl")))
+    done = {}
+    for path in batch_paths:
+        with open(path, "rb") as f:
+            done.update(pickle.load(f))
+
+    def _dump(batch, i):
+        # write to a temporary file first, so that batches are never partial
+        path = op.join(checkpoint_dir, f"tiles.{i:06d}.pkl")
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(batch, f)
+        os.replace(path + ".tmp", path)
+
+    todo = []
+    for tile in tiles:
+        if tile in done:
+            yield done.pop(tile)
+        else:
+            todo.append(tile)
+
+    batch, n_batches = {}, len(batch_paths)
+    for tile, result in zip(todo, map_(job, todo, **map_kwargs)):
+        batch[tile] = result
+        if len(batch) == batch_size:
+            _dump(batch, n_batches)
+            batch, n_batches = {}, n_batches + 1
+        yield result
+    if batch:
+        _dump(batch, n_batches)
+
+
+def scoring_and_histogramming_step(
+    clr,
+    expected,
+    expected_name,
+    clr_weight_name,
+    tiles,
+    kernels,
+    ledges,
+    max_nans_tolerated,
     loci_separation_bins,
     nproc,
     verbose,
+    checkpoint_dir=None,
+    dtype=np.float64,
 ):
     """
     This is a derivative of the 'scoring_step' which is supposed to implement
@@ -1399,6 +1891,12 @@ def scoring_and_histogramming_step(
 
     Basically we are piping scoring operation together with histogramming into a
     single pipeline of per-chunk operations/transforms.
+
+    If 'checkpoint_dir' is provided, histograms of tiles are persisted there as
+    they are computed, and the tiles persisted by an earlier, interrupted run
+    with the same parameters are not scored again.
+
+    Tiles are convolved as matrices of 'dtype', see 'score_tile'.
     """
     if verbose:
         logging.info(f"Preparing to convolve {len(tiles)} tiles:")
@@ -1428,6 +1926,7 @@ def scoring_and_histogramming_step(
         # for now.
         balance_factor=None,
         verbose=very_verbose,
+        dtype=dtype,
     )
 
     # to hist per scored chunk:
@@ -1439,48 +1938,6 @@ def scoring_and_histogramming_step(
     # together :
     job = lambda tile: to_hist(to_score(tile))
 
-    # copy paste from @nvictus modified 'scoring_step':
-    if nproc > 1:
-        pool = mp.Pool(nproc)
-        map_ = pool.imap
-        map_kwargs = dict(chunksize=int(np.ceil(len(tiles) / nproc)))
-        if verbose:
-            logging.info(
-                f"creating a Pool of {nproc} workers to tackle {len(tiles)} tiles"
-            )
-    else:
-        map_ = map
-        if verbose:
-            logging.info("fallback to serial implementation.")
-        map_kwargs = {}
-    try:
-        # consider using
-        # https://github.com/mirnylab/cooler/blob/9e72ee202b0ac6f9d93fd2444d6f94c524962769/cooler/tools.py#L59
-        # here:
-        hchunks = map_(job, tiles, **map_kwargs)
-        # hchunks TO BE ACCUMULATED
-        # hopefully 'hchunks' would stay in memory
-        # until we would get a chance to accumulate them:
-    finally:
-        if nproc > 1:
-            pool.close()
-    #
-    # now we need to combine/sum all of the histograms
-    # for different kernels:
-    #
-    # assuming we know "kernels"
-    # this is very ugly, but ok
-    # for the draft lambda-chunking
-    # lambda version of lambda-chunking:
-    def _sum_hists(hx, hy):
-        # perform a DataFrame summation
-        # for every value of the dictionary:
-        hxy = {}
-        for k in kernels:
-            hxy[k] = hx[k].add(hy[k], fill_value=0).astype(np.int64)
-        # returning the sum:
-        return hxy
-
     # ######################################################
     # this approach is tested and at the very least
     # number of pixels in a dump list matches
@@ -1489,22 +1946,22 @@ def scoring_and_histogramming_step(
     # thus we should consider this as a reference
     # implementation, albeit not a very efficient one ...
     # ######################################################
+
+    hchunks = _map_tiles(
+        job,
+        tiles,
+        nproc,
+        verbose,
+        costs=estimate_tile_costs(clr, tiles, loci_separation_bins),
+        checkpoint_dir=checkpoint_dir,
+    )
+    # hchunks TO BE ACCUMULATED
+    # hopefully 'hchunks' would stay in memory
+    # until we would get a chance to accumulate them:
     final_hist = reduce(_sum_hists, hchunks)
-    # we have to make sure there is nothing in the
-    # top bin, i.e., there are no l.a. expecteds > base^(len(ledges)-1)
-    for k in kernels:
-        last_la_exp_bin = final_hist[k].columns[-1]
-        last_la_exp_vals = final_hist[k].iloc[:, -1]
-        # checking the top bin:
-        if last_la_exp_vals.sum() != 0:
-            raise ValueError(
-                f"There are la_exp.{k}.value in {last_la_exp_bin}, please check the histogram"
-            )
-        # drop that last column/bin (last_edge, +inf]:
-        final_hist[k] = final_hist[k].drop(columns=last_la_exp_bin)
-        # consider dropping all of the columns that have zero .sum()
+
     # returning filtered histogram
-    return final_hist
+    return _drop_top_lambda_chunk(final_hist)
 
 
 def scoring_and_extraction_step(
@@ -1524,6 +1981,8 @@ def scoring_and_extraction_step(
     verbose,
     bin1_id_name="bin1_id",
     bin2_id_name="bin2_id",
+    checkpoint_dir=None,
+    dtype=np.float64,
 ):
     """
     This is a derivative of the 'scoring_step' which is supposed to implement
@@ -1533,6 +1992,12 @@ def scoring_and_extraction_step(
     Basically we are piping scoring operation together with extraction into a
     single pipeline of per-chunk operations/transforms.
 
+    If 'checkpoint_dir' is provided, pixels extracted from tiles are persisted
+    there as they are computed, and the tiles persisted by an earlier,
+    interrupted run with the same parameters are not scored again.
+
+    Tiles are convolved as matrices of 'dtype', see 'score_tile'.
+
     """
     if verbose:
         logging.info(f"Preparing to convolve {len(tiles)} tiles:")
@@ -1560,6 +2025,7 @@ def scoring_and_extraction_step(
         band_to_cover=loci_separation_bins,
         balance_factor=balance_factor,
         verbose=very_verbose,
+        dtype=dtype,
     )
 
     # to hist per scored chunk:
@@ -1575,40 +2041,483 @@ def scoring_and_extraction_step(
     # together :
     job = lambda tile: to_extract(to_score(tile))
 
-    # copy paste from @nvictus modified 'scoring_step':
-    if nproc > 1:
-        pool = mp.Pool(nproc)
-        map_ = pool.imap
-        map_kwargs = dict(chunksize=int(np.ceil(len(tiles) / nproc)))
-        if verbose:
-            logging.info(
-                f"creating a Pool of {nproc} workers to tackle {len(tiles)} tiles"
+    filtered_pix_chunks = _map_tiles(
+        job,
+        tiles,
+        nproc,
+        verbose,
+        costs=estimate_tile_costs(clr, tiles, loci_separation_bins),
+        checkpoint_dir=checkpoint_dir,
+    )
+    significant_pixels = pd.concat(filtered_pix_chunks, ignore_index=True)
+    if output_path is not None:
+        significant_pixels.to_csv(
+            output_path, sep="\t", header=True, index=False, compression=None
+        )
+    return _sort_extracted_pixels(significant_pixels, bin1_id_name, bin2_id_name)
+
+
+def scoring_histogramming_and_spilling_step(
+    clr,
+    expected,
+    expected_name,
+    clr_weight_name,
+    tiles,
+    kernels,
+    ledges,
+    fdr,
+    max_nans_tolerated,
+    loci_separation_bins,
+    spill_dir,
+    nproc,
+    verbose,
+    spill_size=1_000_000,
+    checkpoint_dir=None,
+    dtype=np.float64,
+):
+    """
+    Single pass alternative to 'scoring_and_histogramming_step' followed by
+    'scoring_and_extraction_step', that convolves every tile only once.
+
+    Every scored tile contributes to the histograms, and its candidate pixels
+    (see 'extract_candidate_pixels') are spilled to 'spill_dir' in files of
+    about 'spill_size' pixels. FDR thresholds determined from the histograms
+    are then applied to the spilled candidates by
+    'extraction_from_spill_step'.
+
+    If 'checkpoint_dir' is provided, results of tiles are persisted there as
+    they are computed, and the tiles persisted by an earlier, interrupted run
+    with the same parameters are not scored again. The persisted batches of
+    tiles hold the candidates already, so nothing is spilled to 'spill_dir'
+    and the batches are used as the spilled files instead: 'checkpoint_dir'
+    has to be kept until the extraction.
+
+    Tiles are convolved as matrices of 'dtype', see 'score_tile'.
+
+    Returns
+    -------
+    gw_hist : dict
+        Same as the output of 'scoring_and_histogramming_step'.
+    spill_paths : list of str
+        Paths to the pickled DataFrames of candidate pixels, or to the batches
+        of tiles persisted in 'checkpoint_dir'.
+
+    """
+    if verbose:
+        logging.info(f"Preparing to convolve {len(tiles)} tiles:")
+
+    # add very_verbose to supress output from convolution of every tile
+    very_verbose = False
+
+    # check if cooler is balanced
+    try:
+        _ = is_cooler_balanced(clr, clr_weight_name, raise_errors=True)
+    except Exception as e:
+        raise ValueError(
+            f"provided cooler is not balanced or {clr_weight_name} is missing"
+        ) from e
+
+    # to score per tile:
+    to_score = partial(
+        score_tile,
+        clr=clr,
+        cis_exp=expected,
+        exp_v_name=expected_name,
+        clr_weight_name=clr_weight_name,
+        kernels=kernels,
+        nans_tolerated=max_nans_tolerated,
+        band_to_cover=loci_separation_bins,
+        # do not calculate dynamic-donut criteria
+        # for now.
+        balance_factor=None,
+        verbose=very_verbose,
+        dtype=dtype,
+    )
+
+    # to hist per scored chunk:
+    to_hist = partial(
+        histogram_scored_pixels, kernels=kernels, ledges=ledges, verbose=very_verbose
+    )
+
+    # to keep candidates per scored chunk:
+    to_spill = partial(
+        extract_candidate_pixels, kernels=kernels, ledges=ledges, fdr=fdr
+    )
+
+    def job(tile):
+        scored_df = to_score(tile)
+        return to_hist(scored_df), to_spill(scored_df)
+
+    chunks = _map_tiles(
+        job,
+        tiles,
+        nproc,
+        verbose,
+        costs=estimate_tile_costs(clr, tiles, loci_separation_bins),
+        checkpoint_dir=checkpoint_dir,
+    )
+    final_hist = None
+    if checkpoint_dir is not None:
+        # candidates are persisted with the tiles, accumulate histograms only:
+        for hchunk, _ in chunks:
+            final_hist = (
+                hchunk if final_hist is None else _sum_hists(final_hist, hchunk)
             )
+        spill_paths = sorted(glob.glob(op.join(checkpoint_dir, "tiles.*.pkl")))
     else:
-        map_ = map
-        if verbose:
-            logging.info("fallback to serial implementation.")
-        map_kwargs = {}
-    try:
-        # consider using
-        # https://github.com/mirnylab/cooler/blob/9e72ee202b0ac6f9d93fd2444d6f94c524962769/cooler/tools.py#L59
-        # here:
-        filtered_pix_chunks = map_(job, tiles, **map_kwargs)
-        significant_pixels = pd.concat(filtered_pix_chunks, ignore_index=True)
-        if output_path is not None:
-            significant_pixels.to_csv(
-                output_path, sep="\t", header=True, index=False, compression=None
+        os.makedirs(spill_dir, exist_ok=True)
+        spill_paths = []
+
+        def _spill(candidates):
+            path = op.join(spill_dir, f"candidates.{len(spill_paths):06d}.pkl")
+            pd.concat(candidates, ignore_index=True).to_pickle(path)
+            spill_paths.append(path)
+
+        # accumulate histograms, and spill candidates as they accumulate:
+        candidates, n_candidates = [], 0
+        for hchunk, candidates_chunk in chunks:
+            final_hist = (
+                hchunk if final_hist is None else _sum_hists(final_hist, hchunk)
             )
-    finally:
-        if nproc > 1:
-            pool.close()
-    # there should be no duplicates in the "significant_pixels" DataFrame of pixels:
-    significant_pixels_dups = significant_pixels.duplicated()
-    if significant_pixels_dups.any():
-        raise ValueError(
-            f"Duplicated pixels detected during exctraction {significant_pixels[significant_pixels_dups]}"
+            candidates.append(candidates_chunk)
+            n_candidates += len(candidates_chunk)
+            if n_candidates >= spill_size:
+                _spill(candidates)
+                candidates, n_candidates = [], 0
+        if candidates:
+            _spill(candidates)
+
+    if verbose:
+        logging.info(f"Spilled candidate pixels to {len(spill_paths)} files")
+    # returning filtered histogram and spilled candidates
+    return _drop_top_lambda_chunk(final_hist), spill_paths
+
+
+def extraction_from_spill_step(
+    spill_paths,
+    kernels,
+    ledges,
+    thresholds,
+    output_path,
+    verbose,
+    bin1_id_name="bin1_id",
+    bin2_id_name="bin2_id",
+):
+    """
+    Extract pixels that are FDR compliant from the candidate pixels spilled
+    by 'scoring_histogramming_and_spilling_step'. The result is the same as
+    that of 'scoring_and_extraction_step', without convolving tiles again.
+    """
+    if verbose:
+        logging.info(f"Extracting pixels from {len(spill_paths)} spilled files")
+
+    def _read_candidates(path):
+        candidates = pd.read_pickle(path)
+        if isinstance(candidates, dict):
+            # a batch of tiles persisted by '_checkpointed_map'
+            candidates = pd.concat(
+                [tile_candidates for _, tile_candidates in candidates.values()],
+                ignore_index=True,
+            )
+        return candidates
+
+    significant_pixels = pd.concat(
+        [
+            extract_scored_pixels(
+                _read_candidates(path),
+                kernels=kernels,
+                thresholds=thresholds,
+                ledges=ledges,
+                verbose=False,
+            )
+            for path in spill_paths
+        ],
+        ignore_index=True,
+    )
+    if output_path is not None:
+        significant_pixels.to_csv(
+            output_path, sep="\t", header=True, index=False, compression=None
+        )
+    return _sort_extracted_pixels(significant_pixels, bin1_id_name, bin2_id_name)
+
+
+##################################
+# multi-resolution dot-calling:
+##################################
+
+
+def merge_dot_calls(calls, merge_radius=None):
+    """
+    Merge dot calls made at several resolutions HiCCUPS-style: all of the
+    calls made at the finest resolution are kept, while calls made at every
+    coarser resolution are kept only when there are no calls kept so far
+    within 'merge_radius' from them.
+
+    Parameters
+    ----------
+    calls : dict
+        DataFrames with dot calls keyed by resolution, with the 'chrom1',
+        'chrom2', 'cstart1' and 'cstart2' columns, e.g. from
+        'thresholding_step'.
+    merge_radius : int or dict, optional
+        Two calls are considered the same dot, when their centroids are
+        within 'merge_radius' bp from each other along both axes. A dict
+        keyed by resolution provides a radius for the calls of every
+        resolution. Twice the resolution of the coarser call by default.
+
+    Returns
+    -------
+    merged_calls : pandas.DataFrame
+        The calls that were kept, annotated with their 'resolution'.
+
+    """
+    kept = []
+    for res in sorted(calls):
+        if merge_radius is None:
+            radius = 2 * res
+        elif isinstance(merge_radius, dict):
+            radius = merge_radius[res]
+        else:
+            radius = merge_radius
+        res_calls = calls[res].assign(resolution=res).reset_index(drop=True)
+        is_kept = np.ones(len(res_calls), dtype=bool)
+        if kept:
+            kept_calls = pd.concat(kept, ignore_index=True)
+            kept_groups = kept_calls.groupby(["chrom1", "chrom2"]).indices
+            for chroms, idx in res_calls.groupby(["chrom1", "chrom2"]).indices.items():
+                if chroms not in kept_groups:
+                    continue
+                tree = cKDTree(
+                    kept_calls[["cstart1", "cstart2"]].values[kept_groups[chroms]]
+                )
+                n_close = tree.query_ball_point(
+                    res_calls[["cstart1", "cstart2"]].values[idx],
+                    r=radius,
+                    p=np.inf,
+                    return_length=True,
+                )
+                is_kept[idx] = n_close == 0
+        kept.append(res_calls[is_kept])
+    return pd.concat(kept, ignore_index=True)
+
+
+def _score_multires_tile(scorers, kernels, ledges, fdr, task):
+    """
+    Score a tile of one of the resolutions of 'dots_multires', and return its
+    histograms and candidate pixels, see 'extract_candidate_pixels'.
+    """
+    res, tile = task
+    scored_df = scorers[res](tile)
+    return (
+        res,
+        histogram_scored_pixels(
+            scored_df, kernels=kernels[res], ledges=ledges, verbose=False
+        ),
+        extract_candidate_pixels(
+            scored_df, kernels=kernels[res], ledges=ledges, fdr=fdr
+        ),
+    )
+
+
+def dots_multires(
+    clrs,
+    expected=None,
+    view_df=None,
+    expected_value_col="balanced.avg",
+    clr_weight_name="weight",
+    max_loci_separation=2_000_000,
+    max_nans_tolerated=1,
+    tile_size=6_000_000,
+    num_lambda_chunks=45,
+    fdr=0.02,
+    dots_clustering_radius=39000,
+    merge_radius=None,
+    nproc=1,
+    verbose=False,
+    dtype=np.float64,
+):
+    """
+    Call dots at several resolutions of the same Hi-C map, e.g. in an mcool
+    file, and merge the calls.
+
+    Tiles of all resolutions are scored by a single pool of workers, the
+    costliest ones first (see '_map_tiles'), in a single pass: candidate pixels are collected
+    together with the histograms (see
+    'scoring_histogramming_and_spilling_step'). FDR thresholds, clustering
+    and post-processing are then done for every resolution as by the 'dots'
+    CLI, with kernels recommended for the resolution, and the calls are
+    merged with 'merge_dot_calls'.
+
+    Parameters
+    ----------
+    clrs : dict
+        Cooler objects keyed by their resolution.
+    expected : dict, optional
+        Cis-expected DataFrames keyed by resolution, with the 'region1',
+        'region2', 'dist' and 'expected_value_col' columns. Calculated with
+        'expected_cis' for the resolutions that are missing.
+    view_df : viewframe, optional
+        Viewframe with genomic regions to call dots in, all chromosomes by
+        default.
+    expected_value_col : str
+        Name of the column of expected with the values to use.
+    clr_weight_name : str
+        Name of the column of the bin tables with balancing weights.
+    max_loci_separation : int
+        Do not call dots for loci that are further apart, in bp.
+    max_nans_tolerated : int
+        Maximum number of NaNs tolerated in a footprint of every kernel.
+    tile_size : int
+        Tile size for the Hi-C heatmap tiling, in bp.
+    num_lambda_chunks : int
+        Number of log-spaced bins to divide adjusted expected between.
+    fdr : float
+        False discovery rate to control in the BH-FDR procedure.
+    dots_clustering_radius : int
+        Radius for clustering enriched pixels, in bp.
+    merge_radius : int or dict, optional
+        See 'merge_dot_calls'.
+    nproc : int, optional
+        How many processes to use for calculation.
+    verbose : bool
+        Enable verbose output.
+    dtype : numpy.dtype
+        Float type of the dense matrices and convolutions of tiles.
+
+    Returns
+    -------
+    calls : dict
+        Post-processed dot calls keyed by resolution.
+    merged_calls : pandas.DataFrame
+        Dot calls merged across resolutions.
+
+    """
+    expected = {} if expected is None else dict(expected)
+    ktypes = ["donut", "vertical", "horizontal", "lowleft"]
+    if not 40 <= num_lambda_chunks <= 50:
+        raise ValueError("Incompatible num_lambda_chunks")
+    base = 2 ** (1 / 3)
+    ledges = np.concatenate(
+        (
+            [-np.inf],
+            np.logspace(
+                0,
+                num_lambda_chunks - 1,
+                num=num_lambda_chunks,
+                base=base,
+                dtype=np.float64,
+            ),
+            [np.inf],
         )
-    # sort the result just in case and drop its index:
-    return significant_pixels.sort_values(by=[bin1_id_name, bin2_id_name]).reset_index(
-        drop=True
     )
+
+    # per-resolution setup, and the pairs (resolution, tile) to score:
+    views, kernels, scorers, tasks, costs = {}, {}, {}, [], []
+    for res, clr in clrs.items():
+        if view_df is None:
+            views[res] = make_cooler_view(clr)
+        else:
+            try:
+                _ = is_compatible_viewframe(
+                    view_df,
+                    clr,
+                    check_sorting=True,
+                    raise_errors=True,
+                )
+            except Exception as e:
+                raise ValueError(
+                    "view_df is not a valid viewframe or incompatible"
+                ) from e
+            views[res] = view_df
+        try:
+            _ = is_cooler_balanced(clr, clr_weight_name, raise_errors=True)
+        except Exception as e:
+            raise ValueError(
+                f"provided cooler is not balanced or {clr_weight_name} is missing"
+            ) from e
+        if res not in expected:
+            if verbose:
+                logging.info(f"Calculating cis-expected at {res}")
+            expected[res] = expected_cis(
+                clr,
+                view_df=views[res],
+                smooth=False,
+                clr_weight_name=clr_weight_name,
+                nproc=nproc,
+            )
+
+        w, p = recommend_kernel_params(res)
+        if not max_nans_tolerated <= 2 * w:
+            raise ValueError(f"Too many NaNs allowed at {res}!")
+        kernels[res] = {k: get_kernel(w, p, k) for k in ktypes}
+        band_bins = int(max_loci_separation / res)
+        scorers[res] = partial(
+            score_tile,
+            clr=clr,
+            cis_exp=expected[res].set_index(["region1", "region2", "dist"]),
+            exp_v_name=expected_value_col,
+            clr_weight_name=clr_weight_name,
+            kernels=kernels[res],
+            nans_tolerated=max_nans_tolerated,
+            band_to_cover=band_bins,
+            balance_factor=None,
+            verbose=False,
+            dtype=dtype,
+        )
+        tiles = list(
+            heatmap_tiles_generator_diag(
+                clr,
+                views[res],
+                w,
+                int(tile_size / res),
+                band_bins,
+                clr_weight_name=clr_weight_name,
+            )
+        )
+        tasks.extend((res, tile) for tile in tiles)
+        costs.extend(estimate_tile_costs(clr, tiles, band_bins))
+
+    # the scorers of all resolutions, with their cis-expected, are installed
+    # in the workers once, and the costliest tiles of all resolutions go first:
+    job = partial(_score_multires_tile, scorers, kernels, ledges, fdr)
+    hists = {res: None for res in clrs}
+    candidates = {res: [] for res in clrs}
+    for res, hchunk, candidates_chunk in _map_tiles(
+        job, tasks, nproc, verbose, costs=costs
+    ):
+        hists[res] = hchunk if hists[res] is None else _sum_hists(hists[res], hchunk)
+        candidates[res].append(candidates_chunk)
+
+    calls = {}
+    for res, clr in clrs.items():
+        if verbose:
+            logging.info(f"Extracting and post-processing dots at {res}")
+        gw_hist = _drop_top_lambda_chunk(hists[res])
+        thresholds, qvalues = determine_thresholds(kernels[res], ledges, gw_hist, fdr)
+        filtered_pixels = _sort_extracted_pixels(
+            extract_scored_pixels(
+                pd.concat(candidates[res], ignore_index=True),
+                kernels=kernels[res],
+                thresholds=thresholds,
+                ledges=ledges,
+                verbose=False,
+            ),
+            bin1_id_name,
+            bin2_id_name,
+        )
+        filtered_pixels_qvals = annotate_pixels_with_qvalues(
+            filtered_pixels, qvalues, kernels[res], ledges=ledges
+        )
+        filtered_pixels_annotated = assign_regions(
+            cooler.annotate(filtered_pixels_qvals, clr.bins()[:]), views[res]
+        )
+        centroids = clustering_step(
+            filtered_pixels_annotated,
+            views[res]["name"],
+            dots_clustering_radius,
+            verbose,
+            nproc=nproc,
+        )
+        calls[res] = thresholding_step(centroids)
+
+    return calls, merge_dot_calls(calls, merge_radius=merge_radius)
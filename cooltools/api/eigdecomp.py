@@ -1,5 +1,7 @@
 import numpy as np
 import scipy
+import scipy.sparse
+import scipy.sparse.linalg
 import scipy.stats
 
 import pandas as pd
@@ -62,7 +64,14 @@ def _phase_eigs(eigvals, eigvecs, phasing_track, sort_metric=None):
 
 
 def cis_eig(
-    A, n_eigs=3, phasing_track=None, ignore_diags=2, clip_percentile=0, sort_metric=None
+    A,
+    n_eigs=3,
+    phasing_track=None,
+    ignore_diags=2,
+    clip_percentile=0,
+    sort_metric=None,
+    solver="arpack",
+    v0=None,
 ):
     """
     Compute compartment eigenvector on a dense cis matrix.
@@ -100,6 +109,12 @@ def cis_eig(
         translocations. In reality, however, sometimes it shows poor
         performance and may lead to reporting of non-informative eigenvectors.
         Off by default.
+    solver : str
+        eigensolver to use, 'arpack', 'lobpcg' or 'randomized',
+        see numutils.get_eig.
+    v0 : 2D array, optional
+        initial guess for the eigenvectors (in rows), e.g. eigenvectors
+        computed at a coarser resolution and upsampled to the bins of A.
 
 
     Returns
@@ -111,7 +126,7 @@ def cis_eig(
               chromosomal arms or translocation blowouts.
 
     """
-    A = np.array(A)
+    A = np.array(A, dtype=np.float64)
     A[~np.isfinite(A)] = 0
 
     mask = A.sum(axis=0) > 0
@@ -126,7 +141,7 @@ def cis_eig(
         for d in range(-ignore_diags + 1, ignore_diags):
             numutils.set_diag(A, 1.0, d)
 
-    OE, _, _, _ = numutils.observed_over_expected(A, mask)
+    OE, _, _, _ = numutils.observed_over_expected(A, mask, out=A)
 
     if clip_percentile and clip_percentile < 100:
         OE = np.clip(OE, 0, np.percentile(OE[mask, :][:, mask], clip_percentile))
@@ -138,7 +153,9 @@ def cis_eig(
     OE[~mask, :] = 0
     OE[:, ~mask] = 0
 
-    eigvecs, eigvals = numutils.get_eig(OE, n_eigs, mask_zero_rows=True)
+    eigvecs, eigvals = numutils.get_eig(
+        OE, n_eigs, mask_zero_rows=True, solver=solver, v0=v0
+    )
     eigvecs /= np.sqrt(np.nansum(eigvecs ** 2, axis=1))[:, None]
     eigvecs *= np.sqrt(np.abs(eigvals))[:, None]
 
@@ -288,6 +305,219 @@ def trans_eig(
     return eigvals, eigvecs
 
 
+def _percentile_with_zeros(values, n_total, q):
+    """
+    Percentile of an array made of `values` and `n_total - len(values)`
+    implicit zeros, with linear interpolation as in np.percentile.
+    Assumes non-negative `values`.
+    """
+    n_zeros = max(n_total - len(values), 0)
+    n_total = n_zeros + len(values)
+    pos = q / 100 * (n_total - 1)
+    ranks = np.array([np.floor(pos), np.ceil(pos)], dtype=int)
+    nz_ranks = ranks - n_zeros
+    kth = nz_ranks[nz_ranks >= 0]
+    lims = np.zeros(2)
+    if len(kth):
+        part = np.partition(values, np.unique(kth))
+        lims[nz_ranks >= 0] = part[kth]
+    return lims[0] + (lims[1] - lims[0]) * (pos - ranks[0])
+
+
+def _iterative_correction_operator(matvec, n, max_iter=1000, tol=1e-5):
+    """
+    Matrix-free counterpart of numutils.iterative_correction_symmetric, for
+    a symmetric matrix M without empty rows available through `matvec`.
+    Returns the multiplicative weights `b`, such that diag(b) M diag(b) has
+    (near) constant marginals.
+    """
+    b = np.ones(n)
+    for _ in range(max_iter):
+        s = b * matvec(b)
+        s /= s.mean()
+        s -= 1
+        s *= 0.8
+        s += 1
+        b /= s
+        if np.var(s) < tol:
+            break
+    return b
+
+
+def trans_eig_sparse(
+    A,
+    partition,
+    n_eigs=3,
+    perc_top=99.95,
+    perc_bottom=1,
+    phasing_track=None,
+    sort_metric=False,
+):
+    """
+    Compute compartmentalization eigenvectors on sparse trans contact data.
+
+    This is a matrix-free version of `trans_eig` that never forms a dense
+    genome-wide matrix: the memory footprint is proportional to the number of
+    trans pixels. Cis blocks are replaced by the expected value of the decoy
+    data sampled by `trans_eig`, i.e. (m_i + m_j) / 2 for a cis pixel (i, j),
+    where m_i is the mean trans value of bin i. Together with the balancing
+    weights and the normalization by the mean, the cis blocks are applied as
+    implicit low-rank operators.
+
+    Parameters
+    ----------
+    A : scipy.sparse matrix
+        balanced whole genome contact matrix, only the upper triangle is used.
+        Cis pixels can be omitted.
+    partition : sequence of int
+        bin offset of each contiguous region to treat separately (e.g.,
+        chromosomes or chromosome arms)
+    n_eigs : int
+        number of eigenvectors to compute; default = 3
+    perc_top : float (percentile)
+        filter - clip trans blowout contacts above this cutoff; default = 99.95
+    perc_bottom : float (percentile)
+        filter - remove bins with trans coverage below this cutoff; default=1
+    phasing_track : 1D array, optional
+        if provided, eigenvectors are flipped to achieve a positive correlation
+        with `phasing_track`.
+    sort_metric : str
+        If provided, re-sort `eigenvecs` and `eigvals` in the order of
+        decreasing correlation between phasing_track and eigenvector, see
+        trans_eig.
+
+    Returns
+    -------
+    eigenvalues, eigenvectors
+
+    .. note:: ALWAYS check your EVs by eye. The first one occasionally does
+          not reflect the compartment structure, but instead describes
+          chromosomal arms or translocation blowouts.
+
+    """
+    A = scipy.sparse.triu(A, k=1, format="coo")
+    if A.shape[0] != A.shape[1]:
+        raise ValueError("A is not symmetric")
+
+    n_bins = A.shape[0]
+    if not (
+        partition[0] == 0 and partition[-1] == n_bins and np.all(np.diff(partition) > 0)
+    ):
+        raise ValueError(
+            "Not a valid partition. Must be a monotonic sequence "
+            "from 0 to {}.".format(n_bins)
+        )
+    part_ids = np.repeat(np.arange(len(partition) - 1), np.diff(partition))
+
+    def _marginals(i, j, v):
+        return np.bincount(i, v, n_bins) + np.bincount(j, v, n_bins)
+
+    # Keep finite trans data only
+    i, j, v = A.row, A.col, A.data
+    keep = (part_ids[i] != part_ids[j]) & np.isfinite(v)
+    i, j, v = i[keep], j[keep], v[keep].astype(np.float64)
+
+    # Truncate trans blowouts, taking missing trans pixels between good bins
+    # into account as zeros
+    is_good_bin = _marginals(i, j, v) > 0
+    n_good = np.bincount(part_ids[is_good_bin], minlength=len(partition) - 1)
+    n_trans_pairs = (n_good.sum() ** 2 - np.sum(n_good ** 2)) // 2
+    lim = _percentile_with_zeros(v, n_trans_pairs, perc_top)
+    v = np.minimum(v, lim)
+
+    # Remove bins with poor coverage in trans
+    marg = _marginals(i, j, v)
+    min_cutoff = np.percentile(marg[marg > 0], perc_bottom)
+    dropmask = (marg > 0) & (marg < min_cutoff)
+    keep = ~(dropmask[i] | dropmask[j])
+    i, j, v = i[keep], j[keep], v[keep]
+    is_good_bin = _marginals(i, j, v) > 0
+
+    # Collapse to good bins
+    good_bins = np.flatnonzero(is_good_bin)
+    n = len(good_bins)
+    new_ids = np.full(n_bins, -1)
+    new_ids[good_bins] = np.arange(n)
+    parts = part_ids[good_bins]
+    n_parts = len(partition) - 1
+    T = scipy.sparse.csr_matrix((v, (new_ids[i], new_ids[j])), shape=(n, n))
+    T = T + T.T
+    n_trans = n - np.bincount(parts, minlength=n_parts)[parts]
+
+    def _cis_matvec(m, x):
+        # implicit cis blocks with pixels (m_i + m_j) / 2
+        s0 = np.bincount(parts, x, n_parts)[parts]
+        s1 = np.bincount(parts, m * x, n_parts)[parts]
+        return 0.5 * (m * s0 + s1)
+
+    # Fake cis and re-balance, twice as in trans_eig
+    bias_trans = np.ones(n)
+    for _ in range(2):
+        m = bias_trans * (T @ bias_trans) / n_trans
+
+        def _matvec(x, bias_trans=bias_trans, m=m):
+            return bias_trans * (T @ (bias_trans * x)) + _cis_matvec(m, x)
+
+        bias = _iterative_correction_operator(_matvec, n)
+        bias_trans = bias_trans * bias
+
+    def _balanced_matvec(x):
+        return bias_trans * (T @ (bias_trans * x)) + bias * _cis_matvec(m, bias * x)
+
+    # Compute eig of (A - Abar) / Abar, centered by scalar mean
+    Abar = _balanced_matvec(np.ones(n)).sum() / n ** 2
+    O = scipy.sparse.linalg.LinearOperator(
+        (n, n),
+        matvec=lambda x: _balanced_matvec(np.ravel(x)) / Abar - np.sum(x),
+        dtype=np.float64,
+    )
+    # adjust requested number of eigvals for "eigsh"
+    _n = n_eigs if n_eigs < n else (n - 1)
+    _eigvals, _eigvecs = scipy.sparse.linalg.eigsh(O, _n)
+    order = np.argsort(-np.abs(_eigvals))
+
+    eigvals = np.full(n_eigs, np.nan)
+    eigvecs = np.full((n_eigs, n_bins), np.nan)
+    eigvals[:_n] = _eigvals[order]
+    eigvecs[:_n, good_bins] = _eigvecs.T[order]
+
+    eigvecs /= np.sqrt(np.nansum(eigvecs ** 2, axis=1))[:, None]
+    eigvecs *= np.sqrt(np.abs(eigvals))[:, None]
+    if phasing_track is not None:
+        eigvals, eigvecs = _phase_eigs(eigvals, eigvecs, phasing_track, sort_metric)
+
+    return eigvals, eigvecs
+
+
+def _fetch_trans_pixels(clr, lo, hi, partition, clr_weight_name, chunksize):
+    """
+    Load balanced trans pixels between bins lo and hi as a sparse upper
+    triangular matrix, reading the pixel table in chunks.
+    """
+    with clr.open("r") as h5:
+        p0, p1 = h5["indexes/bin1_offset"][[lo, hi]]
+    weights = clr.bins()[clr_weight_name][lo:hi].values
+    part_ids = np.repeat(np.arange(len(partition) - 1), np.diff(partition))
+
+    rows, cols, data = [], [], []
+    for p in range(p0, p1, chunksize):
+        pixels = clr.pixels()[p : min(p + chunksize, p1)]
+        pixels = pixels[pixels["bin2_id"] < hi]
+        i = pixels["bin1_id"].values - lo
+        j = pixels["bin2_id"].values - lo
+        v = pixels["count"].values * weights[i] * weights[j]
+        keep = (part_ids[i] != part_ids[j]) & np.isfinite(v)
+        rows.append(i[keep].astype(np.int32))
+        cols.append(j[keep].astype(np.int32))
+        data.append(v[keep])
+
+    n_bins = hi - lo
+    return scipy.sparse.coo_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_bins, n_bins),
+    )
+
+
 def eigs_cis(
     clr,
     phasing_track=None,
@@ -298,6 +528,9 @@ def eigs_cis(
     bad_bins=None,
     clip_percentile=99.9,
     sort_metric=None,
+    solver="arpack",
+    init_eigvecs=None,
+    nproc=1,
     map=map,
 ):
     """
@@ -351,6 +584,16 @@ def eigs_cis(
         translocations. In reality, however, sometimes it shows poor
         performance and may lead to reporting of non-informative eigenvectors.
         Off by default.
+    solver : str
+        eigensolver to use, 'arpack', 'lobpcg' or 'randomized',
+        see numutils.get_eig.
+    init_eigvecs : DataFrame, optional
+        table of initial guesses for the eigenvectors aligned with the cooler
+        bins, with columns E1, E2, ..., e.g. eigenvectors computed at a coarser
+        resolution and upsampled with `upsample_eigvecs`.
+    nproc : int, optional
+        How many processes to use for calculation. When nproc > 1, regions are
+        eigendecomposed in a process pool and `map` is ignored.
     map : callable, optional
         Map functor implementation.
     Returns
@@ -411,6 +654,13 @@ def eigs_cis(
     for ev_col in eigvec_columns:
         eigvec_table[ev_col] = np.nan
 
+    # initial guesses for the eigenvectors
+    if init_eigvecs is not None:
+        if len(init_eigvecs) != len(bins):
+            raise ValueError("init_eigvecs must be aligned with the cooler bins")
+        init_columns = [col for col in eigvec_columns if col in init_eigvecs]
+        init_eigvecs = init_eigvecs[init_columns].values
+
     # prepare output table for eigenvalues
     eigvals_table = view_df.copy()
     eigval_columns = [f"eigval{i + 1}" for i in range(n_eigs)]
@@ -445,6 +695,13 @@ def eigs_cis(
                 A[:, bad_bins_region] = np.nan
                 A[bad_bins_region, :] = np.nan
 
+        # extract initial eigenvectors relevant for the _region
+        if init_eigvecs is not None:
+            lo, hi = clr.extent(_region)
+            v0 = init_eigvecs[lo:hi].T
+        else:
+            v0 = None
+
         # extract phasing track relevant for the _region
         if phasing_track is not None:
             phasing_track_region = bioframe.select(phasing_track, _region)
@@ -459,25 +716,153 @@ def eigs_cis(
             phasing_track=phasing_track_region_values,
             clip_percentile=clip_percentile,
             sort_metric=sort_metric,
+            solver=solver,
+            v0=v0,
         )
 
         return _region, eigvals, eigvecs
 
-    # eigendecompose matrix per region (can be multiprocessed)
-    # output assumes that the order of results matches regions
-    results = map(_each, view_df.values)
+    # bin offsets of each region, used to scatter eigenvectors into eigvec_table
+    extents = np.array([clr.extent(region[:3]) for region in view_df.values])
+
+    # execution details
+    if nproc > 1:
+        pool = numutils.get_mp_context().Pool(nproc)
+        map_ = pool.map
+    else:
+        map_ = map
+
+    # eigendecompose matrix per region, results follow the order of regions
+    # using try-clause to close mp.Pool properly
+    try:
+        results = list(map_(_each, view_df.values))
+    finally:
+        if nproc > 1:
+            pool.close()
 
     # go through eigendecomposition results and fill in
     # output table eigvec_table and eigvals_table
-    for _region, _eigvals, _eigvecs in results:
-        idx = bioframe.select(eigvec_table, _region).index
-        eigvec_table.loc[idx, eigvec_columns] = _eigvecs.T
-        idx = bioframe.select(eigvals_table, _region).index
-        eigvals_table.loc[idx, eigval_columns] = _eigvals
+    eigvecs_all = np.full((len(bins), n_eigs), np.nan)
+    eigvals_all = np.full((len(view_df), n_eigs), np.nan)
+    for i, ((lo, hi), (_region, _eigvals, _eigvecs)) in enumerate(
+        zip(extents, results)
+    ):
+        eigvecs_all[lo:hi] = _eigvecs.T
+        eigvals_all[i] = _eigvals
+    eigvec_table[eigvec_columns] = eigvecs_all
+    eigvals_table[eigval_columns] = eigvals_all
 
     return eigvals_table, eigvec_table
 
 
+def upsample_eigvecs(eigvec_table, bins, binsize):
+    """
+    Transfer eigenvectors computed at a coarser resolution onto finer bins,
+    each fine bin gets the values of the coarse bin containing its start.
+
+    Parameters
+    ----------
+    eigvec_table : DataFrame
+        coarse table of eigenvectors, e.g. the output of eigs_cis, with columns
+        chrom, start, end, E1, E2, ...
+    bins : DataFrame
+        fine bins, e.g. clr.bins()[:].
+    binsize : int
+        bin size of the coarse table.
+
+    Returns
+    -------
+    DataFrame with the fine bins and eigenvector columns of `eigvec_table`.
+    """
+    eigvec_columns = [
+        col for col in eigvec_table.columns if col[:1] == "E" and col[1:].isdigit()
+    ]
+    fine = bins[["chrom", "start", "end"]].copy()
+    fine["_start"] = (fine["start"] // binsize) * binsize
+    coarse = eigvec_table[["chrom", "start"] + eigvec_columns].rename(
+        columns={"start": "_start"}
+    )
+    fine = fine.merge(coarse, on=["chrom", "_start"], how="left", sort=False)
+    return fine.drop(columns="_start")
+
+
+def eigs_cis_multires(
+    clrs,
+    phasing_tracks=None,
+    view_df=None,
+    n_eigs=3,
+    solver="lobpcg",
+    **kwargs,
+):
+    """
+    Compute cis compartment eigenvectors for the same sample at several
+    resolutions, going from coarse to fine. Eigenvectors of each resolution
+    are upsampled and used as initial guesses for the next finer resolution,
+    which reduces the number of solver iterations at fine resolutions.
+
+    Parameters
+    ----------
+    clrs : list of cooler
+        coolers with the same sample at different resolutions, e.g. from an
+        .mcool file. Bin sizes must be nested, i.e. each bin size divides the
+        coarser ones.
+    phasing_tracks : list of DataFrames, optional
+        phasing tracks matching the resolutions of `clrs`, in the same order.
+    view_df : iterable or DataFrame, optional
+        regions to calculate eigenvectors for, see eigs_cis.
+    n_eigs : int
+        number of eigenvectors to compute
+    solver : str
+        eigensolver to use for the warm-started resolutions, 'arpack',
+        'lobpcg' or 'randomized', see numutils.get_eig. Block solvers benefit
+        the most from warm starts. The coarsest resolution has no initial
+        guess and is always solved with 'arpack'.
+    kwargs :
+        other arguments passed to eigs_cis.
+
+    Returns
+    -------
+    dict with bin sizes as keys and (eigvals, eigvec_table) tuples as values,
+    see eigs_cis.
+    """
+    if phasing_tracks is None:
+        phasing_tracks = [None] * len(clrs)
+    if len(phasing_tracks) != len(clrs):
+        raise ValueError("phasing_tracks must match clrs")
+
+    # process resolutions from coarse to fine
+    order = np.argsort([-clr.binsize for clr in clrs])
+    binsizes = [clrs[i].binsize for i in order]
+    if any(coarse % fine for coarse, fine in zip(binsizes[:-1], binsizes[1:])):
+        raise ValueError("resolutions of the coolers must be nested")
+
+    results = {}
+    eigvec_table = None
+    for k, i in enumerate(order):
+        clr = clrs[i]
+        # warm start from the previous, coarser, resolution, the block
+        # solvers are slower than arpack from a cold start
+        if eigvec_table is None:
+            init_eigvecs, level_solver = None, "arpack"
+        else:
+            init_eigvecs = upsample_eigvecs(
+                eigvec_table, clr.bins()[:], binsizes[k - 1]
+            )
+            level_solver = solver
+        eigvals, eigvec_table = eigs_cis(
+            clr,
+            phasing_track=phasing_tracks[i],
+            view_df=view_df,
+            n_eigs=n_eigs,
+            solver=level_solver,
+            init_eigvecs=init_eigvecs,
+            **kwargs,
+        )
+        results[clr.binsize] = (eigvals, eigvec_table)
+
+    return results
+
+
 def eigs_trans(
     clr,
     phasing_track=None,
@@ -485,8 +870,47 @@ def eigs_trans(
     partition=None,
     clr_weight_name="weight",
     sort_metric=None,
+    sparse=False,
+    chunksize=10_000_000,
     **kwargs,
 ):
+    """
+    Compute compartmentalization eigenvectors on trans contact data of a
+    cooler `clr`.
+
+    Parameters
+    ----------
+    clr : cooler
+        cooler object to fetch data from
+    phasing_track : DataFrame
+        binned track with the same resolution as cooler bins, the fourth column is
+        used to phase the eigenvectors, flipping them to achieve a positive correlation.
+    n_eigs : int
+        number of eigenvectors to compute
+    partition : sequence of int, optional
+        bin offset of each contiguous region to treat separately, chromosomes
+        by default.
+    clr_weight_name : str
+        name of the column with balancing weights to be used.
+    sort_metric : str
+        If provided, re-sort `eigenvecs` and `eigvals` in the order of
+        decreasing correlation between phasing_track and eigenvector, see
+        trans_eig.
+    sparse : bool
+        If True, load only the trans pixels and use the matrix-free
+        `trans_eig_sparse`, with memory proportional to the number of trans
+        pixels rather than to the squared number of bins. Recommended for
+        high resolutions.
+    chunksize : int, optional
+        Number of pixels loaded at a time when `sparse` is True.
+    kwargs :
+        other arguments passed to trans_eig or trans_eig_sparse.
+
+    Returns
+    -------
+    eigvals, eigvec_table -> DataFrames with eigenvalues and a table of
+    eigenvectors filled in the `bins` table.
+    """
 
     # check if cooler is balanced
     try:
@@ -510,7 +934,6 @@ def eigs_trans(
 
     lo = partition[0]
     hi = partition[-1]
-    A = clr.matrix(balance=clr_weight_name)[lo:hi, lo:hi]
     bins = clr.bins()[lo:hi]
 
     if phasing_track is not None:
@@ -525,9 +948,18 @@ def eigs_trans(
     else:
         phasing_track_values = None
 
-    eigvals, eigvecs = trans_eig(
+    if sparse:
+        A = _fetch_trans_pixels(
+            clr, lo, hi, np.asarray(partition) - lo, clr_weight_name, chunksize
+        )
+        _trans_eig = trans_eig_sparse
+    else:
+        A = clr.matrix(balance=clr_weight_name)[lo:hi, lo:hi]
+        _trans_eig = trans_eig
+
+    eigvals, eigvecs = _trans_eig(
         A,
-        partition,
+        np.asarray(partition) - lo,
         n_eigs=n_eigs,
         phasing_track=phasing_track_values,
         sort_metric=sort_metric,
@@ -3,7 +3,6 @@ from collections import defaultdict
 from functools import partial
 
 import warnings
-import multiprocess as mp
 
 
 import numpy as np
@@ -1105,7 +1104,7 @@ def expected_cis(
 
     # execution details
     if nproc > 1:
-        pool = mp.Pool(nproc)
+        pool = numutils.get_mp_context().Pool(nproc)
         map_ = pool.map
     else:
         map_ = map
@@ -1251,7 +1250,7 @@ def expected_trans(
 
     # execution details
     if nproc > 1:
-        pool = mp.Pool(nproc)
+        pool = numutils.get_mp_context().Pool(nproc)
         map_ = pool.map
     else:
         map_ = map
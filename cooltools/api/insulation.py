@@ -1,6 +1,7 @@
 import re
 import logging
 import warnings
+from functools import partial
 import numpy as np
 import pandas as pd
 import cooler
@@ -52,6 +53,7 @@ def insul_diamond(
     ignore_diags=2,
     norm_by_median=True,
     clr_weight_name="weight",
+    prefetch=0,
 ):
     """
     Calculates the insulation score of a Hi-C interaction matrix.
@@ -77,6 +79,9 @@ def insul_diamond(
     clr_weight_name : str or None
         Name of balancing weight column from the cooler to use.
         Using raw unbalanced data is not supported for insulation.
+    prefetch : int
+        The number of chunks of pixels to read ahead in a background thread,
+        while the current chunk is being processed. 0 disables prefetching.
     """
     lo_bin_id = bins.index.min()
     hi_bin_id = bins.index.max() + 1
@@ -101,7 +106,7 @@ def insul_diamond(
         weight2 = clr_weight_name + "2"
         transform = lambda p: p["count"] * p[weight1] * p[weight2]
 
-    for chunk_dict in pixel_query.read_chunked():
+    for chunk_dict in pixel_query.read_chunked(prefetch=prefetch):
         chunk = pd.DataFrame(chunk_dict, columns=["bin1_id", "bin2_id", "count"])
         diag_pixels = chunk[chunk.bin2_id - chunk.bin1_id <= (window - 1) * 2]
 
@@ -159,6 +164,7 @@ def calculate_insulation_score(
     append_raw_scores=False,
     chunksize=20000000,
     clr_weight_name="weight",
+    prefetch=0,
     verbose=False,
 ):
     """Calculate the diamond insulation scores for all bins in a cooler.
@@ -187,6 +193,9 @@ def calculate_insulation_score(
     clr_weight_name : str or None
         Name of the column in the bin table with weight.
         Using unbalanced data with `None` will avoid masking "bad" pixels.
+    prefetch : int
+        The number of chunks of pixels to read ahead in a background thread,
+        overlapping I/O with computation. 0 disables prefetching.
     verbose : bool
         If True, report real-time progress.
 
@@ -248,8 +257,13 @@ def calculate_insulation_score(
 
     # XXX -- Use a delayed query executor
     nbins = len(clr.bins())
+    # only the band of the widest diamond is needed
     selector = CSRSelector(
-        clr.open("r"), shape=(nbins, nbins), field="count", chunksize=chunksize
+        clr.open("r"),
+        shape=(nbins, nbins),
+        field="count",
+        chunksize=chunksize,
+        max_diag=2 * window_bins.max() - 1,
     )
 
     ins_region_tables = []
@@ -284,6 +298,7 @@ def calculate_insulation_score(
                     window=win_bin,
                     ignore_diags=ignore_diags,
                     clr_weight_name=clr_weight_name,
+                    prefetch=prefetch,
                 )
                 ins_track[ins_track == 0] = np.nan
                 ins_track = np.log2(ins_track)
@@ -309,6 +324,30 @@ def calculate_insulation_score(
     return ins_table
 
 
+def _boundary_strength(track_mask, region_bounds):
+    """
+    Prominence of the local minima of an insulation track, calculated
+    independently within each region of a sorted bin table.
+
+    Parameters
+    ----------
+    track_mask : tuple of (numpy.array, numpy.array)
+        log2(insulation score) and the mask of bins to use in
+        boundary picking.
+    region_bounds : numpy.array
+        The boundaries of the regions in the arrays.
+    """
+    ins_track, mask = track_mask
+    bs_track = np.full(len(ins_track), np.nan)
+    for lo, hi in zip(region_bounds[:-1], region_bounds[1:]):
+        region_mask = mask[lo:hi]
+        poss, proms = peaks.find_peak_prominence(-ins_track[lo:hi][region_mask])
+        region_bs_track = np.full(region_mask.sum(), np.nan)
+        region_bs_track[poss] = proms
+        bs_track[lo:hi][region_mask] = region_bs_track
+    return bs_track
+
+
 def find_boundaries(
     ins_table,
     min_frac_valid_pixels=0.66,
@@ -316,6 +355,7 @@ def find_boundaries(
     log2_ins_key="log2_insulation_score_{WINDOW}",
     n_valid_pixels_key="n_valid_pixels_{WINDOW}",
     is_bad_bin_key="is_bad_bin",
+    nproc=1,
 ):
     """Call insulating boundaries.
 
@@ -342,6 +382,8 @@ def find_boundaries(
         the number of valid pixels per diamond. When a template
         containing `{WINDOW}` is provided, the calculation is repeated
         for all pairs of columns matching the template.
+    nproc : int
+        How many processes to use for calculation, one window per process.
 
     Returns
     -------
@@ -349,13 +391,21 @@ def find_boundaries(
         A bin table with appended columns with boundary prominences.
     """
 
+    # Sort the bins by region and start coordinate once for all windows,
+    # the output keeps the original order.
+    region_codes, _ = pd.factorize(ins_table["region"], sort=True)
+    order = np.lexsort((ins_table["start"].values, region_codes))
+    inv_order = np.argsort(order)
+    region_bounds = np.r_[
+        0, np.flatnonzero(np.diff(region_codes[order])) + 1, len(order)
+    ]
+
     if min_dist_bad_bin:
-        ins_table = pd.concat(
-            [
-                df.assign(dist_bad_bin=numutils.dist_to_mask(df[is_bad_bin_key]))
-                for region, df in ins_table.groupby("region")
-            ]
-        )
+        is_bad_bin = ins_table[is_bad_bin_key].values[order]
+        dist_bad_bin = np.zeros(len(order), dtype=np.int64)
+        for lo, hi in zip(region_bounds[:-1], region_bounds[1:]):
+            dist_bad_bin[lo:hi] = numutils.dist_to_mask(is_bad_bin[lo:hi])
+        ins_table = ins_table.assign(dist_bad_bin=dist_bad_bin[inv_order])
 
     if "{WINDOW}" in log2_ins_key:
         windows = set()
@@ -363,51 +413,44 @@ def find_boundaries(
             m = re.match(log2_ins_key.format(WINDOW=r"(\d+)"), col)
             if m:
                 windows.add(int(m.groups()[0]))
+        windows = sorted(windows)
     else:
-        windows = set([None])
-
-    min_valid_pixels = {
-        win: ins_table[n_valid_pixels_key.format(WINDOW=win)].max()
-        * min_frac_valid_pixels
-        for win in windows
-    }
-
-    dfs = []
-    index_name = ins_table.index.name  # Store the name of the index and soring order
-    sorting_order = ins_table.index.values
-    ins_table.index.name = "sorting_index"
-    ins_table.reset_index(drop=False, inplace=True)
-    for region, df in ins_table.groupby("region"):
-        df = df.sort_values(["start"])  # Force sorting by the bin start coordinate
-        for win in windows:
-            mask = (
-                df[n_valid_pixels_key.format(WINDOW=win)].values
-                >= min_valid_pixels[win]
-            )
+        windows = [None]
 
-            if min_dist_bad_bin:
-                mask &= df.dist_bad_bin.values >= min_dist_bad_bin
-
-            ins_track = df[log2_ins_key.format(WINDOW=win)].values[mask]
-            poss, proms = peaks.find_peak_prominence(-ins_track)
-            ins_prom_track = np.zeros_like(ins_track) * np.nan
-            ins_prom_track[poss] = proms
-
-            if win is not None:
-                bs_key = f"boundary_strength_{win}"
-            else:
-                bs_key = "boundary_strength"
-
-            df[bs_key] = np.nan
-            df.loc[mask, bs_key] = ins_prom_track
+    tasks = []
+    for win in windows:
+        n_valid_pixels = ins_table[n_valid_pixels_key.format(WINDOW=win)].values
+        mask = n_valid_pixels[order] >= n_valid_pixels.max() * min_frac_valid_pixels
+        if min_dist_bad_bin:
+            mask &= dist_bad_bin >= min_dist_bad_bin
+        ins_track = ins_table[log2_ins_key.format(WINDOW=win)].values[order]
+        tasks.append((ins_track, mask))
+
+    # execution details
+    if nproc > 1:
+        pool = numutils.get_mp_context().Pool(nproc)
+        map_ = pool.map
+    else:
+        map_ = map
 
-        dfs.append(df)
+    # using try-clause to close mp.Pool properly
+    try:
+        bs_tracks = list(
+            map_(partial(_boundary_strength, region_bounds=region_bounds), tasks)
+        )
+    finally:
+        if nproc > 1:
+            pool.close()
+
+    ins_table = ins_table.copy()
+    for win, bs_track in zip(windows, bs_tracks):
+        if win is not None:
+            bs_key = f"boundary_strength_{win}"
+        else:
+            bs_key = "boundary_strength"
+        ins_table[bs_key] = bs_track[inv_order]
 
-    df = pd.concat(dfs)
-    df = df.set_index("sorting_index")  # Restore original sorting order and name
-    df.index.name = index_name
-    df = df.loc[sorting_order, :]
-    return df
+    return ins_table
 
 
 def _insul_diamond_dense(mat, window=10, ignore_diags=2, norm_by_median=True):
@@ -587,6 +630,7 @@ def insulation(
     threshold="Li",
     append_raw_scores=False,
     chunksize=20000000,
+    prefetch=0,
     verbose=False,
 ):
     """Calculate the diamond insulation scores for all bins in a cooler.
@@ -619,6 +663,9 @@ def insulation(
     append_raw_scores : bool
         If True, append columns with raw scores (sum_counts, sum_balanced, n_pixels)
         to the output table.
+    prefetch : int
+        The number of chunks of pixels to read ahead in a background thread,
+        overlapping I/O with computation. 0 disables prefetching.
     verbose : bool
         If True, report real-time progress.
 
@@ -671,6 +718,7 @@ def insulation(
         append_raw_scores=append_raw_scores,
         clr_weight_name=clr_weight_name,
         chunksize=chunksize,
+        prefetch=prefetch,
         verbose=verbose,
     )
 
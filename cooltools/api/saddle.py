@@ -1,6 +1,5 @@
 from itertools import combinations
 from functools import partial
-from scipy.linalg import toeplitz
 from cytoolz import merge
 import numpy as np
 import pandas as pd
@@ -48,6 +47,7 @@ def _make_cis_obsexp_fetcher(
     clr_weight_name="weight",
     expected_value_col="balanced.avg",
     view_name_col="name",
+    dtype=np.float64,
 ):
     """
     Construct a function that returns intra-chromosomal OBS/EXP for symmetrical regions
@@ -69,6 +69,8 @@ def _make_cis_obsexp_fetcher(
         Name of the column in expected used for normalizing.
     view_name_col : str
         Name of column in view_df with region names.
+    dtype : numpy dtype
+        Dtype of the returned OBS/EXP matrices.
 
     Returns
     -------
@@ -76,7 +78,7 @@ def _make_cis_obsexp_fetcher(
 
     """
     expected = {
-        k: x.values
+        k: x.values.astype(dtype)
         for k, x in expected.groupby(["region1", "region2"])[expected_value_col]
     }
     view_df = view_df.set_index(view_name_col)
@@ -85,7 +87,9 @@ def _make_cis_obsexp_fetcher(
         reg1_coords = tuple(view_df.loc[reg1])
         reg2_coords = tuple(view_df.loc[reg2])
         obs_mat = clr.matrix(balance=clr_weight_name).fetch(reg1_coords, reg2_coords)
-        exp_mat = toeplitz(expected[reg1, reg2][: obs_mat.shape[0]])
+        obs_mat = obs_mat.astype(dtype, copy=False)
+        n = obs_mat.shape[0]
+        exp_mat = numutils.LazyToeplitz(expected[reg1, reg2][:n]).view((0, n), (0, n))
         return obs_mat / exp_mat
 
     return _fetch_cis_oe
@@ -98,6 +102,7 @@ def _make_trans_obsexp_fetcher(
     clr_weight_name="weight",
     expected_value_col="balanced.avg",
     view_name_col="name",
+    dtype=np.float64,
 ):
 
     """
@@ -122,6 +127,8 @@ def _make_trans_obsexp_fetcher(
         Name of the column in expected used for normalizing.
     view_name_col : str
         Name of column in view_df with region names.
+    dtype : numpy dtype
+        Dtype of the returned OBS/EXP matrices.
 
     Returns
     -----
@@ -132,6 +139,7 @@ def _make_trans_obsexp_fetcher(
     view_df = view_df.set_index(view_name_col)
 
     if np.isscalar(expected):
+        expected = np.dtype(dtype).type(expected)
 
         def _fetch_trans_oe(reg1, reg2):
             reg1_coords = tuple(view_df.loc[reg1])
@@ -139,6 +147,7 @@ def _make_trans_obsexp_fetcher(
             obs_mat = clr.matrix(balance=clr_weight_name).fetch(
                 reg1_coords, reg2_coords
             )
+            obs_mat = obs_mat.astype(dtype, copy=False)
             return obs_mat / expected
 
         return _fetch_trans_oe
@@ -146,7 +155,7 @@ def _make_trans_obsexp_fetcher(
     elif type(expected) is pd.core.frame.DataFrame:
 
         expected = {
-            k: x.values
+            k: x.values.astype(dtype)
             for k, x in expected.groupby(["region1", "region2"])[expected_value_col]
         }
 
@@ -170,6 +179,7 @@ def _make_trans_obsexp_fetcher(
             obs_mat = clr.matrix(balance=clr_weight_name).fetch(
                 reg1_coords, reg2_coords
             )
+            obs_mat = obs_mat.astype(dtype, copy=False)
             exp = _fetch_trans_exp(reg1, reg2)
             return obs_mat / exp
 
@@ -211,7 +221,7 @@ def _accumulate(
             col_mask = digitized[reg2] == j
             data = matrix[row_mask, :][:, col_mask]
             data = data[np.isfinite(data)]
-            S[i, j] += np.sum(data)
+            S[i, j] += np.sum(data, dtype=np.float64)
             C[i, j] += float(len(data))
 
 
@@ -347,6 +357,7 @@ def saddle(
     max_diag=-1,
     trim_outliers=False,
     verbose=False,
+    dtype=np.float64,
 ):
     """
     Get a matrix of average interactions between genomic bin
@@ -400,6 +411,10 @@ def saddle(
         Remove first and last row and column from the output matrix.
     verbose : bool, optional
         If True then reports progress.
+    dtype : numpy dtype, optional
+        Dtype of the OBS/EXP matrices of the regions. np.float32 halves their
+        memory footprint, the interaction sums are still accumulated
+        in float64.
     Returns
     -------
     interaction_sum : 2D array
@@ -504,6 +519,7 @@ def saddle(
             view_name_col=view_name_col,
             expected_value_col=expected_value_col,
             clr_weight_name=clr_weight_name,
+            dtype=dtype,
         )
     elif contact_type == "trans":
         # asymmetric inter-chromosomal regions :
@@ -524,6 +540,7 @@ def saddle(
             view_name_col=view_name_col,
             expected_value_col=expected_value_col,
             clr_weight_name=clr_weight_name,
+            dtype=dtype,
         )
     else:
         raise ValueError("Allowed values for contact_type are 'cis' or 'trans'.")
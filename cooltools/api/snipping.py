@@ -12,11 +12,9 @@ from ..lib.checks import (
 )
 from ..lib.common import assign_regions, make_cooler_view
 
-from ..lib.numutils import LazyToeplitz
+from ..lib.numutils import LazyToeplitz, get_mp_context
 import warnings
 
-import multiprocessing
-
 
 def expand_align_features(features_df, flank, resolution, format="bed"):
     """Short summary.
@@ -151,7 +149,7 @@ def make_bin_aligned_windows(
     return windows
 
 
-def _pileup(data_select, data_snip, arg):
+def _pileup(data_select, data_snip, arg, dtype=np.float64):
     support, feature_group = arg
     # return empty snippets if region is unannotated:
     if len(support) == 0:
@@ -162,7 +160,7 @@ def _pileup(data_select, data_snip, arg):
             assert (
                 s.max() == s.min()
             ), "Pileup accepts only the windows of the same size"
-            stack = np.full((s[0], s[0], len(feature_group)), np.nan)
+            stack = np.full((s[0], s[0], len(feature_group)), np.nan, dtype=dtype)
         else:  # off-diagonal off-region case:
             lo1 = feature_group["lo1"].values
             hi1 = feature_group["hi1"].values
@@ -176,7 +174,7 @@ def _pileup(data_select, data_snip, arg):
             assert (
                 s2.max() == s2.min()
             ), "Pileup accepts only the windows of the same size"
-            stack = np.full((s1[0], s2[0], len(feature_group)), np.nan)
+            stack = np.full((s1[0], s2[0], len(feature_group)), np.nan, dtype=dtype)
 
         return stack, feature_group["_rank"].values
 
@@ -203,7 +201,7 @@ def _pileup(data_select, data_snip, arg):
     return np.dstack(stack), feature_group["_rank"].values
 
 
-def pileup_legacy(features, data_select, data_snip, map=map):
+def pileup_legacy(features, data_select, data_snip, map=map, dtype=np.float64):
     """
     Handles on-diagonal and off-diagonal cases.
 
@@ -223,6 +221,10 @@ def pileup_legacy(features, data_select, data_snip, map=map):
         Callable that takes data, mask and a 2D bin span (lo1, hi1, lo2, hi2)
         and returns a snippet from the selected support region
 
+    dtype : numpy dtype
+        Dtype of the empty snippets of the features outside of the view
+        regions, should match the dtype of the snippets returned by
+        data_snip.
 
     """
     if features["region"].isnull().any():
@@ -240,7 +242,7 @@ def pileup_legacy(features, data_select, data_snip, map=map):
     # orig_rank = []
     cumul_stack, orig_rank = zip(
         *map(
-            partial(_pileup, data_select, data_snip),
+            partial(_pileup, data_select, data_snip, dtype=dtype),
             # Note that unannotated regions will form a separate group
             features.groupby("region", sort=False),
         )
@@ -296,7 +298,9 @@ def pair_sites(sites, separation, slop):
 
 
 class CoolerSnipper:
-    def __init__(self, clr, cooler_opts=None, view_df=None, min_diag=2):
+    def __init__(
+        self, clr, cooler_opts=None, view_df=None, min_diag=2, dtype=np.float64
+    ):
 
         # get chromosomes from cooler, if view_df not specified:
         if view_df is None:
@@ -337,6 +341,7 @@ class CoolerSnipper:
         else:
             self.clr_weight_name = "weight"
         self.min_diag = min_diag
+        self.dtype = dtype
 
     def select(self, region1, region2):
         region1_coords = self.view_df.loc[region1]
@@ -366,6 +371,7 @@ class CoolerSnipper:
             ).astype(bool)
         if self.cooler_opts["sparse"]:
             matrix = matrix.tocsr()
+        matrix = matrix.astype(self.dtype, copy=False)
         if self.min_diag is not None:
             diags = np.arange(np.diff(self.clr.extent(region1_coords)), dtype=np.int32)
             self.diag_indicators[region1] = LazyToeplitz(-diags, diags)
@@ -403,15 +409,19 @@ class CoolerSnipper:
             i1 = min(hi1, m)
             j0 = max(lo2, 0)
             j1 = min(hi2, n)
-            snippet = np.full((dm, dn), np.nan)
+            snippet = np.full((dm, dn), np.nan, dtype=self.dtype)
         #             snippet[pad_bottom:pad_top,
         #                     pad_left:pad_right] = matrix[i0:i1, j0:j1].toarray()
         else:
-            snippet = matrix[lo1:hi1, lo2:hi2].toarray().astype("float")
+            snippet = matrix[lo1:hi1, lo2:hi2].toarray()
             snippet[self._isnan1[lo1:hi1], :] = np.nan
             snippet[:, self._isnan2[lo2:hi2]] = np.nan
-        if self.min_diag is not None:
-            D = self.diag_indicators[region1][lo1:hi1, lo2:hi2] < self.min_diag
+        # out of bounds snippets are all NaNs, nothing to mask
+        if self.min_diag is not None and not out_of_bounds:
+            D = (
+                self.diag_indicators[region1].view((lo1, hi1), (lo2, hi2))
+                < self.min_diag
+            )
             snippet[D] = np.nan
         return snippet
 
@@ -425,6 +435,7 @@ class ObsExpSnipper:
         view_df=None,
         min_diag=2,
         expected_value_col="balanced.avg",
+        dtype=np.float64,
     ):
         self.clr = clr
         self.expected = expected
@@ -480,6 +491,7 @@ class ObsExpSnipper:
         else:
             self.clr_weight_name = "weight"
         self.min_diag = min_diag
+        self.dtype = dtype
 
     def select(self, region1, region2):
         if not region1 == region2:
@@ -497,6 +509,7 @@ class ObsExpSnipper:
         )
         if self.cooler_opts["sparse"]:
             matrix = matrix.tocsr()
+        matrix = matrix.astype(self.dtype, copy=False)
         if self.clr_weight_name:
             self._isnan1 = np.isnan(
                 self.clr.bins()[self.clr_weight_name].fetch(region1_coords).values
@@ -514,7 +527,7 @@ class ObsExpSnipper:
         self._expected = LazyToeplitz(
             self.expected.groupby(["region1", "region2"])
             .get_group((region1, region2))[self.expected_value_col]
-            .values
+            .values.astype(self.dtype)
         )
         if self.min_diag is not None:
             diags = np.arange(np.diff(self.clr.extent(region1_coords)), dtype=np.int32)
@@ -553,24 +566,33 @@ class ObsExpSnipper:
             i1 = min(hi1, m)
             j0 = max(lo2, 0)
             j1 = min(hi2, n)
-            return np.full((dm, dn), np.nan)
+            return np.full((dm, dn), np.nan, dtype=self.dtype)
         #             snippet[pad_bottom:pad_top,
         #                     pad_left:pad_right] = matrix[i0:i1, j0:j1].toarray()
         else:
-            snippet = matrix[lo1:hi1, lo2:hi2].toarray().astype("float")
+            snippet = matrix[lo1:hi1, lo2:hi2].toarray()
             snippet[self._isnan1[lo1:hi1], :] = np.nan
             snippet[:, self._isnan2[lo2:hi2]] = np.nan
 
-        e = self._expected[lo1:hi1, lo2:hi2]
+        e = self._expected.view((lo1, hi1), (lo2, hi2))
         if self.min_diag is not None:
-            D = self.diag_indicators[region1][lo1:hi1, lo2:hi2] < self.min_diag
+            D = (
+                self.diag_indicators[region1].view((lo1, hi1), (lo2, hi2))
+                < self.min_diag
+            )
             snippet[D] = np.nan
         return snippet / e
 
 
 class ExpectedSnipper:
     def __init__(
-        self, clr, expected, view_df=None, min_diag=2, expected_value_col="balanced.avg"
+        self,
+        clr,
+        expected,
+        view_df=None,
+        min_diag=2,
+        expected_value_col="balanced.avg",
+        dtype=np.float64,
     ):
         self.clr = clr
         self.expected = expected
@@ -611,6 +633,7 @@ class ExpectedSnipper:
         self.offsets = {}
         self.diag_indicators = {}
         self.min_diag = min_diag
+        self.dtype = dtype
 
     def select(self, region1, region2):
         if not region1 == region2:
@@ -628,7 +651,7 @@ class ExpectedSnipper:
         self._expected = LazyToeplitz(
             self.expected.groupby(["region1", "region2"])
             .get_group((region1, region2))[self.expected_value_col]
-            .values
+            .values.astype(self.dtype)
         )
         if self.min_diag is not None:
             diags = np.arange(np.diff(self.clr.extent(region1_coords)), dtype=np.int32)
@@ -647,11 +670,14 @@ class ExpectedSnipper:
         dm, dn = hi1 - lo1, hi2 - lo2
 
         if lo1 < 0 or lo2 < 0 or hi1 > self.m or hi2 > self.n:
-            return np.full((dm, dn), np.nan)
+            return np.full((dm, dn), np.nan, dtype=self.dtype)
 
         snippet = exp[lo1:hi1, lo2:hi2]
         if self.min_diag is not None:
-            D = self.diag_indicators[region1][lo1:hi1, lo2:hi2] < self.min_diag
+            D = (
+                self.diag_indicators[region1].view((lo1, hi1), (lo2, hi2))
+                < self.min_diag
+            )
             snippet[D] = np.nan
         return snippet
 
@@ -666,6 +692,7 @@ def pileup(
     min_diag="auto",
     clr_weight_name="weight",
     nproc=1,
+    dtype=np.float64,
 ):
     """
     Pileup features over the cooler.
@@ -697,6 +724,10 @@ def pileup(
         Allows start>end in the features (not implemented)
     nproc : str
         How many cores to use
+    dtype : numpy dtype
+        Dtype of the snippets, np.float32 halves the memory footprint of the
+        selected regions and of the stackup at the cost of ~1e-7 relative
+        rounding of the balanced and observed/expected values.
 
     Returns
     -------
@@ -802,6 +833,7 @@ def pileup(
             view_df=view_df,
             cooler_opts={"balance": clr_weight_name},
             min_diag=min_diag,
+            dtype=dtype,
         )
     else:
         snipper = ObsExpSnipper(
@@ -811,14 +843,17 @@ def pileup(
             cooler_opts={"balance": clr_weight_name},
             min_diag=min_diag,
             expected_value_col=expected_value_col,
+            dtype=dtype,
         )
 
     if nproc > 1:
-        pool = multiprocessing.Pool(nproc)
+        pool = get_mp_context().Pool(nproc)
         mymap = pool.map
     else:
         mymap = map
-    stack = pileup_legacy(features_df, snipper.select, snipper.snip, map=mymap)
+    stack = pileup_legacy(
+        features_df, snipper.select, snipper.snip, map=mymap, dtype=dtype
+    )
     if feature_type == "bed":
         stack = np.nansum([stack, np.transpose(stack, axes=(1, 0, 2))], axis=0)
 
@@ -48,6 +48,7 @@ from . import (
     expected_cis,
     expected_trans,
     insulation,
+    directionality,
     pileup,
     eigs_cis,
     eigs_trans,
@@ -0,0 +1,133 @@
+import click
+import cooler
+
+from . import cli
+from .. import api
+from ..lib.common import make_cooler_view
+from ..lib.io import read_viewframe_from_file
+
+
+@cli.command()
+@click.argument("in_path", metavar="IN_PATH", type=str, nargs=1)
+@click.argument("window", nargs=-1, metavar="WINDOW", type=int)
+@click.option(
+    "--output",
+    "-o",
+    help="Specify output file name to store the directionality in a tsv format.",
+    type=str,
+    required=False,
+)
+@click.option(
+    "--view",
+    "--regions",
+    help="Path to a BED file containing genomic regions "
+    "for which directionality scores will be calculated. Region names can "
+    "be provided in a 4th column.",
+    type=click.Path(exists=True),
+    required=False,
+)
+@click.option(
+    "--ignore-diags",
+    help="The number of diagonals to ignore. By default, equals"
+    " the number of diagonals ignored during IC balancing.",
+    type=int,
+    default=None,
+    show_default=True,
+)
+@click.option(
+    "--clr-weight-name",
+    help="Use balancing weight with this name. "
+    "Provide empty argument to calculate directionality on raw data.",
+    type=str,
+    default="weight",
+    show_default=True,
+)
+@click.option(
+    "--min-dist-bad-bin",
+    help="The minimal allowed distance to a bad bin. "
+    "Directionality of bins closer than this distance to a bad bin is masked.",
+    type=int,
+    default=2,
+    show_default=True,
+)
+@click.option(
+    "--window-pixels",
+    help="If set then the window sizes are provided in units of pixels.",
+    is_flag=True,
+)
+@click.option("--chunksize", help="", type=int, default=20000000, show_default=True)
+@click.option(
+    "--prefetch",
+    help="The number of chunks of pixels to read ahead in a background thread.",
+    type=int,
+    default=0,
+    show_default=True,
+)
+@click.option(
+    "--nproc",
+    "-p",
+    help="Number of processes to split the work between."
+    "[default: 1, i.e. no process pool]",
+    default=1,
+    type=int,
+)
+@click.option("--verbose", help="Report real-time progress.", is_flag=True)
+def directionality(
+    in_path,
+    window,
+    output,
+    view,
+    ignore_diags,
+    clr_weight_name,
+    min_dist_bad_bin,
+    window_pixels,
+    chunksize,
+    prefetch,
+    nproc,
+    verbose,
+):
+    """
+    Calculate the directionality ratio and the directionality index.
+
+    IN_PATH : The paths to a .cool file with a balanced Hi-C map.
+
+    WINDOW : The window size for the directionality calculations.
+             Multiple space-separated values can be provided.
+             By default, the window size must be provided in units of bp.
+             When the flag --window-pixels is set, the window sizes must
+             be provided in units of pixels instead.
+    """
+
+    clr = cooler.Cooler(in_path)
+
+    # Create view:
+    if view is None:
+        # full chromosomes:
+        view_df = make_cooler_view(clr)
+    else:
+        # read view_df dataframe, and verify against cooler
+        view_df = read_viewframe_from_file(view, clr, check_sorting=True)
+
+    # Read list with windows:
+    if window_pixels:
+        window = [win * clr.info["bin-size"] for win in window]
+
+    dir_table = api.directionality.directionality(
+        clr,
+        window_bp=window,
+        view_df=view_df,
+        balance=clr_weight_name if clr_weight_name else None,
+        min_dist_bad_bin=min_dist_bad_bin,
+        ignore_diags=ignore_diags,
+        chunksize=chunksize,
+        prefetch=prefetch,
+        nproc=nproc,
+        verbose=verbose,
+    )
+
+    # output to file if specified:
+    if output:
+        dir_table.to_csv(output, sep="\t", index=False, na_rep="nan")
+    # or print into stdout otherwise:
+    else:
+        print(dir_table.to_csv(sep="\t", index=False, na_rep="nan"))
@@ -1,4 +1,8 @@
+import os
 import os.path as op
+import json
+import shutil
+import tempfile
 from functools import partial
 import pandas as pd
 import numpy as np
@@ -85,6 +89,13 @@ logging.basicConfig(level=logging.INFO)
     default=6000000,
     show_default=True,
 )
+@click.option(
+    "--adaptive-tiling",
+    help="Use tiles that are smaller near the diagonal, when max-loci-separation"
+    " is below tile-size, and larger over unmappable regions.",
+    is_flag=True,
+    default=False,
+)
 @click.option(
     "--kernel-width",
     help="Outer half-width of the convolution kernel in pixels"
@@ -123,6 +134,37 @@ logging.basicConfig(level=logging.INFO)
     default=39000,
     show_default=True,
 )
+@click.option(
+    "--single-pass",
+    help="Convolve every tile only once: keep candidate pixels that can pass"
+    " the FDR thresholds on disk while building the histograms, and extract"
+    " the enriched pixels from them, instead of scoring all tiles again.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--dtype",
+    help="Floating point type of the convolved tiles: float32 halves"
+    " the memory footprint at the cost of ~1e-7 relative rounding errors.",
+    type=click.Choice(["float64", "float32"]),
+    default="float64",
+    show_default=True,
+)
+@click.option(
+    "--checkpoint",
+    help="Persist intermediate results of every stage and tile in the"
+    " out-prefix + '.checkpoints' directory, so that an interrupted run can be"
+    " resumed with --resume. The directory is removed once the run completes.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--resume",
+    help="Resume an interrupted --checkpoint run with the same parameters and"
+    " out-prefix, skipping the completed stages and tiles. Implies --checkpoint.",
+    is_flag=True,
+    default=False,
+)
 @click.option(
     "-v", "--verbose", help="Enable verbose output", is_flag=True, default=False
 )
@@ -144,11 +186,16 @@ def dots(
     max_loci_separation,
     max_nans_tolerated,
     tile_size,
+    adaptive_tiling,
     kernel_width,
     kernel_peak,
     num_lambda_chunks,
     fdr,
     dots_clustering_radius,
+    single_pass,
+    dtype,
+    checkpoint,
+    resume,
     verbose,
     out_prefix,
 ):
@@ -239,7 +286,13 @@ def dots(
     # list of tile coordinate ranges
     tiles = list(
         api.dotfinder.heatmap_tiles_generator_diag(
-            clr, view_df, w, tile_size_bins, loci_separation_bins
+            clr,
+            view_df,
+            w,
+            tile_size_bins,
+            loci_separation_bins,
+            clr_weight_name=clr_weight_name,
+            adaptive=adaptive_tiling,
         )
     )
 
@@ -261,20 +314,116 @@ def dots(
         )
     )
 
-    # 1. Calculate genome-wide histograms of scores.
-    gw_hist = api.dotfinder.scoring_and_histogramming_step(
-        clr,
-        expected.set_index(["region1", "region2", "dist"]),
-        expected_value_col,
-        clr_weight_name,
-        tiles,
-        kernels,
-        ledges,
-        max_nans_tolerated,
-        loci_separation_bins,
-        nproc,
-        verbose,
+    # with --checkpoint, results of every stage are persisted to resume from:
+    checkpoint = checkpoint or resume
+    checkpoint_dir = op.join(
+        op.dirname(out_prefix), op.basename(out_prefix) + ".checkpoints"
     )
+    params = dict(
+        cool_path=op.abspath(cool_path),
+        expected_path=op.abspath(expected_path),
+        expected_value_col=expected_value_col,
+        view=view,
+        clr_weight_name=clr_weight_name,
+        max_loci_separation=max_loci_separation,
+        max_nans_tolerated=max_nans_tolerated,
+        tile_size=tile_size,
+        adaptive_tiling=adaptive_tiling,
+        kernel_width=w,
+        kernel_peak=p,
+        num_lambda_chunks=num_lambda_chunks,
+        fdr=fdr,
+        single_pass=single_pass,
+        dtype=dtype,
+    )
+    params_path = op.join(checkpoint_dir, "params.json")
+    if not checkpoint:
+        checkpoint_dir = None
+    elif resume and op.exists(params_path):
+        with open(params_path) as f:
+            if json.load(f) != params:
+                raise ValueError(
+                    f"Cannot resume from {checkpoint_dir}, it was created"
+                    " with different parameters."
+                )
+    else:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        os.makedirs(checkpoint_dir)
+        with open(params_path, "w") as f:
+            json.dump(params, f)
+
+    def _checkpointed(stage, compute, keep_tiles=False):
+        # load the results of a stage completed earlier, or compute them with
+        # a directory for the tile-level checkpoints and persist them:
+        if checkpoint_dir is None:
+            return compute(None)
+        path = op.join(checkpoint_dir, f"{stage}.pkl")
+        if op.exists(path):
+            logging.info(f"Resuming with the {stage} stage completed earlier")
+            return pd.read_pickle(path)
+        result = compute(op.join(checkpoint_dir, stage))
+        pd.to_pickle(result, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if not keep_tiles:
+            shutil.rmtree(op.join(checkpoint_dir, stage), ignore_errors=True)
+        return result
+
+    enriched_path = op.join(
+        op.dirname(out_prefix), op.basename(out_prefix) + ".enriched.tsv"
+    )
+    if single_pass:
+        # candidates are spilled next to the output, unless the checkpointed
+        # tiles hold them:
+        spill_tmpdir, spill_dir = None, None
+        if checkpoint_dir is None:
+            spill_tmpdir = tempfile.TemporaryDirectory(
+                prefix=op.basename(out_prefix) + ".candidates.",
+                dir=op.dirname(op.abspath(out_prefix)),
+            )
+            spill_dir = spill_tmpdir.name
+        # 1. Calculate genome-wide histograms of scores, spilling candidates.
+        gw_hist, spill_paths = _checkpointed(
+            "histogramming",
+            lambda tiles_dir: api.dotfinder.scoring_histogramming_and_spilling_step(
+                clr,
+                expected.set_index(["region1", "region2", "dist"]),
+                expected_value_col,
+                clr_weight_name,
+                tiles,
+                kernels,
+                ledges,
+                fdr,
+                max_nans_tolerated,
+                loci_separation_bins,
+                spill_dir,
+                nproc,
+                verbose,
+                checkpoint_dir=tiles_dir,
+                dtype=dtype,
+            ),
+            # the tiles are the spilled candidates, until the extraction:
+            keep_tiles=True,
+        )
+    else:
+        # 1. Calculate genome-wide histograms of scores.
+        gw_hist = _checkpointed(
+            "histogramming",
+            lambda tiles_dir: api.dotfinder.scoring_and_histogramming_step(
+                clr,
+                expected.set_index(["region1", "region2", "dist"]),
+                expected_value_col,
+                clr_weight_name,
+                tiles,
+                kernels,
+                ledges,
+                max_nans_tolerated,
+                loci_separation_bins,
+                nproc,
+                verbose,
+                checkpoint_dir=tiles_dir,
+                dtype=dtype,
+            ),
+        )
 
     if verbose:
         logging.info("Done building histograms ...")
@@ -285,24 +434,46 @@ def dots(
     )
 
     # 3. Filter using FDR thresholds calculated in the histogramming step
-    filtered_pixels = api.dotfinder.scoring_and_extraction_step(
-        clr,
-        expected.set_index(["region1", "region2", "dist"]),
-        expected_value_col,
-        clr_weight_name,
-        tiles,
-        kernels,
-        ledges,
-        threshold_df,
-        max_nans_tolerated,
-        balance_factor,
-        loci_separation_bins,
-        op.join(op.dirname(out_prefix), op.basename(out_prefix) + ".enriched.tsv"),
-        nproc,
-        verbose,
-        bin1_id_name="bin1_id",
-        bin2_id_name="bin2_id",
-    )
+    if single_pass:
+        filtered_pixels = _checkpointed(
+            "extraction",
+            lambda tiles_dir: api.dotfinder.extraction_from_spill_step(
+                spill_paths,
+                kernels,
+                ledges,
+                threshold_df,
+                enriched_path,
+                verbose,
+                bin1_id_name="bin1_id",
+                bin2_id_name="bin2_id",
+            ),
+        )
+        if spill_tmpdir is not None:
+            spill_tmpdir.cleanup()
+    else:
+        filtered_pixels = _checkpointed(
+            "extraction",
+            lambda tiles_dir: api.dotfinder.scoring_and_extraction_step(
+                clr,
+                expected.set_index(["region1", "region2", "dist"]),
+                expected_value_col,
+                clr_weight_name,
+                tiles,
+                kernels,
+                ledges,
+                threshold_df,
+                max_nans_tolerated,
+                balance_factor,
+                loci_separation_bins,
+                enriched_path,
+                nproc,
+                verbose,
+                bin1_id_name="bin1_id",
+                bin2_id_name="bin2_id",
+                checkpoint_dir=tiles_dir,
+                dtype=dtype,
+            ),
+        )
 
     # 4. Post-processing
     if verbose:
@@ -310,7 +481,7 @@ def dots(
         logging.info("preparing to extract needed q-values ...")
 
     filtered_pixels_qvals = api.dotfinder.annotate_pixels_with_qvalues(
-        filtered_pixels, qvalues, kernels
+        filtered_pixels, qvalues, kernels, ledges=ledges
     )
     # 4a. clustering
     ########################################################################
@@ -325,6 +496,7 @@ def dots(
         view_df["name"],
         dots_clustering_radius,
         verbose,
+        nproc=nproc,
     )
 
     # 4b. filter by enrichment and qval
@@ -340,3 +512,222 @@ def dots(
         postprocessed_calls.to_csv(
             postprocessed_fname, sep="\t", header=True, index=False, compression=None
         )
+
+    # the run is complete, nothing to resume from:
+    if checkpoint_dir is not None:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+@cli.command()
+@click.argument(
+    "mcool_path",
+    metavar="MCOOL_PATH",
+    type=str,
+    nargs=1,
+)
+@click.option(
+    "--resolutions",
+    help="Comma-separated list of resolutions of MCOOL_PATH to call dots at,"
+    " e.g. 5000,10000,25000.",
+    type=str,
+    required=True,
+)
+@click.option(
+    "--expected",
+    help="Path to a tsv-like file with cis-expected at one of the resolutions,"
+    " in the order of '--resolutions'. Can be used multiple times. Expected is"
+    " calculated for the resolutions that are not provided.",
+    type=str,
+    multiple=True,
+)
+@click.option(
+    "--expected-value-col",
+    help="Name of the column of expected with the values to use.",
+    type=str,
+    default="balanced.avg",
+    show_default=True,
+)
+@click.option(
+    "--view",
+    "--regions",
+    help="Path to a BED file with the definition of viewframe (regions)."
+    " Dot-calling will be performed for these regions independently"
+    " e.g. chromosome arms.",
+    type=click.Path(exists=False, dir_okay=False),
+    default=None,
+    show_default=True,
+)
+@click.option(
+    "--clr-weight-name",
+    help="Use cooler balancing weight with this name.",
+    type=str,
+    default="weight",
+    show_default=True,
+)
+@click.option(
+    "-p",
+    "--nproc",
+    help="Number of processes to split the work between, shared by all of"
+    " the resolutions. [default: 1, i.e. no process pool]",
+    default=1,
+    type=int,
+)
+@click.option(
+    "--max-loci-separation",
+    help="Limit loci separation for dot-calling, i.e., do not call dots for"
+    " loci that are further than max_loci_separation basepair apart.",
+    type=int,
+    default=2000000,
+    show_default=True,
+)
+@click.option(
+    "--max-nans-tolerated",
+    help="Maximum number of NaNs tolerated in a footprint of every used filter.",
+    type=int,
+    default=1,
+    show_default=True,
+)
+@click.option(
+    "--tile-size",
+    help="Tile size for the Hi-C heatmap tiling, in basepairs.",
+    type=int,
+    default=6000000,
+    show_default=True,
+)
+@click.option(
+    "--num-lambda-chunks",
+    help="Number of log-spaced bins to divide your adjusted expected between.",
+    type=int,
+    default=45,
+    show_default=True,
+)
+@click.option(
+    "--fdr",
+    help="False discovery rate (FDR) to control in the multiple"
+    " hypothesis testing BH-FDR procedure.",
+    type=float,
+    default=0.02,
+    show_default=True,
+)
+@click.option(
+    "--dots-clustering-radius",
+    help="Radius for clustering dots that have been called too close to each other.",
+    type=int,
+    default=39000,
+    show_default=True,
+)
+@click.option(
+    "--merge-radius",
+    help="Drop dots called at a coarser resolution, that are within this distance"
+    " from the ones called at a finer resolution along both axes."
+    " [default: twice the coarser resolution]",
+    type=int,
+    default=None,
+)
+@click.option(
+    "--dtype",
+    help="Floating point type of the convolved tiles: float32 halves"
+    " the memory footprint at the cost of ~1e-7 relative rounding errors.",
+    type=click.Choice(["float64", "float32"]),
+    default="float64",
+    show_default=True,
+)
+@click.option(
+    "-v", "--verbose", help="Enable verbose output", is_flag=True, default=False
+)
+@click.option(
+    "-o",
+    "--out-prefix",
+    help="Specify prefix for the output files: dots called at every resolution"
+    " as prefix + '.<resolution>.postproc.bedpe', and merged ones as"
+    " prefix + '.merged.bedpe'",
+    type=str,
+    required=True,
+)
+def dots_multires(
+    mcool_path,
+    resolutions,
+    expected,
+    expected_value_col,
+    view,
+    clr_weight_name,
+    nproc,
+    max_loci_separation,
+    max_nans_tolerated,
+    tile_size,
+    num_lambda_chunks,
+    fdr,
+    dots_clustering_radius,
+    merge_radius,
+    dtype,
+    verbose,
+    out_prefix,
+):
+    """
+    Call dots at several resolutions of a multi-resolution Hi-C map at once,
+    and merge the calls: dots called at coarser resolutions are kept only
+    when they are not close to the dots called at finer ones.
+
+    MCOOL_PATH : The path to an .mcool file with balanced Hi-C maps.
+
+    """
+    resolutions = [int(res) for res in resolutions.split(",")]
+    if len(expected) > len(resolutions):
+        raise ValueError("More expected files provided than resolutions")
+    clrs = {
+        res: cooler.Cooler(f"{mcool_path}::resolutions/{res}") for res in resolutions
+    }
+
+    view_df = None
+    if view is not None:
+        view_df = read_viewframe_from_file(
+            view, clrs[resolutions[0]], check_sorting=True
+        )
+
+    expected_dfs = {
+        res: read_expected_from_file(
+            expected_path,
+            contact_type="cis",
+            expected_value_cols=[expected_value_col],
+            verify_view=view_df,
+            verify_cooler=clrs[res],
+        )
+        for res, expected_path in zip(resolutions, expected)
+    }
+
+    calls, merged_calls = api.dotfinder.dots_multires(
+        clrs,
+        expected=expected_dfs,
+        view_df=view_df,
+        expected_value_col=expected_value_col,
+        clr_weight_name=clr_weight_name,
+        max_loci_separation=max_loci_separation,
+        max_nans_tolerated=max_nans_tolerated,
+        tile_size=tile_size,
+        num_lambda_chunks=num_lambda_chunks,
+        fdr=fdr,
+        dots_clustering_radius=dots_clustering_radius,
+        merge_radius=merge_radius,
+        nproc=nproc,
+        verbose=verbose,
+        dtype=dtype,
+    )
+
+    for res, res_calls in calls.items():
+        res_calls.to_csv(
+            op.join(
+                op.dirname(out_prefix),
+                op.basename(out_prefix) + f".{res}.postproc.bedpe",
+            ),
+            sep="\t",
+            header=True,
+            index=False,
+            compression=None,
+        )
+    merged_calls.to_csv(
+        op.join(op.dirname(out_prefix), op.basename(out_prefix) + ".merged.bedpe"),
+        sep="\t",
+        header=True,
+        index=False,
+        compression=None,
+    )
@@ -52,6 +52,14 @@ from . import cli
     default=None,
     show_default=True,
 )
+@click.option(
+    "--nproc",
+    "-p",
+    help="Number of processes to split the work between."
+    "[default: 1, i.e. no process pool]",
+    default=1,
+    type=int,
+)
 @click.option(
     "-v", "--verbose", help="Enable verbose output", is_flag=True, default=False
 )
@@ -77,6 +85,7 @@ def eigs_cis(
     n_eigs,
     clr_weight_name,
     ignore_diags,
+    nproc,
     verbose,
     out_prefix,
     bigwig,
@@ -172,6 +181,7 @@ def eigs_cis(
         ignore_diags=ignore_diags,
         clip_percentile=99.9,
         sort_metric=None,
+        nproc=nproc,
     )
 
     # Output
@@ -43,6 +43,14 @@ from . import cli
     default="weight",
     show_default=True,
 )
+@click.option(
+    "--sparse",
+    help="Load only trans pixels and use a matrix-free eigensolver, "
+    "with memory proportional to the number of trans pixels. "
+    "Recommended for high resolutions.",
+    is_flag=True,
+    default=False,
+)
 @click.option(
     "-v", "--verbose", help="Enable verbose output", is_flag=True, default=False
 )
@@ -67,6 +75,7 @@ def eigs_trans(
     view,
     n_eigs,
     clr_weight_name,
+    sparse,
     verbose,
     out_prefix,
     bigwig,
@@ -164,6 +173,7 @@ def eigs_trans(
         clr_weight_name=clr_weight_name,
         partition=None,
         sort_metric=None,
+        sparse=sparse,
     )
 
     # Output
@@ -82,6 +82,13 @@ import bioframe
     is_flag=True,
 )
 @click.option("--chunksize", help="", type=int, default=20000000, show_default=True)
+@click.option(
+    "--prefetch",
+    help="The number of chunks of pixels to read ahead in a background thread.",
+    type=int,
+    default=0,
+    show_default=True,
+)
 @click.option("--verbose", help="Report real-time progress.", is_flag=True)
 @click.option(
     "--bigwig",
@@ -103,6 +110,7 @@ def insulation(
     window_pixels,
     append_raw_scores,
     chunksize,
+    prefetch,
     verbose,
     bigwig,
 ):
@@ -144,6 +152,7 @@ def insulation(
         threshold=threshold,
         append_raw_scores=append_raw_scores,
         chunksize=chunksize,
+        prefetch=prefetch,
         verbose=verbose,
     )
 
@@ -99,6 +99,14 @@ import h5py
     ),
     show_default=True,
 )
+@click.option(
+    "--dtype",
+    help="Floating point type of the snippets: float32 halves"
+    " the memory footprint at the cost of ~1e-7 relative rounding errors.",
+    type=click.Choice(["float64", "float32"]),
+    default="float64",
+    show_default=True,
+)
 @click.option(
     "-v", "--verbose", help="Enable verbose output", is_flag=True, default=False
 )
@@ -116,6 +124,7 @@ def pileup(
     nproc,
     ignore_diags,
     aggregate,
+    dtype,
     verbose,
 ):
     """
@@ -215,6 +224,7 @@ def pileup(
         min_diag=ignore_diags,
         clr_weight_name=clr_weight_name,
         nproc=nproc,
+        dtype=dtype,
     )
 
     ##### Aggregate the signal:
@@ -155,6 +155,14 @@ from . import cli
     "--vmax", help="High value of the saddleplot colorbar", type=float, default=2
 )
 @click.option("--hist-color", help="Face color of histogram bar chart")
+@click.option(
+    "--dtype",
+    help="Floating point type of the observed/expected matrices: float32 halves"
+    " the memory footprint at the cost of ~1e-7 relative rounding errors.",
+    type=click.Choice(["float64", "float32"]),
+    default="float64",
+    show_default=True,
+)
 @click.option(
     "-v", "--verbose", help="Enable verbose output", is_flag=True, default=False
 )
@@ -178,6 +186,7 @@ def saddle(
     vmin,
     vmax,
     hist_color,
+    dtype,
     verbose,
 ):
     """
@@ -317,6 +326,7 @@ def saddle(
         min_diag=min_diag,
         max_diag=max_diag,
         verbose=verbose,
+        dtype=dtype,
     )
     saddledata = S / C
 
@@ -1,10 +1,10 @@
-import multiprocess as mp
 import click
 
 import cooler
 
 from . import cli
 from .. import api
+from ..lib.numutils import get_mp_context
 
 
 @cli.command()
@@ -63,7 +63,7 @@ def random_sample(in_path, out_path, count, frac, exact, nproc, chunksize):
     """
 
     if nproc > 1:
-        pool = mp.Pool(nproc)
+        pool = get_mp_context().Pool(nproc)
         map_ = pool.map
     else:
         map_ = map
@@ -1,4 +1,6 @@
 from collections import defaultdict
+import queue
+import threading
 import numpy as np
 import pandas as pd
 
@@ -19,6 +21,58 @@ def arg_prune_partition(seq, step):
     return np.unique(np.searchsorted(seq, cuts))
 
 
+def prefetch_iter(iterable, n):
+    """
+    Iterate over ``iterable`` in a background thread that keeps up to ``n``
+    items ready ahead of the consumer. Useful to overlap I/O with compute:
+    h5py releases the GIL while reading and decompressing data.
+
+    Exceptions raised by the producer are re-raised in the consumer.
+
+    """
+    if n < 1:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=n)
+    stop = threading.Event()
+    done = object()
+
+    def _put(item):
+        # give up once the consumer has stopped listening
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except BaseException as e:
+            _put((done, e))
+        else:
+            _put((done, None))
+
+    thread = threading.Thread(target=_produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
 class CSRSelector(_IndexingMixin):
     """
     Instantiates 2D range queries.
@@ -28,13 +82,17 @@ class CSRSelector(_IndexingMixin):
     >>> selector = CSRSelector(h5, (100, 100), 'count', 10000)
     >>> query = selector[lo1:hi1, lo2:hi2]
 
+    If ``max_diag`` is provided, queries only return the pixels of the upper
+    diagonal band ``bin2_id - bin1_id < max_diag``.
+
     """
 
-    def __init__(self, grp, shape, field, chunksize):
+    def __init__(self, grp, shape, field, chunksize, max_diag=None):
         self.grp = grp
         self.shape = shape
         self.field = field
         self.chunksize = chunksize
+        self.max_diag = max_diag
         self.offset_selector = grp["indexes"]["bin1_offset"]
         self.bin1_selector = grp["pixels"]["bin1_id"]
         self.bin2_selector = grp["pixels"]["bin2_id"]
@@ -48,6 +106,7 @@ class CSRSelector(_IndexingMixin):
         bin2_selector = self.bin2_selector
         data_selector = self.data_selector
         field = self.field
+        max_diag = self.max_diag
         i0, i1 = ispan
         j0, j1 = jspan
 
@@ -66,10 +125,6 @@ class CSRSelector(_IndexingMixin):
         # let's take the downsampled subset of pixel id offsets [o0, ...., o1]
         # each successive pair corresponds to a "piece" of the query
         def getchunk(chunk_id, include_index=False):
-            out = {"bin1_id": [], "bin2_id": [], field: []}
-            if include_index:
-                out["__index"] = []
-
             # extract a chunk of on-disk rows
             oi, of = loc_pruned_offsets[chunk_id], loc_pruned_offsets[chunk_id + 1]
             p0, p1 = offsets[oi], offsets[of]
@@ -77,43 +132,25 @@ class CSRSelector(_IndexingMixin):
 
             bin2_extracted = bin2_selector[slc]
             data_extracted = data_selector[slc]
+
+            # expand the row offsets into the row id of every pixel
+            bin1_extracted = np.repeat(
+                np.arange(i0 + oi, i0 + of, dtype=bin1_selector.dtype),
+                np.diff(offsets[oi : of + 1]),
+            )
+
+            # filter for the range of j values we want, and the band
+            mask = (bin2_extracted >= j0) & (bin2_extracted < j1)
+            if max_diag is not None:
+                mask &= bin2_extracted - bin1_extracted < max_diag
+
+            out = {
+                "bin1_id": bin1_extracted[mask],
+                "bin2_id": bin2_extracted[mask],
+                field: data_extracted[mask],
+            }
             if include_index:
-                ind_extracted = np.arange(slc.start, slc.stop)
-
-            # go row by row and filter
-            for i in range(oi, of):
-                # correct the offsets
-                lo = offsets[i] - p0
-                hi = offsets[i + 1] - p0
-
-                # this row
-                bin2 = bin2_extracted[lo:hi]
-
-                # filter for the range of j values we want
-                mask = (bin2 >= j0) & (bin2 < j1)
-                cols = bin2[mask]
-
-                # apply same mask for data
-                data = data_extracted[lo:hi][mask]
-
-                # shortcut for row data
-                rows = np.full(len(cols), i0 + i, dtype=bin1_selector.dtype)
-
-                out["bin1_id"].append(rows)
-                out["bin2_id"].append(cols)
-                out[field].append(data)
-                if include_index:
-                    out["__index"].append(ind_extracted[lo:hi][mask])
-
-            if len(out):
-                for k in out.keys():
-                    out[k] = np.concatenate(out[k], axis=0)
-            else:
-                out["bin1_id"] = np.array([], dtype=bin1_selector.dtype)
-                out["bin2_id"] = np.array([], dtype=bin2_selector.dtype)
-                out[field] = np.array([], dtype=data_selector.dtype)
-                if include_index:
-                    out["__index"] = np.array([], dtype=np.int64)
+                out["__index"] = np.arange(p0, p1, dtype=np.int64)[mask]
 
             return out
 
@@ -148,14 +185,19 @@ class RangeQuery(object):
             raise IndexError(i)
         return self._getchunk(i, include_index)
 
-    def read_chunked(self, include_index=False):
-        """Iterator over chunks (as dictionaries)."""
-        for i in range(self.n_chunks):
-            yield self._getchunk(i, include_index)
+    def read_chunked(self, include_index=False, prefetch=0):
+        """
+        Iterator over chunks (as dictionaries).
+
+        If ``prefetch`` > 0, up to that many chunks are read ahead of the
+        consumer in a background thread.
+        """
+        chunks = (self._getchunk(i, include_index) for i in range(self.n_chunks))
+        return prefetch_iter(chunks, prefetch)
 
-    def read(self, include_index=False):
+    def read(self, include_index=False, prefetch=0):
         """Read the complete range query as a dictionary"""
-        result = list(self.read_chunked(include_index))
+        result = list(self.read_chunked(include_index, prefetch))
         return {
             k: np.concatenate([d[k] for d in result], axis=0)
             for k in ["bin1_id", "bin2_id", self.field]
@@ -1,14 +1,18 @@
 import warnings
-from scipy.linalg import toeplitz
 import scipy.sparse.linalg
 import scipy.interpolate
 from scipy.ndimage.interpolation import zoom
 import scipy.ndimage.filters
 import numpy as np
+import pandas as pd
 import numba
+import multiprocess as mp
 import cooler
-from functools import partial
+from cooler.tools import split
+from functools import partial, lru_cache
+from operator import add
 
+from ._query import CSRSelector
 from ._numutils import (
     iterative_correction_symmetric as _iterative_correction_symmetric,
     observed_over_expected as _observed_over_expected,
@@ -18,6 +22,31 @@ from ._numutils import (
 )
 
 
+def get_mp_context():
+    """
+    Get the multiprocess context to create the process pools of cooltools.
+
+    Forking a process, in which a parallel numba kernel has already started
+    the threads of the TBB or OpenMP threading layers, is unsafe: with TBB the
+    parent process hangs at exit, and with GNU OpenMP the forked workers abort.
+    Pools are forked, as usual, unless that is the case, and then the workers
+    are spawned instead. The threading layer itself is left to the user.
+
+    Returns
+    -------
+    context : multiprocess context
+    """
+    context = mp.get_context()
+    try:
+        layer = numba.threading_layer()
+    except ValueError:
+        # no parallel numba kernels have run in this process yet
+        return context
+    if layer != "workqueue" and context.get_start_method() == "fork":
+        context = mp.get_context("spawn")
+    return context
+
+
 def get_diag(arr, i=0):
     """Get the i-th diagonal of a matrix.
     This solution was borrowed from
@@ -199,33 +228,107 @@ def fill_nainf(arr, value=0, copy=True):
     return arr
 
 
-def interp_nan(a_init, pad_zeros=True, method="linear", verbose=False):
-    """Linearly interpolate to fill NaN rows and columns in a matrix.
-    Also interpolates NaNs in 1D arrays.
+@numba.njit
+def _interp_nan_1d(v, pad_zeros):
+    """
+    Linearly interpolate NaNs of a 1D array in place, between the nearest
+    non-NaN elements, or zeros past the edges if `pad_zeros`. Returns the
+    number of NaNs found.
+    """
+    n = len(v)
+    n_nans = 0
+    lo = -1
+    i = 0
+    while i < n:
+        if not np.isnan(v[i]):
+            lo = i
+            i += 1
+            continue
+        hi = i
+        while hi < n and np.isnan(v[hi]):
+            hi += 1
+        n_nans += hi - i
+        if pad_zeros or (lo >= 0 and hi < n):
+            y_lo = v[lo] if lo >= 0 else 0.0
+            y_hi = v[hi] if hi < n else 0.0
+            slope = (y_hi - y_lo) / (hi - lo)
+            for k in range(i, hi):
+                v[k] = slope * (k - lo) + y_lo
+        i = hi
+    return n_nans
 
-    Parameters
-    ----------
-    a_init : np.array
 
-    pad_zeros : bool, optional
-        If True, pads the matrix with zeros to fill NaNs at the edges.
-        By default, True.
+@numba.njit
+def _nan_counts(a):
+    n_nans_by_row = np.zeros(a.shape[0], dtype=np.int64)
+    n_nans_by_col = np.zeros(a.shape[1], dtype=np.int64)
+    for i in range(a.shape[0]):
+        for j in range(a.shape[1]):
+            if np.isnan(a[i, j]):
+                n_nans_by_row[i] += 1
+                n_nans_by_col[j] += 1
+    return n_nans_by_row, n_nans_by_col
 
-    method : str, optional
-        For 2D: "linear", "nearest", or "splinef2d"
-        For 1D: "linear", "nearest", "zero", "slinear", "quadratic", "cubic"
 
-    Returns
-    -------
-    array with NaNs linearly interpolated
+@numba.njit
+def _interp_grid(isbad):
+    """
+    For each index, the nearest good indices below and above it (-1 and n
+    past the edges) and the weight of the upper one.
+    """
+    n = len(isbad)
+    lo = np.empty(n, dtype=np.int64)
+    hi = np.empty(n, dtype=np.int64)
+    prev = -1
+    for k in range(n):
+        if not isbad[k]:
+            prev = k
+        lo[k] = prev
+    next_ = n
+    for k in range(n - 1, -1, -1):
+        if not isbad[k]:
+            next_ = k
+        hi[k] = next_
+    w = np.zeros(n)
+    for k in range(n):
+        if isbad[k]:
+            w[k] = (k - lo[k]) / (hi[k] - lo[k])
+    return lo, hi, w
+
+
+@numba.njit
+def _padded_value(a, i, j):
+    if i < 0 or j < 0 or i >= a.shape[0] or j >= a.shape[1]:
+        return 0.0
+    return a[i, j]
 
-    Notes
-    -----
-    1D case adapted from: https://stackoverflow.com/a/39592604
-    2D case assumes that entire rows or columns are masked & edges to be
-    NaN-free, but is much faster than griddata implementation.
 
+@numba.njit(parallel=True)
+def _interp_nan_2d(a, row_lo, row_hi, row_w, col_lo, col_hi, col_w):
     """
+    Bilinearly interpolate NaNs of a 2D array in place, between the nearest
+    good rows and columns. Returns the number of NaNs in the good rows and
+    columns, which are left as is.
+    """
+    n_extra = 0
+    for i in numba.prange(a.shape[0]):
+        i0, i1, wi = row_lo[i], row_hi[i], row_w[i]
+        for j in range(a.shape[1]):
+            if not np.isnan(a[i, j]):
+                continue
+            j0, j1, wj = col_lo[j], col_hi[j], col_w[j]
+            if wi == 0 and wj == 0:
+                n_extra += 1
+                continue
+            a[i, j] = (1 - wi) * (
+                (1 - wj) * _padded_value(a, i0, j0) + wj * _padded_value(a, i0, j1)
+            ) + wi * (
+                (1 - wj) * _padded_value(a, i1, j0) + wj * _padded_value(a, i1, j1)
+            )
+    return n_extra
+
+
+def _interp_nan_scipy(a_init, pad_zeros=True, method="linear", verbose=False):
     shape = np.shape(a_init)
     if pad_zeros:
         a = np.zeros(tuple(s + 2 for s in shape))
@@ -278,6 +381,81 @@ def interp_nan(a_init, pad_zeros=True, method="linear", verbose=False):
     return a
 
 
+def interp_nan(a_init, pad_zeros=True, method="linear", verbose=False, copy=True):
+    """Linearly interpolate to fill NaN rows and columns in a matrix.
+    Also interpolates NaNs in 1D arrays.
+
+    Parameters
+    ----------
+    a_init : np.array
+
+    pad_zeros : bool, optional
+        If True, pads the matrix with zeros to fill NaNs at the edges.
+        By default, True.
+
+    method : str, optional
+        For 2D: "linear", "nearest", or "splinef2d"
+        For 1D: "linear", "nearest", "zero", "slinear", "quadratic", "cubic"
+
+    copy : bool, optional
+        If True, creates a copy of a_init, otherwise fills NaNs in-place.
+        By default, True.
+
+    Returns
+    -------
+    array with NaNs linearly interpolated
+
+    Notes
+    -----
+    1D case adapted from: https://stackoverflow.com/a/39592604
+    2D case assumes that entire rows or columns are masked & edges to be
+    NaN-free, but is much faster than griddata implementation.
+
+    Linear interpolation is done by numba kernels in a single pass over the
+    array (in parallel over rows for 2D), other methods use scipy.interpolate.
+
+    """
+    if method != "linear":
+        a = _interp_nan_scipy(a_init, pad_zeros, method, verbose)
+        if not copy and a is not a_init:
+            a_init[...] = np.reshape(a, np.shape(a_init))
+            return a_init
+        return a
+
+    a = np.array(a_init, dtype=float) if copy else a_init
+    if a.ndim == 2 and (a.shape[0] == 1 or a.shape[1] == 1):
+        v = a[0] if a.shape[0] == 1 else a[:, 0]
+    else:
+        v = a
+
+    if v.ndim == 1:
+        if verbose:
+            print("interpolating 1D vector")
+        if _interp_nan_1d(v, pad_zeros) == 0 and verbose:
+            print("no nans to interpolate")
+        return a
+
+    n_nans_by_row, n_nans_by_col = _nan_counts(a)
+    if n_nans_by_row.sum() == 0:
+        if verbose:
+            print("no nans to interpolate")
+        return a
+
+    if verbose:
+        print("interpolating 2D matrix")
+    if not pad_zeros:
+        if np.isnan(a[:, [0, -1]]).any() or np.isnan(a[[0, -1], :]).any():
+            raise ValueError("Edges must not have NaNs")
+    # Rows/cols to be considered fully null may have non-NaN diagonals
+    # so we'll take the maximum NaN count to identify them
+    row_lo, row_hi, row_w = _interp_grid(n_nans_by_row == n_nans_by_row.max())
+    col_lo, col_hi, col_w = _interp_grid(n_nans_by_col == n_nans_by_col.max())
+    if _interp_nan_2d(a, row_lo, row_hi, row_w, col_lo, col_hi, col_w) > 0:
+        raise AssertionError("Found additional NaNs")
+
+    return a
+
+
 def slice_sorted(arr, lo, hi):
     """Get the subset of a sorted array with values >=lo and <hi.
     A faster version of arr[(arr>=lo) & (arr<hi)]
@@ -428,7 +606,114 @@ def is_symmetric(mat):
     return maxDiff < stochastic_sd(mat) * 1e-7 + 1e-5
 
 
-def get_eig(mat, n=3, mask_zero_rows=False, subtract_mean=False, divide_by_mean=False):
+def _eig_init_block(n_rows, k, v0=None, seed=0):
+    """
+    Build a starting block of `k` orthonormal columns for iterative
+    eigensolvers. Rows of `v0` (initial guesses for the eigenvectors) are used
+    as the leading columns, the rest is filled with random vectors.
+    """
+    X = np.random.RandomState(seed).standard_normal((n_rows, k))
+    if v0 is not None:
+        v0 = np.nan_to_num(np.atleast_2d(v0))[:k]
+        good = np.linalg.norm(v0, axis=1) > 0
+        X[:, : good.sum()] = v0[good].T
+    Q, _ = np.linalg.qr(X)
+    return Q
+
+
+def _rayleigh_ritz(mat, Q, n):
+    """
+    Rayleigh-Ritz projection of a symmetric `mat` onto the orthonormal basis
+    `Q`, returns `n` Ritz pairs with the largest absolute Ritz values, their
+    residual norms and the product `mat @ Q`.
+    """
+    Z = mat @ Q
+    T = Q.T @ Z
+    _eigvals, S = np.linalg.eigh((T + T.T) / 2)
+    order = np.argsort(-np.abs(_eigvals))[:n]
+    _eigvals, S = _eigvals[order], S[:, order]
+    _eigvecs = Q @ S
+    residuals = np.linalg.norm(Z @ S - _eigvecs * _eigvals, axis=0)
+    return _eigvals, _eigvecs, residuals, Z
+
+
+def _eigsh_randomized(mat, n, v0=None, oversample=10, tol=1e-6, max_iter=1000):
+    """
+    Top-`n` (by absolute value) eigenpairs of a symmetric matrix using
+    randomized block subspace iteration with Rayleigh-Ritz acceleration.
+    Rows of `v0` are used as a warm start. Returns the eigenvalues, the
+    eigenvectors (in columns) and the number of iterations, and warns if the
+    residuals did not reach `tol` relative to the largest eigenvalue.
+    """
+    n_rows = mat.shape[0]
+    k = min(n + oversample, n_rows)
+    Q = _eig_init_block(n_rows, k, v0)
+    for n_iter in range(1, max_iter + 1):
+        _eigvals, _eigvecs, residuals, Z = _rayleigh_ritz(mat, Q, n)
+        rel_residual = np.max(residuals) / np.abs(_eigvals[0])
+        if rel_residual <= tol:
+            break
+        Q, _ = np.linalg.qr(Z)
+    else:
+        warnings.warn(
+            f"The randomized eigensolver did not converge in {max_iter} "
+            f"iterations, the largest relative residual is {rel_residual:.2g}"
+        )
+    return _eigvals, _eigvecs, n_iter
+
+
+def _eigsh_lobpcg(mat, n, v0=None, tol=1e-6, max_iter=1000):
+    """
+    Top-`n` (by absolute value) eigenpairs of a symmetric matrix using LOBPCG.
+
+    LOBPCG finds the algebraically largest eigenvalues, so it is applied to
+    `mat @ mat`, whose dominant invariant subspace is that of the
+    largest-magnitude eigenvalues of `mat`. The eigenpairs of `mat` are then
+    recovered by a Rayleigh-Ritz projection. Rows of `v0` are used as a warm
+    start. Returns the eigenvalues, the eigenvectors (in columns) and the
+    number of iterations; lobpcg warns if it did not converge.
+    """
+    n_rows = mat.shape[0]
+    k = min(n + 2, n_rows)
+    # lobpcg is not designed for small problems
+    if n_rows < 5 * k:
+        _eigvals, _eigvecs = np.linalg.eigh(mat)
+        order = np.argsort(-np.abs(_eigvals))[:n]
+        return _eigvals[order], _eigvecs[:, order], 0
+
+    mat2 = scipy.sparse.linalg.LinearOperator(
+        (n_rows, n_rows),
+        matvec=lambda x: mat @ (mat @ x),
+        matmat=lambda X: mat @ (mat @ X),
+        dtype=mat.dtype,
+    )
+    X = _eig_init_block(n_rows, k, v0)
+    # lobpcg tolerance is absolute, scale it by the largest eigenvalue of
+    # mat @ mat, estimated from below by the Rayleigh quotients of the
+    # starting block
+    _eigvals, _, _, _ = _rayleigh_ritz(mat, X, 1)
+    _, X, residuals_history = scipy.sparse.linalg.lobpcg(
+        mat2,
+        X,
+        tol=tol * _eigvals[0] ** 2,
+        maxiter=max_iter,
+        largest=True,
+        retResidualNormsHistory=True,
+    )
+    Q, _ = np.linalg.qr(X)
+    _eigvals, _eigvecs, _, _ = _rayleigh_ritz(mat, Q, n)
+    return _eigvals, _eigvecs, len(residuals_history)
+
+
+def get_eig(
+    mat,
+    n=3,
+    mask_zero_rows=False,
+    subtract_mean=False,
+    divide_by_mean=False,
+    solver="arpack",
+    v0=None,
+):
     """Perform an eigenvector decomposition.
 
     Parameters
@@ -450,6 +735,24 @@ def get_eig(mat, n=3, mask_zero_rows=False, subtract_mean=False, divide_by_mean=
     divide_by_mean : bool
         If True, divide the matrix by its mean.
 
+    solver : str
+        Eigensolver to use:
+        'arpack' - implicitly restarted Lanczos/Arnoldi (scipy eigsh/eigs),
+        'lobpcg' - block LOBPCG, symmetric matrices only,
+        'randomized' - randomized block subspace iteration, symmetric matrices
+        only.
+        The block solvers make the most of a good initial guess `v0`. Without
+        one, subspace iteration converges slowly when the leading eigenvalues
+        are poorly separated from the rest of the spectrum, prefer 'arpack'
+        or 'lobpcg' for cold starts. Both block solvers warn if they do not
+        converge.
+
+    v0 : np.ndarray, optional
+        Initial guess for the eigenvectors (in rows, or a single vector), e.g.
+        eigenvectors computed at a coarser resolution. NaNs are treated as
+        zeros. 'arpack' uses the sum of the provided vectors as its starting
+        vector.
+
     Returns
     -------
     eigvecs : np.ndarray
@@ -460,6 +763,9 @@ def get_eig(mat, n=3, mask_zero_rows=False, subtract_mean=False, divide_by_mean=
         An array of sorted eigenvalues.
 
     """
+    if solver not in ("arpack", "lobpcg", "randomized"):
+        raise ValueError("Unknown eigensolver: {}".format(solver))
+
     symmetric = is_symmetric(mat)
     if (
         symmetric
@@ -476,6 +782,10 @@ def get_eig(mat, n=3, mask_zero_rows=False, subtract_mean=False, divide_by_mean=
         warnings.warn(
             "Number n of requested eigenvalues is larger than the matrix size."
         )
+    if v0 is not None:
+        v0 = np.atleast_2d(v0)
+        if v0.shape[1] != n_rows:
+            raise ValueError("Initial vectors do not match the size of the matrix")
 
     if mask_zero_rows:
         if not is_symmetric(mat):
@@ -489,6 +799,8 @@ def get_eig(mat, n=3, mask_zero_rows=False, subtract_mean=False, divide_by_mean=
             mask_zero_rows=False,
             subtract_mean=subtract_mean,
             divide_by_mean=divide_by_mean,
+            solver=solver,
+            v0=None if v0 is None else v0[:, mask],
         )
         eigvecs = np.full((n, n_rows), np.nan)
         for i in range(n):
@@ -510,14 +822,31 @@ def get_eig(mat, n=3, mask_zero_rows=False, subtract_mean=False, divide_by_mean=
         if divide_by_mean:
             mat /= mean
 
+        if solver != "arpack" and not symmetric:
+            raise ValueError(
+                "The {} eigensolver works only with symmetric matrices".format(solver)
+            )
+
+        # ARPACK takes a single starting vector
+        _v0 = None
+        if solver == "arpack" and v0 is not None:
+            _v0 = np.nan_to_num(v0).sum(axis=0)
+            if not np.any(_v0):
+                _v0 = None
+
         if symmetric:
             # adjust requested number of eigvals for "eigsh"
             _n = n if n < n_rows else (n_rows - 1)
-            _eigvals, _eigvecs = scipy.sparse.linalg.eigsh(mat, _n)
+            if solver == "lobpcg":
+                _eigvals, _eigvecs, _ = _eigsh_lobpcg(mat, _n, v0=v0)
+            elif solver == "randomized":
+                _eigvals, _eigvecs, _ = _eigsh_randomized(mat, _n, v0=v0)
+            else:
+                _eigvals, _eigvecs = scipy.sparse.linalg.eigsh(mat, _n, v0=_v0)
         else:
             # adjust requested number of eigvals for "eigs"
             _n = n if n < (n_rows - 1) else (n_rows - 2)
-            _eigvals, _eigvecs = scipy.sparse.linalg.eigs(mat, _n)
+            _eigvals, _eigvecs = scipy.sparse.linalg.eigs(mat, _n, v0=_v0)
 
         # reorder according to eigvals and copy into output arrays
         order = np.argsort(-np.abs(_eigvals))
@@ -562,8 +891,77 @@ def _logbins_numba(lo, hi, ratio=0, N=0, prepend_zero=False):
 
 
 @numba.njit
+def _is_valid_pixel(i, j, mask1d, mask2d):
+    # pixel (i, j) is valid when mask1d[i] and mask1d[j] are set, or when
+    # mask2d[i, j] is set; all pixels are valid if both masks are empty
+    if mask1d.size > 0:
+        return mask1d[i] and mask1d[j]
+    elif mask2d.size > 0:
+        return mask2d[i, j]
+    return True
+
+
+@numba.njit
+def _diag_sum(matrix, mask1d, mask2d, offset):
+    s = 0.0
+    c = 0
+    for j in range(matrix.shape[0] - offset):
+        if _is_valid_pixel(offset + j, j, mask1d, mask2d):
+            s += matrix[offset + j, j]
+            c += 1
+    return s, c
+
+
+@numba.njit
+def _divide_diag(matrix, mask1d, mask2d, offset, mean_pixel, out):
+    for j in range(matrix.shape[0] - offset):
+        i = offset + j
+        if _is_valid_pixel(i, j, mask1d, mask2d):
+            out[i, j] = matrix[i, j] / mean_pixel
+            if offset > 0:
+                out[j, i] = matrix[j, i] / mean_pixel
+        else:
+            out[i, j] = matrix[i, j]
+            out[j, i] = matrix[j, i]
+
+
+@numba.njit(parallel=True)
+def _diag_sums(matrix, mask1d, mask2d):
+    """
+    Sum and count valid pixels on each lower diagonal of a square matrix.
+    """
+    N = matrix.shape[0]
+    sums = np.zeros(N, dtype=np.float64)
+    counts = np.zeros(N, dtype=np.int64)
+    # pair short and long diagonals to balance the load between threads
+    for k in numba.prange((N + 1) // 2):
+        sums[k], counts[k] = _diag_sum(matrix, mask1d, mask2d, k)
+        if N - 1 - k != k:
+            sums[N - 1 - k], counts[N - 1 - k] = _diag_sum(
+                matrix, mask1d, mask2d, N - 1 - k
+            )
+    return sums, counts
+
+
+@numba.njit(parallel=True)
+def _divide_diags(matrix, mask1d, mask2d, diag_means, out):
+    """
+    Write `matrix` divided by `diag_means[i - j]` into `out`, for valid pixels
+    (i, j) of the lower triangle and their mirror images. Other pixels are
+    copied as is. `out` can be `matrix` itself.
+    """
+    N = matrix.shape[0]
+    for k in numba.prange((N + 1) // 2):
+        _divide_diag(matrix, mask1d, mask2d, k, diag_means[k], out)
+        if N - 1 - k != k:
+            _divide_diag(matrix, mask1d, mask2d, N - 1 - k, diag_means[N - 1 - k], out)
+
+
 def observed_over_expected(
-    matrix, mask=np.empty(shape=(0), dtype=np.bool_), dist_bin_edge_ratio=1.03
+    matrix,
+    mask=np.empty(shape=(0), dtype=np.bool_),
+    dist_bin_edge_ratio=1.03,
+    out=None,
 ):
     """
     Normalize the contact matrix for distance-dependent contact decay.
@@ -571,6 +969,8 @@ def observed_over_expected(
     with a fixed distance, are grouped into exponentially growing bins of
     distances; the diagonals from each bin are normalized by their average value.
 
+    Diagonals are processed in parallel by numba threads.
+
     Parameters
     ----------
     matrix : np.ndarray
@@ -581,6 +981,10 @@ def observed_over_expected(
         If 2D, it is interpreted as a mask of "good" pixels.
     dist_bin_edge_ratio : float
         The ratio of the largest and the shortest distance in each distance bin.
+    out : np.ndarray, optional
+        A float64 array of the same shape as `matrix` to write the result to.
+        Can be `matrix` itself for an in-place normalization.
+        A new array is allocated if not provided.
 
     Returns
     -------
@@ -597,56 +1001,41 @@ def observed_over_expected(
     """
     N = matrix.shape[0]
 
+    mask = np.asarray(mask)
+    mask1d = np.empty(shape=(0), dtype=np.bool_)
     mask2d = np.empty(shape=(0, 0), dtype=np.bool_)
     if mask.ndim == 1:
-        if mask.size > 0:
-            mask2d = mask.reshape((1, -1)) * mask.reshape((-1, 1))
+        mask1d = mask.astype(np.bool_)
     elif mask.ndim == 2:
-        # Numba expects mask to be a 1d array, so we need to hint
-        # that it is now a 2d array
-        mask2d = mask.reshape((int(np.sqrt(mask.size)), int(np.sqrt(mask.size))))
+        mask2d = mask.astype(np.bool_)
     else:
         raise ValueError("The mask must be either 1D or 2D.")
 
-    data = np.copy(matrix).astype(np.float64)
+    if out is None:
+        out = np.empty((N, N), dtype=np.float64)
+    elif out.shape != matrix.shape or out.dtype != np.float64:
+        raise ValueError("out must be a float64 array of the same shape as matrix")
 
-    has_mask = mask2d.size > 0
     dist_bins = _logbins_numba(1, N, dist_bin_edge_ratio)
     dist_bins = np.concatenate((np.array([0]), dist_bins))
-    n_pixels_arr = np.zeros_like(dist_bins[1:])
-    sum_pixels_arr = np.zeros_like(dist_bins[1:], dtype=np.float64)
-
-    bin_idx, n_pixels, sum_pixels = 0, 0, 0
+    diag_bin_ids = np.searchsorted(dist_bins, np.arange(N), side="right") - 1
 
-    for bin_idx, lo, hi in zip(
-        range(len(dist_bins) - 1), dist_bins[:-1], dist_bins[1:]
-    ):
-        sum_pixels = 0
-        n_pixels = 0
-        for offset in range(lo, hi):
-            for j in range(0, N - offset):
-                if not has_mask or mask2d[offset + j, j]:
-                    sum_pixels += data[offset + j, j]
-                    n_pixels += 1
-
-        n_pixels_arr[bin_idx] = n_pixels
-        sum_pixels_arr[bin_idx] = sum_pixels
-
-        if n_pixels == 0:
-            continue
-        mean_pixel = sum_pixels / n_pixels
-        if mean_pixel == 0:
-            continue
+    diag_sums, diag_counts = _diag_sums(matrix, mask1d, mask2d)
+    sum_pixels_arr = np.bincount(
+        diag_bin_ids, weights=diag_sums, minlength=len(dist_bins) - 1
+    )
+    n_pixels_arr = np.bincount(
+        diag_bin_ids, weights=diag_counts, minlength=len(dist_bins) - 1
+    ).astype(dist_bins.dtype)
 
-        for offset in range(lo, hi):
-            for j in range(0, N - offset):
-                if not has_mask or mask2d[offset + j, j]:
+    # leave distance bins without valid pixels or with zero mean as is
+    mean_pixels = np.ones(len(dist_bins) - 1)
+    nonzero = (n_pixels_arr > 0) & (sum_pixels_arr != 0)
+    mean_pixels[nonzero] = sum_pixels_arr[nonzero] / n_pixels_arr[nonzero]
 
-                    data[offset + j, j] /= mean_pixel
-                    if offset > 0:
-                        data[j, offset + j] /= mean_pixel
+    _divide_diags(matrix, mask1d, mask2d, mean_pixels[diag_bin_ids], out)
 
-    return data, dist_bins, sum_pixels_arr, n_pixels_arr
+    return out, dist_bins, sum_pixels_arr, n_pixels_arr
 
 
 @numba.jit  # (nopython=True)
@@ -782,12 +1171,331 @@ def iterative_correction_asymmetric(x, max_iter=1000, tol=1e-5, verbose=False):
     return _x, totalBias, totalBias2, report
 
 
+def _matvec_pixels(x, n_bins, ignore_diags, chunk):
+    """
+    Product of a chunk of the upper triangle of a symmetric sparse matrix,
+    stored as cooler pixels, with a vector x.
+    """
+    pixels = chunk["pixels"]
+    i = pixels["bin1_id"]
+    j = pixels["bin2_id"]
+    v = pixels["count"].astype(np.float64)
+    if ignore_diags:
+        keep = (j - i) >= ignore_diags
+        i, j, v = i[keep], j[keep], v[keep]
+    y = np.bincount(i, weights=v * x[j], minlength=n_bins)
+    off = i != j
+    y += np.bincount(j[off], weights=v[off] * x[i[off]], minlength=n_bins)
+    return y
+
+
+def _marginals_pixels(n_bins, ignore_diags, chunk):
+    """
+    Marginal sums and numbers of non-zero pixels per bin for a chunk of the
+    upper triangle of a symmetric sparse matrix, stored as cooler pixels.
+    """
+    ones = np.ones(n_bins)
+    pixels = dict(chunk["pixels"])
+    marg = _matvec_pixels(ones, n_bins, ignore_diags, chunk)
+    pixels["count"] = (pixels["count"] != 0).astype(np.float64)
+    nnz = _matvec_pixels(ones, n_bins, ignore_diags, {"pixels": pixels})
+    return np.vstack([marg, nnz])
+
+
+class CoolerMatVec(object):
+    """
+    Matrix-vector product with the symmetric matrix of raw counts stored in
+    a cooler, computed chunk by chunk over the pixel table. Memory use is
+    bounded by `chunksize` pixels per worker.
+
+    Parameters
+    ----------
+    clr : cooler.Cooler
+        Cooler object to fetch pixels from.
+    chunksize : int
+        The number of pixels per chunk.
+    map : callable
+        Map functor implementation, e.g. the map method of a process pool,
+        to process chunks in parallel.
+    ignore_diags : int
+        The number of diagonals to ignore.
+
+    """
+
+    def __init__(self, clr, chunksize=10_000_000, map=map, ignore_diags=0):
+        self.clr = clr
+        self.chunksize = chunksize
+        self.map = map
+        self.ignore_diags = ignore_diags
+        self.n_bins = clr.info["nbins"]
+
+    def _split(self):
+        return split(self.clr, map=self.map, chunksize=self.chunksize)
+
+    def marginals(self):
+        """
+        Returns the marginal sums and the numbers of non-zero pixels per bin.
+        """
+        marg, nnz = (
+            self._split()
+            .pipe(_marginals_pixels, self.n_bins, self.ignore_diags)
+            .reduce(add, np.zeros((2, self.n_bins)))
+        )
+        return marg, nnz
+
+    def __call__(self, x, mask=None):
+        """
+        Returns A @ x. If a boolean `mask` of bins is provided, `x` and the
+        result are restricted to the bins of the mask.
+        """
+        if mask is None:
+            x_full = np.asarray(x, dtype=np.float64)
+        else:
+            x_full = np.zeros(self.n_bins)
+            x_full[mask] = x
+
+        y_full = (
+            self._split()
+            .pipe(_matvec_pixels, x_full, self.n_bins, self.ignore_diags)
+            .reduce(add, np.zeros(self.n_bins))
+        )
+        return y_full if mask is None else y_full[mask]
+
+
+def iterative_correction_matvec(
+    matvec, mask, max_iter=200, tol=1e-5, x0=None, verbose=False
+):
+    """
+    Iterative correction (ICE) of a symmetric matrix available only through
+    matrix-vector products, e.g. a CoolerMatVec.
+
+    Parameters
+    ----------
+    matvec : callable
+        matvec(x, mask) returns the product of the matrix, restricted to the
+        bins of `mask`, with a vector x.
+    mask : np.ndarray
+        A boolean mask of bins to balance.
+    max_iter : int
+        The maximal number of iterations to take.
+    tol : float
+        Convergence criterion on the variance of the marginals.
+    x0 : np.ndarray, optional
+        Initial guess for the weights, for all bins.
+    verbose : bool
+        If True, print the variance of the marginals at each iteration.
+
+    Returns
+    -------
+    bias : np.ndarray
+        Multiplicative balancing weights, NaN for the masked out bins.
+        Balanced marginals are rescaled to 1.
+    report : dict
+        "converged", "iternum", the "scale" of the marginals, their final
+        variance "var" and the "trace" of variances at each iteration.
+
+    """
+    bias = np.ones(mask.sum()) if x0 is None else np.array(x0[mask], dtype=float)
+    trace = []
+    converged = False
+    scale, var = np.nan, 0.0
+    for iternum in range(max_iter):
+        marg = bias * matvec(bias, mask)
+        nzmarg = marg[marg != 0]
+        if not len(nzmarg):
+            bias[:] = np.nan
+            break
+
+        scale = nzmarg.mean()
+        marg = marg / scale
+        marg[marg == 0] = 1
+        bias /= marg
+
+        var = nzmarg.var()
+        trace.append(var)
+        if verbose:
+            print(var)
+
+        if var < tol:
+            converged = True
+            break
+
+    bias /= np.sqrt(scale)
+    bias[bias == 0] = np.nan
+    bias_full = np.full(len(mask), np.nan)
+    bias_full[mask] = bias
+    report = {
+        "converged": converged,
+        "iternum": iternum,
+        "scale": scale,
+        "var": var,
+        "trace": np.array(trace),
+    }
+    return bias_full, report
+
+
+def bnewt(
+    matvec, mask, tol=1e-6, x0=None, delta=0.1, Delta=3, max_iter=200, verbose=False
+):
+    """
+    Knight-Ruiz balancing of a symmetric non-negative matrix available only
+    through matrix-vector products, e.g. a CoolerMatVec.
+
+    Finds a vector x such that diag(x) A diag(x) is close to doubly
+    stochastic, using an inexact Newton method with conjugate gradient inner
+    iterations (Knight and Ruiz, 2013).
+
+    Parameters
+    ----------
+    matvec : callable
+        matvec(x, mask) returns the product of the matrix, restricted to the
+        bins of `mask`, with a vector x.
+    mask : np.ndarray
+        A boolean mask of bins to balance, the submatrix must not have empty
+        rows.
+    tol : float
+        Error tolerance on the residual norm(diag(x) A x - 1).
+    x0 : np.ndarray, optional
+        Initial guess for the weights, for all bins.
+    delta : float
+        How close balancing vectors can get to the edge of the positive cone.
+    Delta : float
+        How far balancing vectors can get from the edge of the positive cone.
+    max_iter : int
+        The maximal number of outer (Newton) iterations.
+    verbose : bool
+        If True, print the number of inner iterations and the residual at
+        each outer iteration.
+
+    Returns
+    -------
+    bias : np.ndarray
+        Multiplicative balancing weights, NaN for the masked out bins.
+    report : dict
+        "converged", "iternum", the number of matrix-vector products "n_matvec",
+        the final residual "res" and the "trace" of residuals at each outer
+        iteration.
+
+    """
+    n = mask.sum()
+    e = np.ones(n)
+    x = e.copy() if x0 is None else np.array(x0[mask], dtype=float)
+    trace = []
+
+    # Inner stopping criterion parameters.
+    g = 0.9
+    etamax = 0.1
+    eta = etamax
+    stop_tol = tol * 0.5
+    rt = tol ** 2
+    v = x * matvec(x, mask)
+
+    rk = 1 - v
+    rho_km1 = np.dot(rk, rk)
+    rho_km2 = None
+    rout = rho_km1
+    rold = rout
+
+    n_matvec = 1
+    iternum = 0
+
+    # Outer iteration
+    while rout > rt and iternum < max_iter:
+        iternum += 1
+        k = 0
+        y = e.copy()
+        innertol = max((eta ** 2) * rout, rt)
+
+        # Inner iteration by Conjugate Gradient
+        while rho_km1 > innertol:
+            k += 1
+
+            if k == 1:
+                Z = rk / v
+                p = Z.copy()
+                rho_km1 = np.dot(rk, Z)
+            else:
+                beta = rho_km1 / rho_km2
+                p = Z + beta * p
+
+            # Update search direction efficiently.
+            w = x * matvec(x * p, mask) + v * p
+
+            alpha = rho_km1 / np.dot(p, w)
+            ap = alpha * p
+
+            # Test distance to boundary of cone.
+            ynew = y + ap
+            if np.min(ynew) <= delta:
+                if delta == 0:
+                    break
+                idx = ap < 0
+                gamma = np.min((delta - y[idx]) / ap[idx])
+                y = y + gamma * ap
+                break
+
+            if np.max(ynew) >= Delta:
+                idx = ynew > Delta
+                gamma = np.min((Delta - y[idx]) / ap[idx])
+                y = y + gamma * ap
+                break
+
+            y = ynew
+            rk = rk - alpha * w
+            rho_km2 = rho_km1
+            Z = rk / v
+            rho_km1 = np.dot(rk, Z)
+
+        x = x * y
+        v = x * matvec(x, mask)
+
+        rk = 1 - v
+        rho_km1 = np.dot(rk, rk)
+        rout = rho_km1
+        n_matvec += k + 1
+
+        # Update inner iteration stopping criterion.
+        rat = rout / rold
+        rold = rout
+        res_norm = np.sqrt(rout)
+        eta_o = eta
+        eta = g * rat
+        if g * (eta_o ** 2) > 0.1:
+            eta = max(eta, g * (eta_o ** 2))
+        eta = max(min(eta, etamax), stop_tol / res_norm)
+
+        trace.append(res_norm)
+        if verbose:
+            print("%3d\t%6d\t%.3e" % (iternum, k, res_norm))
+
+    bias_full = np.full(len(mask), np.nan)
+    bias_full[mask] = x
+    report = {
+        "converged": rout <= rt,
+        "iternum": iternum,
+        "n_matvec": n_matvec,
+        "res": np.sqrt(rout),
+        "trace": np.array(trace),
+    }
+    return bias_full, report
+
+
 class LazyToeplitz(cooler.core._IndexingMixin):
     """
     A Toeplitz matrix can be represented with one row and one column.
     This lazy toeplitz object supports slice querying to construct dense
     matrices on the fly.
 
+    The first column reversed followed by the first row make a 1D buffer,
+    which every row of the matrix is a contiguous window of. Therefore, any
+    block of the matrix can be exposed as a read-only strided view of this
+    buffer without copying (see `view`), only the diagonals within a band can
+    be extracted as a sparse matrix (see `band`), and arbitrary elements can
+    be gathered by their indices (see `gather`). Blocks are translation
+    invariant along the diagonal and can be queried past the shape of the
+    matrix, as long as their diagonals are stored, otherwise IndexError is
+    raised.
+
     """
 
     def __init__(self, c, r=None):
@@ -797,40 +1505,141 @@ class LazyToeplitz(cooler.core._IndexingMixin):
             raise ValueError("First element of `c` and `r` should match")
         self._c = c
         self._r = r
+        # T[i, j] == self._buf[len(c) - 1 - i + j]
+        self._buf = np.concatenate([np.asarray(c)[::-1], np.asarray(r)[1:]])
 
     @property
     def shape(self):
         return (len(self._c), len(self._r))
 
-    def __getitem__(self, key):
-        slc0, slc1 = self._unpack_index(key)
-        i0, i1 = self._process_slice(slc0, self.shape[0])
-        j0, j1 = self._process_slice(slc1, self.shape[1])
-        C, R = self._c, self._r
+    def _process_spans(self, ispan, jspan):
+        # the elements only depend on j - i, so the spans may extend past the
+        # shape of the matrix (e.g. genome-wide bin ids of a region's block),
+        # blocks are never clipped though
+        (i0, i1), (j0, j1) = ispan, jspan
+        if i0 < 0 or j0 < 0:
+            raise IndexError("Spans of the block must start at non-negative indices")
+        return i0, max(i1, i0), j0, max(j1, j0)
+
+    def _check_diags(self, lo, hi):
+        # the diagonals lo <= j - i <= hi must be stored in `c` and `r`
+        if lo < 1 - self.shape[0] or hi > self.shape[1] - 1:
+            raise IndexError(
+                f"Diagonals {lo} to {hi} of the block are out of the bounds of"
+                f" the matrix, {1 - self.shape[0]} to {self.shape[1] - 1}"
+            )
+
+    def view(self, ispan, jspan):
+        """
+        A read-only view of the block ``T[i0:i1, j0:j1]``, without copying.
 
-        # symmetric query
-        if (i0 == j0) and (i1 == j1):
-            c = C[0 : (i1 - i0)]
-            r = R[0 : (j1 - j0)]
+        Parameters
+        ----------
+        ispan, jspan : tuple of (int, int)
+            The row and column spans of the block.
 
-        # asymmetric query
-        else:
-            transpose = False
-            # tril
-            if j0 < i0 or (i0 == j0 and i1 < j1):
-                # tranpose the matrix, query,
-                # then transpose the result
-                i0, i1, j0, j1 = j0, j1, i0, i1
-                C, R = R, C
-                transpose = True
+        Returns
+        -------
+        block : numpy.ndarray
+            Read-only strided view of the block.
 
-            c = np.r_[R[(j0 - i0) : max(0, j0 - i1) : -1], C[0 : max(0, i1 - j0)]]
-            r = R[(j0 - i0) : (j1 - i0)]
+        Raises
+        ------
+        IndexError
+            If a span starts at a negative index, or the block has diagonals
+            that are not stored.
 
-            if transpose:
-                c, r = r, c
+        """
+        i0, i1, j0, j1 = self._process_spans(ispan, jspan)
+        if (i1 == i0) or (j1 == j0):
+            return np.empty((i1 - i0, j1 - j0), dtype=self._buf.dtype)
+        self._check_diags(j0 - i1 + 1, j1 - 1 - i0)
+        step = self._buf.strides[0]
+        return np.lib.stride_tricks.as_strided(
+            self._buf[self.shape[0] - 1 - i0 + j0 :],
+            shape=(i1 - i0, j1 - j0),
+            strides=(-step, step),
+            writeable=False,
+        )
 
-        return toeplitz(c, r)
+    def band(self, ispan, jspan, max_diag, min_diag=0, format="csr"):
+        """
+        The elements of the block ``T[i0:i1, j0:j1]`` within a diagonal band,
+        ``min_diag <= |j - i| < max_diag`` in the coordinates of the full
+        matrix, as a sparse matrix.
+
+        Parameters
+        ----------
+        ispan, jspan : tuple of (int, int)
+            The row and column spans of the block.
+        max_diag : int
+            Exclusive upper bound of the distance to the main diagonal.
+        min_diag : int
+            Inclusive lower bound of the distance to the main diagonal.
+        format : str
+            Format of the sparse matrix, see scipy.sparse.diags.
+
+        Returns
+        -------
+        block : scipy.sparse.spmatrix
+
+        Raises
+        ------
+        IndexError
+            If a span starts at a negative index, or the block has diagonals
+            within the band that are not stored.
+
+        """
+        i0, i1, j0, j1 = self._process_spans(ispan, jspan)
+        n = self.shape[0]
+        diags = np.arange(-max_diag + 1, max_diag)
+        diags = diags[np.abs(diags) >= min_diag]
+        # offsets of the global diagonals in the block
+        offsets = diags - (j0 - i0)
+        keep = (offsets > -(i1 - i0)) & (offsets < (j1 - j0))
+        diags, offsets = diags[keep], offsets[keep]
+        if len(diags) == 0:
+            return scipy.sparse.csr_matrix(
+                (i1 - i0, j1 - j0), dtype=self._buf.dtype
+            ).asformat(format)
+        self._check_diags(diags[0], diags[-1])
+        return scipy.sparse.diags(
+            self._buf[n - 1 + diags],
+            offsets,
+            shape=(i1 - i0, j1 - j0),
+            format=format,
+            dtype=self._buf.dtype,
+        )
+
+    def gather(self, i, j):
+        """
+        The elements ``T[i, j]`` for arrays of row and column indices.
+
+        Parameters
+        ----------
+        i, j : array_like of int
+            Row and column indices, broadcastable against each other.
+
+        Returns
+        -------
+        values : numpy.ndarray
+
+        """
+        i = np.asarray(i)
+        j = np.asarray(j)
+        if np.any((i < 0) | (i >= self.shape[0]) | (j < 0) | (j >= self.shape[1])):
+            raise IndexError("Indices out of the bounds of the matrix")
+        return self._buf[self.shape[0] - 1 - i + j]
+
+    def __getitem__(self, key):
+        slc0, slc1 = self._unpack_index(key)
+        i0, i1 = self._process_slice(slc0, self.shape[0])
+        j0, j1 = self._process_slice(slc1, self.shape[1])
+        # blocks starting inside the matrix are clipped to its shape, like
+        # numpy slicing, blocks past it are translated along the diagonal
+        if i0 < self.shape[0] and j0 < self.shape[1]:
+            i1, j1 = min(i1, self.shape[0]), min(j1, self.shape[1])
+        return self.view((i0, i1), (j0, j1)).copy()
 
 
 def get_kernel(w, p, ktype):
@@ -1008,11 +1817,66 @@ def remove_good_singletons(mat, mask=None, returnMask=False):
         return mat
 
 
+@numba.njit
+def _nanmean_pair(a, b):
+    if np.isnan(a):
+        return b
+    if np.isnan(b):
+        return a
+    return (a + b) / 2
+
+
+@numba.njit
+def _singleton_value(mat, i, j):
+    # interpolate the pixel (i, j), i > j, of a singleton row or column from
+    # the neighbors along the diagonal, or along the edge of the matrix
+    n = mat.shape[0]
+    if (i > 0) and (j > 0) and (i < n - 1) and (j < n - 1):
+        return _nanmean_pair(mat[i - 1, j - 1], mat[i + 1, j + 1])
+    elif i == 0 or (i == n - 1 and j != 0):
+        return _nanmean_pair(mat[i, j - 1], mat[i, j + 1])
+    else:
+        return _nanmean_pair(mat[i - 1, j], mat[i + 1, j])
+
+
+@numba.njit(parallel=True)
+def _singleton_values(mat, singletons, allowed, vals, only_nans):
+    """
+    Interpolate the pixels of the singleton rows into `vals`, skipping the
+    columns that are not allowed, and the pixels that are not NaN in `vals`
+    if `only_nans`. The main diagonal is set to 0.
+    """
+    for t in numba.prange(len(singletons)):
+        s = singletons[t]
+        for x in range(mat.shape[0]):
+            if not allowed[x] or (only_nans and not np.isnan(vals[t, x])):
+                continue
+            if x == s:
+                vals[t, x] = 0.0
+            else:
+                vals[t, x] = _singleton_value(mat, max(s, x), min(s, x))
+
+
 def interpolate_bad_singletons(
-    mat, mask=None, fillDiagonal=True, returnMask=False, secondPass=True, verbose=False
+    mat,
+    mask=None,
+    fillDiagonal=True,
+    returnMask=False,
+    secondPass=True,
+    verbose=False,
+    copy=True,
 ):
     """Interpolate singleton missing bins for visualization
 
+    Singleton bad bins are the bad bins with good bins on both sides. Their
+    rows and columns are interpolated from the neighboring pixels along the
+    diagonal, skipping the intersections with other bad bins. The second pass
+    interpolates the pixels which had no valid neighbors in the first one.
+
+    copy : bool, optional
+        If True, creates a copy of mat, otherwise interpolates in-place.
+        By default, True.
+
     Examples
     --------
     >>> ax = plt.subplot(121)
@@ -1028,76 +1892,40 @@ def interpolate_bad_singletons(
     >>> plt.set_cmap('fall');
     >>> plt.show()
     """
-    mat = mat.copy()
+    if copy:
+        mat = mat.copy()
     if mask is None:
         mask = infer_mask2D(mat)
-    antimask = ~mask
     badBins = np.sum(mask, axis=0) == 0
-    singletons = (badBins * smooth(badBins == 0, 3)) > 1 / 3
-    bb_minus_singletons = (badBins.astype("int8") - singletons.astype("int8")).astype(
-        "bool"
-    )
+    goodBins = ~badBins
+    singletons = badBins & np.r_[False, goodBins[:-1]] & np.r_[goodBins[1:], False]
+    allowed = ~(badBins & ~singletons)
+
+    mat[~mask] = np.nan
+    singletons = np.flatnonzero(singletons)
+    allowed_idx = np.flatnonzero(allowed)
+    vals = np.zeros((len(singletons), len(mat)))
+
+    def _fill(only_nans):
+        # pixels are interpolated from the matrix before the pass, and then
+        # written to the singleton rows and columns
+        _singleton_values(mat, singletons, allowed, vals, only_nans)
+        mat[np.ix_(singletons, allowed_idx)] = vals[:, allowed_idx]
+        mat[np.ix_(allowed_idx, singletons)] = vals[:, allowed_idx].T
 
-    mat[antimask] = np.nan
-    locs = np.zeros(np.shape(mat))
-    locs[singletons, :] = 1
-    locs[:, singletons] = 1
-    locs[bb_minus_singletons, :] = 0
-    locs[:, bb_minus_singletons] = 0
-    locs = np.nonzero(locs)  # np.isnan(mat))
-    interpvals = np.zeros(np.shape(mat))
     if verbose:
-        print("initial pass to interpolate:", len(locs[0]))
-    for loc in zip(locs[0], locs[1]):
-        i, j = loc
-        if loc[0] > loc[1]:
-            if (
-                (loc[0] > 0)
-                and (loc[1] > 0)
-                and (loc[0] < len(mat) - 1)
-                and (loc[1] < len(mat) - 1)
-            ):
-                interpvals[i, j] = np.nanmean([mat[i - 1, j - 1], mat[i + 1, j + 1]])
-            elif loc[0] == 0:
-                interpvals[i, j] = np.nanmean([mat[i, j - 1], mat[i, j + 1]])
-            elif loc[1] == 0:
-                interpvals[i, j] = np.nanmean([mat[i - 1, j], mat[i + 1, j]])
-            elif loc[0] == (len(mat) - 1):
-                interpvals[i, j] = np.nanmean([mat[i, j - 1], mat[i, j + 1]])
-            elif loc[1] == (len(mat) - 1):
-                interpvals[i, j] = np.nanmean([mat[i - 1, j], mat[i + 1, j]])
-    interpvals = interpvals + interpvals.T
-    mat[locs] = interpvals[locs]
-    mask[locs] = 1
+        n_other = len(allowed_idx) - len(singletons)
+        print("initial pass to interpolate:", len(allowed_idx) ** 2 - n_other ** 2)
+    _fill(only_nans=False)
+    mask[np.ix_(singletons, allowed_idx)] = 1
+    mask[np.ix_(allowed_idx, singletons)] = 1
 
     if secondPass:
-        locs = np.nonzero(np.isnan(interpvals))  # np.isnan(mat))
-        interpvals2 = np.zeros(np.shape(mat))
         if verbose:
-            print("still remaining: ", len(locs[0]))
-        for loc in zip(locs[0], locs[1]):
-            i, j = loc
-            if loc[0] > loc[1]:
-                if (
-                    (loc[0] > 0)
-                    and (loc[1] > 0)
-                    and (loc[0] < len(mat) - 1)
-                    and (loc[1] < len(mat) - 1)
-                ):
-                    interpvals2[i, j] = np.nanmean(
-                        [mat[i - 1, j - 1], mat[i + 1, j + 1]]
-                    )
-                elif loc[0] == 0:
-                    interpvals2[i, j] = np.nanmean([mat[i, j - 1], mat[i, j + 1]])
-                elif loc[1] == 0:
-                    interpvals2[i, j] = np.nanmean([mat[i - 1, j], mat[i + 1, j]])
-                elif loc[0] == (len(mat) - 1):
-                    interpvals2[i, j] = np.nanmean([mat[i, j - 1], mat[i, j + 1]])
-                elif loc[1] == (len(mat) - 1):
-                    interpvals2[i, j] = np.nanmean([mat[i - 1, j], mat[i + 1, j]])
-        interpvals2 = interpvals2 + interpvals2.T
-        mat[locs] = interpvals2[locs]
-        mask[locs] = 1
+            # pixels of the singleton rows and of their transposes
+            n_nans = 2 * np.isnan(vals).sum() - np.isnan(vals[:, singletons]).sum()
+            print("still remaining: ", n_nans)
+        _fill(only_nans=True)
 
     if fillDiagonal:
         for i in range(-1, 2):
@@ -1196,6 +2024,304 @@ def zoom_array(
     return rescaled
 
 
+def _sum_blocks(rows, cols, data, row_map, col_map, shape):
+    # sum the pixels falling into the same block, bin IDs are mapped to blocks
+    # with integer division; pixels mapped past the shape are dropped
+    rows = row_map(rows)
+    cols = col_map(cols)
+    keep = (rows < shape[0]) & (cols < shape[1])
+    blocks = scipy.sparse.coo_matrix(
+        (data[keep], (rows[keep], cols[keep])), shape=shape
+    )
+    blocks.sum_duplicates()
+    return blocks
+
+
+def _coarsen_factors(axes, ndim=2):
+    if np.isscalar(axes):
+        return (int(axes),) * ndim
+    return tuple(int(axes.get(i, 1)) for i in range(ndim))
+
+
+def coarsen_sparse(x, axes, trim_excess=False):
+    """
+    Coarsen a sparse matrix by summing fixed size blocks of pixels, a sparse
+    counterpart of ``coarsen(np.sum, x, axes)``.
+
+    Bin IDs of the nonzero pixels are divided by the coarsening factors and
+    the duplicates are summed, so a dense array is never allocated.
+
+    Parameters
+    ----------
+    x : scipy.sparse matrix
+        Matrix to be coarsened, in any sparse format (COO, CSR, ...).
+    axes : int or dict
+        Coarsening factor for both axes, or a mapping of axis to coarsening
+        factor.
+    trim_excess : bool, optional
+        Remove excess rows and columns that do not fill a complete block.
+        Otherwise, they are summed into smaller blocks at the edges. Default
+        is False.
+
+    Returns
+    -------
+    Coarsened matrix in the same sparse format as ``x``.
+
+    See also
+    --------
+    coarsen, coarsen_cooler
+
+    """
+    f0, f1 = _coarsen_factors(axes)
+    n, m = x.shape
+    if trim_excess:
+        shape = (n // f0, m // f1)
+    else:
+        shape = (-(-n // f0), -(-m // f1))
+    coo = x.tocoo()
+    blocks = _sum_blocks(
+        coo.row,
+        coo.col,
+        coo.data,
+        lambda i: i // f0,
+        lambda j: j // f1,
+        shape,
+    )
+    return blocks.asformat(x.format)
+
+
+def zoom_sparse(x, final_shape, same_sum=False):
+    """
+    Rescale a sparse matrix to a smaller shape, a sparse counterpart of
+    `zoom_array` for coarsening.
+
+    Row (column) ``i`` is assigned to the row (column) ``i * final_shape[0]
+    // x.shape[0]`` of the output, so the blocks differ in size by at most
+    one bin when the shapes are not multiples of each other. Unlike
+    `zoom_array`, the matrix is not interpolated before block-averaging.
+
+    Parameters
+    ----------
+    x : scipy.sparse matrix
+        Matrix to be rescaled, in any sparse format (COO, CSR, ...).
+    final_shape : shape tuple
+        Resulting shape of the matrix, no larger than ``x.shape``.
+    same_sum : bool, optional
+        Sum the pixels of each block, preserving the sum of the matrix.
+        By default, the pixels are averaged, preserving the values.
+
+    Returns
+    -------
+    Rescaled matrix in the same sparse format as ``x``.
+
+    """
+    n, m = x.shape
+    n_out, m_out = final_shape
+    if not (0 < n_out <= n and 0 < m_out <= m):
+        raise ValueError(
+            "Cannot rescale a sparse matrix of shape {} to {}".format(
+                x.shape, final_shape
+            )
+        )
+    coo = x.tocoo()
+    blocks = _sum_blocks(
+        coo.row,
+        coo.col,
+        coo.data.astype(float),
+        lambda i: i.astype(np.int64) * n_out // n,
+        lambda j: j.astype(np.int64) * m_out // m,
+        (n_out, m_out),
+    )
+    if not same_sum:
+        row_sizes = np.bincount(np.arange(n, dtype=np.int64) * n_out // n)
+        col_sizes = np.bincount(np.arange(m, dtype=np.int64) * m_out // m)
+        blocks.data /= row_sizes[blocks.row] * col_sizes[blocks.col]
+    return blocks.asformat(x.format)
+
+
+def coarsen_cooler(
+    clr,
+    axes,
+    region1=None,
+    region2=None,
+    field="count",
+    clr_weight_name=None,
+    trim_excess=False,
+    chunksize=10_000_000,
+    prefetch=0,
+):
+    """
+    Coarsen a region of a cooler by summing fixed size blocks of pixels,
+    streaming over the pixel table in chunks.
+
+    Neither the dense matrix nor all the pixels of the region are loaded: each
+    chunk is coarsened by integer division of the bin IDs and summed into the
+    sparse output, whose size is the number of nonzero coarse pixels.
+
+    Parameters
+    ----------
+    clr : cooler.Cooler
+        Cooler object
+    axes : int or dict
+        Coarsening factor for both axes, or a mapping of axis to coarsening
+        factor.
+    region1, region2 : str or tuple, optional
+        Genomic ranges of the rows and the columns, as in
+        ``clr.matrix().fetch(region1, region2)``. The whole matrix by default,
+        and ``region2`` defaults to ``region1``.
+    field : str, optional
+        Pixel table column to coarsen.
+    clr_weight_name : str, optional
+        Name of the column with balancing weights, to coarsen the balanced
+        matrix, ignoring the pixels of bins with NaN weights. Raw values are
+        coarsened by default.
+    trim_excess : bool, optional
+        Remove excess rows and columns that do not fill a complete block.
+    chunksize : int, optional
+        The number of pixels per chunk.
+    prefetch : int, optional
+        The number of chunks to read ahead in a background thread.
+
+    Returns
+    -------
+    scipy.sparse.coo_matrix
+        Coarsened matrix, with both triangles of the on-diagonal blocks.
+
+    See also
+    --------
+    coarsen_sparse
+
+    """
+    f0, f1 = _coarsen_factors(axes)
+    n_bins = clr.info["nbins"]
+    i0, i1 = (0, n_bins) if region1 is None else clr.extent(region1)
+    if region2 is None:
+        j0, j1 = i0, i1
+    else:
+        j0, j1 = clr.extent(region2)
+    if trim_excess:
+        i1 = i0 + (i1 - i0) // f0 * f0
+        j1 = j0 + (j1 - j0) // f1 * f1
+    shape = (-(-(i1 - i0) // f0), -(-(j1 - j0) // f1))
+
+    weights = None
+    if clr_weight_name is not None:
+        weights = clr.bins()[clr_weight_name][:].values
+
+    def _coarsen_chunk(chunk, transpose):
+        # cooler stores the upper triangle, its pixels (j, i) with j < i fill
+        # the lower triangle of the query
+        rows, cols = chunk["bin1_id"], chunk["bin2_id"]
+        data = chunk[field]
+        if transpose:
+            strict = rows < cols
+            rows, cols, data = cols[strict], rows[strict], data[strict]
+        if weights is not None:
+            data = weights[rows] * weights[cols] * data
+            valid = np.isfinite(data)
+            rows, cols, data = rows[valid], cols[valid], data[valid]
+        return _sum_blocks(
+            rows,
+            cols,
+            data,
+            lambda i: (i - i0) // f0,
+            lambda j: (j - j0) // f1,
+            shape,
+        )
+
+    with clr.open("r") as grp:
+        selector = CSRSelector(grp, (n_bins, n_bins), field, chunksize)
+        queries = []
+        if i0 < j1:  # the query has pixels of the upper triangle
+            queries.append((selector[i0:i1, j0:j1], False))
+        if j0 < i1 - 1:  # the query has pixels of the lower triangle
+            queries.append((selector[j0:j1, i0:i1], True))
+        pieces = [
+            _coarsen_chunk(chunk, transpose)
+            for query, transpose in queries
+            for chunk in query.read_chunked(prefetch=prefetch)
+        ]
+
+    if not pieces:
+        return scipy.sparse.coo_matrix(shape)
+    result = scipy.sparse.coo_matrix(
+        (
+            np.concatenate([p.data for p in pieces]),
+            (
+                np.concatenate([p.row for p in pieces]),
+                np.concatenate([p.col for p in pieces]),
+            ),
+        ),
+        shape=shape,
+    )
+    result.sum_duplicates()
+    return result
+
+
+@numba.njit
+def _cg_child(vals, counts, mask, i, j, raw):
+    # value, raw count and number of valid pixels of a block of the previous
+    # level; blocks past the edge of the array are empty, as if it was padded
+    # with NaNs. For the raw (finest) level, the validity of a pixel is given
+    # by its value being finite and `mask` is not used.
+    if i >= vals.shape[0] or j >= vals.shape[1]:
+        return 0.0, 0.0, 0.0
+    if raw:
+        if np.isfinite(vals[i, j]):
+            return float(vals[i, j]), float(counts[i, j]), 1.0
+        return 0.0, 0.0, 0.0
+    return float(vals[i, j]), float(counts[i, j]), float(mask[i, j])
+
+
+@numba.njit(parallel=True)
+def _cg_coarsen(vals, counts, mask, raw, cg_vals, cg_counts, cg_mask):
+    """
+    Sum 2x2 blocks of values, counts and valid pixels of one level of the
+    pyramid into the next one.
+    """
+    for I in numba.prange(cg_vals.shape[0]):
+        for J in range(cg_vals.shape[1]):
+            v00, c00, m00 = _cg_child(vals, counts, mask, 2 * I, 2 * J, raw)
+            v10, c10, m10 = _cg_child(vals, counts, mask, 2 * I + 1, 2 * J, raw)
+            v01, c01, m01 = _cg_child(vals, counts, mask, 2 * I, 2 * J + 1, raw)
+            v11, c11, m11 = _cg_child(vals, counts, mask, 2 * I + 1, 2 * J + 1, raw)
+            cg_vals[I, J] = (v00 + v10) + (v01 + v11)
+            cg_counts[I, J] = (c00 + c10) + (c01 + c11)
+            cg_mask[I, J] = (m00 + m10) + (m01 + m11)
+
+
+@numba.njit(parallel=True)
+def _cg_expand(cg_vals, cg_mask, vals, counts, mask, raw, cutoff):
+    """
+    Replace the values of 2x2 blocks of one level of the pyramid, in which any
+    pixel has fewer than `cutoff` counts, with the average value of the
+    (already processed) coarser level. Invalid pixels are set to 0, or to NaN
+    for the raw level.
+    """
+    n, m = vals.shape
+    for I in numba.prange(cg_vals.shape[0]):
+        for J in range(cg_vals.shape[1]):
+            if cg_mask[I, J] > 0:
+                avg = cg_vals[I, J] / cg_mask[I, J]
+            else:
+                avg = np.nan
+            min_count = np.inf
+            for i in range(2 * I, 2 * I + 2):
+                for j in range(2 * J, 2 * J + 2):
+                    count = _cg_child(vals, counts, mask, i, j, raw)[1]
+                    min_count = min(min_count, count)
+            for i in range(2 * I, min(2 * I + 2, n)):
+                for j in range(2 * J, min(2 * J + 2, m)):
+                    if raw:
+                        valid = 1.0 if np.isfinite(vals[i, j]) else 0.0
+                    else:
+                        valid = mask[i, j]
+                    if valid == 0:
+                        vals[i, j] = np.nan if raw else 0.0
+                    elif min_count < cutoff:
+                        vals[i, j] = avg * valid
+
+
 def adaptive_coarsegrain(ar, countar, cutoff=5, max_levels=8, min_shape=8):
     """
     Adaptively coarsegrain a Hi-C matrix based on local neighborhood pooling
@@ -1203,11 +2329,12 @@ def adaptive_coarsegrain(ar, countar, cutoff=5, max_levels=8, min_shape=8):
 
     Parameters
     ----------
-    ar : array_like, shape (n, n)
-        A square Hi-C matrix to coarsegrain. Usually this would be a balanced
+    ar : array_like, shape (n, m)
+        A Hi-C matrix to coarsegrain, either a square on-diagonal or a
+        rectangular off-diagonal region. Usually this would be a balanced
         matrix.
 
-    countar : array_like, shape (n, n)
+    countar : array_like, shape (n, m)
         The raw count matrix for the same area. Has to be the same shape as the
         Hi-C matrix.
 
@@ -1227,14 +2354,16 @@ def adaptive_coarsegrain(ar, countar, cutoff=5, max_levels=8, min_shape=8):
 
     Returns
     -------
-    Smoothed array, shape (n, n)
+    Smoothed array, shape (n, m)
 
     Notes
     -----
     The algorithm works as follows:
 
-    First, it pads an array with NaNs to the nearest power of two. Second, it
-    coarsens the array in powers of two until the size is less than minshape.
+    First, it coarsens the array in powers of two until the size is less than
+    minshape. The array is treated as if it was padded with NaNs to the
+    nearest power of two, i.e. the pixels past its edge are invalid and have
+    zero counts.
 
     Third, it starts with the most coarsened array, and goes one level up.
     It looks at all 4 pixels that make each pixel in the second-to-last
@@ -1247,6 +2376,9 @@ def adaptive_coarsegrain(ar, countar, cutoff=5, max_levels=8, min_shape=8):
     large zero-only areas were provided such that zeros were produced
     ``max_levels`` times when coarsening.
 
+    The coarsened levels are stored in a single scratch buffer of about the
+    size of the input, and each level is processed in parallel with numba.
+
     Examples
     --------
     >>> c = cooler.Cooler("/path/to/some/cooler/at/about/2000bp/resolution")
@@ -1266,69 +2398,44 @@ def adaptive_coarsegrain(ar, countar, cutoff=5, max_levels=8, min_shape=8):
 
     """
 
-    def _coarsen(ar, operation=np.sum):
-        """Coarsegrains an array by a factor of 2"""
-        M = ar.shape[0] // 2
-        newar = np.reshape(ar, (M, 2, M, 2))
-        cg = operation(newar, axis=1)
-        cg = operation(cg, axis=2)
-        return cg
+    ar = np.array(ar, dtype=float)  # the output is written in place here
+    countar = np.asarray(countar)
+    if ar.ndim != 2 or countar.shape != ar.shape:
+        raise ValueError(
+            "ar and countar must be 2D arrays of the same shape, "
+            "got {} and {}".format(ar.shape, countar.shape)
+        )
 
-    def _expand(ar, counts=None):
-        """
-        Performs an inverse of nancoarsen
-        """
-        N = ar.shape[0] * 2
-        newar = np.zeros((N, N))
-        newar[::2, ::2] = ar
-        newar[1::2, ::2] = ar
-        newar[::2, 1::2] = ar
-        newar[1::2, 1::2] = ar
-        return newar
-
-    # defining arrays, making sure they are floats
-    ar = np.asarray(ar, float)
-    countar = np.asarray(countar, float)
-
-    # TODO: change this to the nearest shape correctly counting the smallest
-    # shape the algorithm will reach
-    Norig = ar.shape[0]
-    Nlog = np.log2(Norig)
-    if not np.allclose(Nlog, np.rint(Nlog)):
-        newN = np.int(2 ** np.ceil(Nlog))  # next power-of-two sized matrix
-        newar = np.empty((newN, newN), dtype=float)  # fitting things in there
-        newar[:] = np.nan
-        newcountar = np.zeros((newN, newN), dtype=float)
-        newar[:Norig, :Norig] = ar
-        newcountar[:Norig, :Norig] = countar
-        ar = newar
-        countar = newcountar
-
-    armask = np.isfinite(ar)  # mask of "valid" elements
-    countar[~armask] = 0
-    ar[~armask] = 0
-
-    assert np.isfinite(countar).all()
-    assert countar.shape == ar.shape
-
-    # We will be working with three arrays.
-    ar_cg = [ar]  # actual Hi-C data
-    countar_cg = [countar]  # counts contributing to Hi-C data (raw Hi-C reads)
-    armask_cg = [armask]  # mask of "valid" pixels of the heatmap
-
-    # 1. Forward pass: coarsegrain all 3 arrays
-    for i in range(max_levels):
-        if countar_cg[-1].shape[0] > min_shape:
-            countar_cg.append(_coarsen(countar_cg[-1]))
-            armask_cg.append(_coarsen(armask_cg[-1]))
-            ar_cg.append(_coarsen(ar_cg[-1]))
-
-    # Get the most coarsegrained array
-    ar_cur = ar_cg.pop()
-    countar_cur = countar_cg.pop()
-    armask_cur = armask_cg.pop()
-
-    # 2. Reverse pass: replace values starting with most coarsegrained array
+    # number of levels, counting the size of the pyramid from the nearest
+    # power of two, as if the array was padded
+    n, m = ar.shape
+    size = 2 ** int(np.ceil(np.log2(max(n, m, 1))))
+    n_levels = 0
+    while n_levels < max_levels and (size >> n_levels) > min_shape:
+        n_levels += 1
+
+    # shapes of the coarsened levels and their offsets in the scratch buffer
+    shapes = [(n, m)]
+    for _ in range(n_levels):
+        shapes.append(((shapes[-1][0] + 1) // 2, (shapes[-1][1] + 1) // 2))
+    offsets = np.cumsum([0] + [a * b for a, b in shapes[1:]])
+    buf = np.empty((3, offsets[-1]), dtype=float)
+
+    def _level(k):
+        # values, raw counts and number of valid pixels of the k-th level
+        lo, hi = offsets[k - 1], offsets[k]
+        return tuple(buf[q, lo:hi].reshape(shapes[k]) for q in range(3))
+
+    def _raw_or_level(k):
+        if k == 0:
+            return ar, countar, ar, True  # the mask is ignored for raw input
+        return _level(k) + (False,)
+
+    # 1. Forward pass: coarsegrain values, counts and valid pixels
+    for k in range(1, n_levels + 1):
+        _cg_coarsen(*_raw_or_level(k - 1), *_level(k))
+
+    # 2. Reverse pass: replace values starting with most coarsegrained level.
     # We have 4 pixels that were coarsegrained to one pixel.
     # Let V be the array of values (ar), and C be the array of counts of
     # valid pixels. Then the coarsegrained values and valid pixel counts
@@ -1336,47 +2443,19 @@ def adaptive_coarsegrain(ar, countar, cutoff=5, max_levels=8, min_shape=8):
     # V_{cg} = V_{0,0} + V_{0,1} + V_{1,0} + V_{1,1}
     # C_{cg} = C_{0,0} + C_{0,1} + C_{1,0} + C_{1,1}
     # The average value at the coarser level is V_{cg} / C_{cg}
-    # The average value at the finer level is V_{0,0} / C_{0,0}, etc.
     #
-    # We would replace 4 values with the average if counts for either of the
-    # 4 values are less than cutoff. To this end, we perform nanmin of raw
-    # Hi-C counts in each 4 pixels
-    # Because if counts are 0 due to this pixel being invalid - it's fine.
-    # But if they are 0 in a valid pixel - we replace this pixel.
-    # If we decide to replace the current 2x2 square with coarsegrained
-    # values, we need to make it produce the same average value
-    # To this end, we would replace V_{0,0} with V_{cg} * C_{0,0} / C_{cg} and
-    # so on.
-    for i in range(len(countar_cg)):
-        ar_next = ar_cg.pop()
-        countar_next = countar_cg.pop()
-        armask_next = armask_cg.pop()
-
-        # obtain current "average" value by dividing sum by the # of valid pixels
-        val_cur = ar_cur / armask_cur
-        # expand it so that it is the same shape as the previous level
-        val_exp = _expand(val_cur)
-        # create array of substitutions: multiply average value by counts
-        addar_exp = val_exp * armask_next
-
-        # make a copy of the raw Hi-C array at current level
-        countar_next_mask = np.array(countar_next)
-        countar_next_mask[armask_next == 0] = np.nan  # fill nans
-        countar_exp = _expand(_coarsen(countar_next, operation=np.nanmin))
-
-        curmask = countar_exp < cutoff  # replacement mask
-        ar_next[curmask] = addar_exp[curmask]  # procedure of replacement
-        ar_next[armask_next == 0] = 0  # now setting zeros at invalid pixels
-
-        # prepare for the next level
-        ar_cur = ar_next
-        countar_cur = countar_next
-        armask_cur = armask_next
-
-    ar_next[armask_next == 0] = np.nan
-    ar_next = ar_next[:Norig, :Norig]
-
-    return ar_next
+    # We would replace 4 values with the average if raw counts for either of
+    # the 4 values are less than cutoff, replacing V_{0,0} with
+    # V_{cg} * C_{0,0} / C_{cg} and so on, so that the 2x2 square produces the
+    # same average value. The values of the finer level are overwritten in
+    # place, and are then used to process the next (finer) level.
+    for k in range(n_levels, 0, -1):
+        cg_vals, _, cg_mask = _level(k)
+        _cg_expand(cg_vals, cg_mask, *_raw_or_level(k - 1), cutoff)
+
+    if n_levels == 0:
+        ar[~np.isfinite(ar)] = np.nan
+    return ar
 
 
 def robust_gauss_filter(
@@ -1433,9 +2512,82 @@ def robust_gauss_filter(
     return a / b
 
 
+def _group_segments(df, group_by):
+    """
+    Sort the rows of a dataframe by groups.
+
+    Returns the order of rows, the start of each group in that order, and the
+    index of the groups, sorted as by `df.groupby`. Rows with NaN keys are
+    dropped.
+    """
+    codes, uniques = [], []
+    for col in group_by:
+        code, unique = pd.factorize(df[col], sort=True)
+        codes.append(code)
+        uniques.append(unique)
+    valid = np.all([code >= 0 for code in codes], axis=0)
+    rows = np.flatnonzero(valid)
+    order = rows[np.lexsort([code[rows] for code in codes[::-1]])]
+
+    sorted_codes = [code[order] for code in codes]
+    is_start = np.ones(len(order), dtype=bool)
+    if len(order):
+        is_start[1:] = np.any([np.diff(code) != 0 for code in sorted_codes], axis=0)
+    starts = np.flatnonzero(is_start)
+
+    if len(group_by) == 1:
+        index = pd.Index(uniques[0][sorted_codes[0][starts]], name=group_by[0])
+    else:
+        index = pd.MultiIndex.from_arrays(
+            [unique[code[starts]] for unique, code in zip(uniques, sorted_codes)],
+            names=group_by,
+        )
+    return order, starts, index
+
+
+def _segment_weighted_stat(x, w, starts, mode="mean"):
+    """
+    Weighted mean, std, std in log space or median of consecutive segments of
+    `x` that begin at `starts`, with weights `w`.
+    """
+    if len(starts) == 0:
+        return np.empty(0)
+    lengths = np.diff(np.r_[starts, len(x)])
+    w_sum = np.add.reduceat(w, starts)
+
+    if mode == "median":
+        # sort the values within segments, and take the first value at which
+        # the cumulative weight reaches half of the weight of the segment
+        seg = np.repeat(np.arange(len(starts)), lengths)
+        order = np.lexsort([x, seg])
+        x, w = x[order], w[order]
+        cum_w = np.cumsum(w)
+        cum_w -= np.repeat(cum_w[starts] - w[starts], lengths)
+        past_half = np.flatnonzero(cum_w >= np.repeat(w_sum, lengths) / 2)
+        seg_past_half, first = np.unique(seg[past_half], return_index=True)
+        med = np.full(len(starts), np.nan)
+        med[seg_past_half] = x[past_half[first]]
+        # NaNs are sorted last and do not propagate through cumsum
+        med[np.add.reduceat(np.isnan(x), starts) > 0] = np.nan
+        return med
+
+    if mode == "logstd":
+        x = np.log(x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.add.reduceat(w * x, starts) / w_sum
+        if mode == "mean":
+            return mean
+        dev = x - np.repeat(mean, lengths)
+        std = np.sqrt(np.add.reduceat(w * dev ** 2, starts) / w_sum)
+    return np.exp(std) if mode == "logstd" else std
+
+
 def weighted_groupby_mean(df, group_by, weigh_by, mode="mean"):
     """
-    Weighted mean, std, and std in log space for a dataframe.groupby
+    Weighted mean, std, std in log space, and median for a dataframe.groupby
+
+    The rows are sorted by groups once, and all columns are reduced over the
+    contiguous segments of groups with ``np.add.reduceat``.
 
     Parameters
     ----------
@@ -1445,53 +2597,34 @@ def weighted_groupby_mean(df, group_by, weigh_by, mode="mean"):
         Columns to group by
     weight_by : str
         Column to use as weights
-    mode : "mean", "std" or "logstd"
+    mode : "mean", "std", "logstd" or "median"
         Do the weighted mean, the weighted standard deviaton,
-        or the weighted std in log-space from the mean-log value
-        (useful for P(s) etc.)
+        the weighted std in log-space from the mean-log value
+        (useful for P(s) etc.), or the weighted median
+
+    Returns
+    -------
+    Dataframe indexed by groups, with the sum of weights, and the weighted
+    statistic of all other columns.
     """
     if type(group_by) == str:
         group_by = [group_by]
-    gr = df.groupby(group_by)
-    if mode == "mean":
-
-        def wstd(x):
-            return np.average(x, weights=df.loc[x.index, weigh_by])
-
-        wm = wstd
-    elif mode == "std":
-
-        def wstd(x):
-            wm = np.average(x, weights=df.loc[x.index, weigh_by])
-            dev = x - wm
-            res = np.sqrt(np.average(dev ** 2, weights=df.loc[x.index, weigh_by]))
-            return res
-
-        wm = wstd
-    elif mode == "logstd":
-
-        def wstd(x):
-            x = np.log(x)
-            wm = np.average(x, weights=df.loc[x.index, weigh_by])
-            dev = x - wm
-            res = np.sqrt(np.average(dev ** 2, weights=df.loc[x.index, weigh_by]))
-            return np.exp(res)
-
-        wm = wstd
-    else:
+    if mode not in ("mean", "std", "logstd", "median"):
         raise NotImplementedError
 
-    f = {}
+    order, starts, index = _group_segments(df, group_by)
+    w = df[weigh_by].to_numpy()[order]
+
+    agg = {}
     for i in df.columns:
         if i in group_by:
             continue
         elif i == weigh_by:
-            f[i] = ["sum"]
+            agg[i] = np.add.reduceat(w, starts) if len(starts) else w[:0]
         else:
-            f[i] = [wm]
-    agg = gr.agg(f)
-    agg.columns = [i[0] for i in agg.columns]
-    return agg
+            x = df[i].to_numpy(dtype=float)[order]
+            agg[i] = _segment_weighted_stat(x, w.astype(float), starts, mode)
+    return pd.DataFrame(agg, index=index)
 
 
 def persistent_log_bins(end=10, bins_per_order_magnitude=10):
@@ -1506,6 +2639,12 @@ def persistent_log_bins(end=10, bins_per_order_magnitude=10):
 
     bins_per_order_magnitude : int >0 how many bins per order of magnitude
 
+    Returns
+    -------
+    bins : ndarray
+        The bins are memoized and the same array is returned by every call
+        with the same parameters, so it is read-only: copy it before modifying.
+
     Notes
     -----
     This is not a replacement for logbins, and it has a different purpose.
@@ -1550,10 +2689,18 @@ def persistent_log_bins(end=10, bins_per_order_magnitude=10):
     """
     if end > 50:
         raise ValueError("End is a log10(max_value), not the max_value itself")
+    return _persistent_log_bins(end, bins_per_order_magnitude)
+
+
+@lru_cache(maxsize=None)
+def _persistent_log_bins(end, bins_per_order_magnitude):
+    # bins are memoized by (end, bins_per_order_magnitude), the cached array
+    # is shared by the callers, hence read-only
     bin_float = np.logspace(0, end, end * bins_per_order_magnitude + 1)
     bin_int = np.array(np.rint(bin_float), dtype=int)  # rounding to the nearest int
     bins = np.unique(bin_int)  # unique bins
     bins = np.cumsum(
         np.sort(np.r_[1, np.diff(bins)])
     )  # re-ordering gaps (important step)
+    bins.flags.writeable = False
     return bins
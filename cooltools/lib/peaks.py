@@ -2,6 +2,7 @@
 #
 import warnings
 import numpy as np
+import numba
 
 
 def find_peak_prominence(arr, max_dist=None):
@@ -23,10 +24,15 @@ def find_peak_prominence(arr, max_dist=None):
 
     proms : numpy.array
         The prominence of the detected maxima.
+
+    Notes
+    -----
+    The adjacent higher peaks are found with a monotonic stack and the lowest
+    points between them with range-minimum queries to a block sparse table,
+    so the running time is O(n) regardless of `max_dist`.
     """
 
     arr = np.asarray(arr)
-    n = len(arr)
     max_dist = len(arr) if max_dist is None else int(max_dist)
 
     # Finding all local minima and maxima (i.e. points the are lower/higher than
@@ -52,43 +58,12 @@ def find_peak_prominence(arr, max_dist=None):
     # For each maximum, find the position of a higher peak on the left and
     # on the right. If there are no higher peaks within the `max_dist` range,
     # just use the position `max_dist` away.
-    left_maxs = -1 * np.ones(len(loc_max_poss), dtype=np.int64)
-    right_maxs = -1 * np.ones(len(loc_max_poss), dtype=np.int64)
-
-    for i, pos in enumerate(loc_max_poss):
-        for j in range(pos - 1, -1, -1):
-            if (arr[j] > arr[pos]) or (pos - j > max_dist):
-                left_maxs[i] = j
-                break
-
-        for j in range(pos + 1, n):
-            if (arr[j] > arr[pos]) or (j - pos > max_dist):
-                right_maxs[i] = j
-                break
-
     # Find the prominence of each peak with respect of the lowest point
     # between the peak and the adjacent higher peaks, on the left and the right
     # separately.
-    left_max_proms = np.array(
-        [
-            (
-                arr[pos] - np.nanmin(arr[left_maxs[i] : pos])
-                if (left_maxs[i] >= 0)
-                else np.nan
-            )
-            for i, pos in enumerate(loc_max_poss)
-        ]
-    )
-
-    right_max_proms = np.array(
-        [
-            (
-                arr[pos] - np.nanmin(arr[pos : right_maxs[i]])
-                if (right_maxs[i] >= 0)
-                else np.nan
-            )
-            for i, pos in enumerate(loc_max_poss)
-        ]
+    arr = arr.astype(np.float64)
+    left_maxs, right_maxs, left_max_proms, right_max_proms = _peak_prominence_sides(
+        arr, loc_max_poss.astype(np.int64), max_dist
     )
 
     # In 1D, the topographic definition of the prominence of a peak reduces to
@@ -125,6 +100,124 @@ def find_peak_prominence(arr, max_dist=None):
     return loc_max_poss, max_proms
 
 
+@numba.njit
+def _nearest_higher_left(arr):
+    """
+    Position of the nearest strictly higher element on the left of each
+    element of an array, or -1 if there is none. Uses a monotonic stack,
+    NaNs are skipped.
+    """
+    n = len(arr)
+    out = np.full(n, -1, dtype=np.int64)
+    stack = np.empty(n, dtype=np.int64)
+    top = 0
+    for i in range(n):
+        if np.isnan(arr[i]):
+            continue
+        while top > 0 and arr[stack[top - 1]] <= arr[i]:
+            top -= 1
+        if top > 0:
+            out[i] = stack[top - 1]
+        stack[top] = i
+        top += 1
+    return out
+
+
+@numba.njit
+def _nanmin_range(arr, lo, hi):
+    """
+    np.nanmin(arr[lo:hi]), NaN for an all-NaN range.
+    """
+    res = np.nan
+    for i in range(lo, hi):
+        if np.isnan(res) or arr[i] < res:
+            res = arr[i]
+    return res
+
+
+@numba.njit
+def _nanmin_pair(a, b):
+    return b if (np.isnan(a) or b < a) else a
+
+
+@numba.njit
+def _block_sparse_table(arr, block):
+    """
+    Sparse table for range-minimum queries over the blocks of an array:
+    table[k, i] is the NaN-ignoring minimum of the blocks i, ..., i + 2**k - 1.
+    Indexing blocks rather than elements keeps the table size O(n).
+    """
+    n_blocks = (len(arr) + block - 1) // block
+    n_levels = 1
+    while (1 << n_levels) <= n_blocks:
+        n_levels += 1
+
+    table = np.full((n_levels, max(n_blocks, 1)), np.nan)
+    for i in range(n_blocks):
+        table[0, i] = _nanmin_range(arr, i * block, min((i + 1) * block, len(arr)))
+    for k in range(1, n_levels):
+        half = 1 << (k - 1)
+        for i in range(n_blocks - (1 << k) + 1):
+            table[k, i] = _nanmin_pair(table[k - 1, i], table[k - 1, i + half])
+    return table
+
+
+@numba.njit
+def _range_nanmin(arr, table, block, lo, hi):
+    """
+    np.nanmin(arr[lo:hi]) in O(block) time with a block sparse table:
+    the two partial blocks at the ends are scanned, and the full blocks in
+    between are covered by two overlapping power-of-two spans of the table.
+    """
+    block_lo = (lo + block - 1) // block
+    block_hi = hi // block
+    if block_lo >= block_hi:
+        return _nanmin_range(arr, lo, hi)
+
+    res = _nanmin_pair(
+        _nanmin_range(arr, lo, block_lo * block),
+        _nanmin_range(arr, block_hi * block, hi),
+    )
+    k = 0
+    while (1 << (k + 1)) <= block_hi - block_lo:
+        k += 1
+    res = _nanmin_pair(res, table[k, block_lo])
+    res = _nanmin_pair(res, table[k, block_hi - (1 << k)])
+    return res
+
+
+@numba.njit
+def _peak_prominence_sides(arr, poss, max_dist):
+    """
+    The positions of the adjacent higher peaks (or the points `max_dist` away)
+    on both sides of each peak and the prominence of the peak on each side.
+    """
+    n = len(arr)
+    higher_left = _nearest_higher_left(arr)
+    higher_right = n - 1 - _nearest_higher_left(arr[::-1])[::-1]
+    block = 64
+    table = _block_sparse_table(arr, block)
+
+    n_peaks = len(poss)
+    left_maxs = np.full(n_peaks, -1, dtype=np.int64)
+    right_maxs = np.full(n_peaks, -1, dtype=np.int64)
+    left_proms = np.full(n_peaks, np.nan)
+    right_proms = np.full(n_peaks, np.nan)
+    for k in range(n_peaks):
+        pos = poss[k]
+        left = max(higher_left[pos], pos - max_dist - 1)
+        if left >= 0:
+            left_maxs[k] = left
+            left_proms[k] = arr[pos] - _range_nanmin(arr, table, block, left, pos)
+
+        right = min(higher_right[pos], pos + max_dist + 1)
+        if right < n:
+            right_maxs[k] = right
+            right_proms[k] = arr[pos] - _range_nanmin(arr, table, block, pos, right)
+
+    return left_maxs, right_maxs, left_proms, right_proms
+
+
 def peakdet(arr, min_prominence):
     """Detect local peaks in an array.
     Finds a sequence of minima and maxima such that the two consecutive extrema
@@ -0,0 +1,64 @@
+import os.path as op
+import shutil
+
+import numpy as np
+import pytest
+
+import cooler
+import cooltools.api.balance as balance
+
+
+def _copy_cool(request, tmpdir):
+    in_cool = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
+    out_cool = op.join(tmpdir, "sin_eigs_mat.cool")
+    shutil.copy(in_cool, out_cool)
+    return cooler.Cooler(out_cool)
+
+
+def test_balance_ice(request, tmpdir):
+    clr = _copy_cool(request, tmpdir)
+    ref, ref_stats = cooler.balance_cooler(clr, ignore_diags=2, tol=1e-8)
+
+    bias, stats = balance.balance(
+        clr, method="ice", ignore_diags=2, tol=1e-8, chunksize=20_000
+    )
+    assert stats["converged"]
+    assert len(stats["trace"]) == stats["iternum"] + 1
+    assert np.array_equal(np.isnan(bias), np.isnan(ref))
+    assert np.allclose(bias, ref, equal_nan=True)
+    assert np.isclose(stats["scale"], ref_stats["scale"])
+
+    with pytest.raises(ValueError):
+        balance.balance(clr, method="unknown")
+
+
+def test_balance_kr(request, tmpdir):
+    clr = _copy_cool(request, tmpdir)
+    ref, _ = cooler.balance_cooler(clr, ignore_diags=2, tol=1e-8)
+
+    bias, stats = balance.balance(
+        clr,
+        method="kr",
+        ignore_diags=2,
+        tol=1e-8,
+        chunksize=20_000,
+        nproc=2,
+        store=True,
+        store_name="weight_kr",
+    )
+    assert stats["converged"]
+    assert stats["iternum"] < 50
+
+    # balanced marginals of the matrix with ignored diagonals are flat
+    mat = clr.matrix(balance="weight_kr")[:]
+    mat[np.abs(np.subtract.outer(np.arange(len(mat)), np.arange(len(mat)))) < 2] = 0
+    marg = np.nansum(mat, axis=0)
+    good = ~np.isnan(bias)
+    assert np.allclose(marg[good], 1, rtol=1e-6)
+
+    # KR and ICE weights agree up to a constant factor
+    ratio = bias[good] / ref[good]
+    assert np.allclose(ratio, ratio[0])
+
+    stored = cooler.Cooler(clr.uri).bins()["weight_kr"][:].values
+    assert np.allclose(stored, bias, equal_nan=True)
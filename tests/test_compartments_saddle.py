@@ -1,4 +1,6 @@
+import inspect
 import os.path as op
+import warnings
 import numpy as np
 import pandas as pd
 from click.testing import CliRunner
@@ -7,6 +9,8 @@ import pytest
 import cooler
 from cooltools.cli import cli
 import cooltools.api.saddle as saddle
+import cooltools.api.eigdecomp as eigdecomp
+from cooltools.lib import numutils
 
 
 ### TODO tests for non-covered click arguments:
@@ -69,6 +73,128 @@ def test_eigs_cis_phased(request, tmpdir):
     assert r > 0.95
 
 
+def test_eigs_cis_nproc(request):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    eigvals, eigvecs = eigdecomp.eigs_cis(clr, n_eigs=2, nproc=1)
+    eigvals_mp, eigvecs_mp = eigdecomp.eigs_cis(clr, n_eigs=2, nproc=2)
+
+    # eigenvectors are not phased, compare them up to a sign
+    assert np.allclose(
+        eigvals[["eigval1", "eigval2"]], eigvals_mp[["eigval1", "eigval2"]]
+    )
+    assert np.allclose(
+        np.abs(eigvecs[["E1", "E2"]]), np.abs(eigvecs_mp[["E1", "E2"]]), equal_nan=True
+    )
+    # every chromosome gets its own eigenvalues and eigenvectors
+    assert np.isfinite(eigvals[["eigval1", "eigval2"]].values).all()
+    assert len(eigvecs) == len(clr.bins())
+
+
+def test_eigs_cis_multires(request, tmpdir):
+    in_cool = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
+    coarse_cool = op.join(tmpdir, "sin_eigs_mat.20.cool")
+    cooler.coarsen_cooler(in_cool, coarse_cool, 2, chunksize=int(1e6))
+    cooler.balance_cooler(cooler.Cooler(coarse_cool), ignore_diags=2, store=True)
+
+    clr = cooler.Cooler(in_cool)
+    clr_coarse = cooler.Cooler(coarse_cool)
+    _, eigvecs_ref = eigdecomp.eigs_cis(clr, n_eigs=2)
+    for solver in ["arpack", "lobpcg", "randomized"]:
+        results = eigdecomp.eigs_cis_multires(
+            [clr, clr_coarse], n_eigs=2, solver=solver
+        )
+        assert sorted(results) == [10, 20]
+        _, eigvecs = results[10]
+        # warm-started eigenvectors agree with the default solver up to a sign
+        assert np.allclose(
+            np.abs(eigvecs["E1"]), np.abs(eigvecs_ref["E1"]), atol=1e-5, equal_nan=True
+        )
+
+    # upsampled coarse eigenvectors cover every fine bin
+    _, eigvecs_coarse = results[20]
+    upsampled = eigdecomp.upsample_eigvecs(eigvecs_coarse, clr.bins()[:], 20)
+    assert len(upsampled) == len(clr.bins())
+    assert np.array_equal(
+        upsampled["E1"].values[::2], eigvecs_coarse["E1"].values, equal_nan=True
+    )
+
+
+@pytest.mark.parametrize("solver", ["lobpcg", "randomized"])
+def test_eigs_cis_multires_warm_start(request, tmpdir, monkeypatch, solver):
+    in_cool = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
+    coarse_cool = op.join(tmpdir, "sin_eigs_mat.20.cool")
+    cooler.coarsen_cooler(in_cool, coarse_cool, 2, chunksize=int(1e6))
+    cooler.balance_cooler(cooler.Cooler(coarse_cool), ignore_diags=2, store=True)
+    clr = cooler.Cooler(in_cool)
+    clr_coarse = cooler.Cooler(coarse_cool)
+
+    # record the number of iterations the block solver takes per region
+    solver_func_name = f"_eigsh_{solver}"
+    solver_func = getattr(numutils, solver_func_name)
+    n_iters = []
+
+    def counting_solver(mat, n, **kwargs):
+        _eigvals, _eigvecs, n_iter = solver_func(mat, n, **kwargs)
+        n_iters.append((mat.shape[0], n_iter))
+        return _eigvals, _eigvecs, n_iter
+
+    monkeypatch.setattr(numutils, solver_func_name, counting_solver)
+
+    eigdecomp.eigs_cis(clr, n_eigs=2, solver=solver)
+    cold = [n_iter for n_rows, n_iter in n_iters]
+    n_iters.clear()
+    eigdecomp.eigs_cis_multires([clr, clr_coarse], n_eigs=2, solver=solver)
+    # the coarse resolution is solved first, from a cold start, by arpack
+    assert len(n_iters) == len(cold)
+    warm = [n_iter for n_rows, n_iter in n_iters]
+    assert sum(warm) < sum(cold)
+
+
+def test_eigs_cis_multires_default_solver(tmpdir, monkeypatch):
+    # a noisy compartment-like map, where subspace iteration converges slowly
+    n, binsize = 1000, 1000
+    rng = np.random.RandomState(0)
+    x = np.arange(n)
+    compartments = np.sign(np.sin(x / 25))
+    mean = 20 * (1 + 0.3 * np.outer(compartments, compartments))
+    i, j = np.triu_indices(n)
+    bins = cooler.binnify(pd.Series({"chr1": n * binsize}), binsize)
+    pixels = pd.DataFrame(
+        {"bin1_id": i, "bin2_id": j, "count": rng.poisson(mean[i, j])}
+    )
+    fine_cool = op.join(tmpdir, "noisy.1000.cool")
+    coarse_cool = op.join(tmpdir, "noisy.2000.cool")
+    cooler.create_cooler(fine_cool, bins, pixels[pixels["count"] > 0])
+    cooler.coarsen_cooler(fine_cool, coarse_cool, 2, chunksize=int(1e6))
+    clrs = [cooler.Cooler(fine_cool), cooler.Cooler(coarse_cool)]
+    for clr in clrs:
+        cooler.balance_cooler(clr, ignore_diags=2, store=True)
+
+    # record the block solvers' iterations, neither should run out of them
+    max_iter = inspect.signature(numutils._eigsh_lobpcg).parameters["max_iter"]
+    n_iters = []
+    for solver in ["lobpcg", "randomized"]:
+        solver_func_name = f"_eigsh_{solver}"
+        solver_func = getattr(numutils, solver_func_name)
+
+        def counting_solver(mat, n, solver_func=solver_func, **kwargs):
+            _eigvals, _eigvecs, n_iter = solver_func(mat, n, **kwargs)
+            n_iters.append(n_iter)
+            return _eigvals, _eigvecs, n_iter
+
+        monkeypatch.setattr(numutils, solver_func_name, counting_solver)
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        results = eigdecomp.eigs_cis_multires(clrs)
+    assert sorted(results) == [1000, 2000]
+    # only the fine resolution is solved by the block solver, warm-started
+    assert len(n_iters) == 1
+    assert max(n_iters) < max_iter.default
+    assert not any("tolerance" in str(w.message) for w in caught)
+    assert not any("did not converge" in str(w.message) for w in caught)
+
+
 def test_eigs_trans_cli(request, tmpdir):
     # somehow - it is E3 that captures sin-like plaid
     # pattern, instead of E1 - we'll keep it like that for now:
@@ -131,6 +257,26 @@ def test_eigs_trans_phased_cli(request, tmpdir):
     assert r > 0.95
 
 
+def test_eigs_trans_sparse(request, tmpdir):
+    in_cool = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
+    clr = cooler.Cooler(in_cool)
+    eigvals, eigvecs = eigdecomp.eigs_trans(clr, n_eigs=3, sparse=True, chunksize=5000)
+    assert eigvals.shape == (1, 3)
+    r = np.abs(np.corrcoef(eigvecs.E1.values, np.sin(eigvecs.start * 2 * np.pi / 500)))
+    assert r[0, 1] > 0.95
+
+    out_eig_prefix = op.join(tmpdir, "test.eigs")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ["eigs-trans", "--sparse", "-o", out_eig_prefix, in_cool]
+    )
+    assert result.exit_code == 0
+    test_trans_eigs = pd.read_table(out_eig_prefix + ".trans.vecs.tsv", sep="\t")
+    assert np.allclose(
+        np.abs(test_trans_eigs.E1.values), np.abs(eigvecs.E1.values), equal_nan=True
+    )
+
+
 def test_saddle_cli(request, tmpdir):
     in_cool = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
     out_eig_prefix = op.join(tmpdir, "test.eigs")
@@ -417,3 +563,21 @@ def test_saddle(request, tmpdir):
     # TODO: tests after adding input agreement, e.g.
     # asserting saddle.saddle(clr, cis-type-expected, track, "trans")
     # throws an error
+
+
+def test_saddle_float32(request, tmpdir):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    track = pd.read_table(op.join(request.fspath.dirname, "data/sin_eigs_track.tsv"))
+    out_expected = op.join(tmpdir, "test.cis.expected")
+    result = CliRunner().invoke(cli, ["expected-cis", "-o", out_expected, clr.uri])
+    assert result.exit_code == 0
+    expected = pd.read_csv(out_expected, sep="\t")
+
+    S, C = saddle.saddle(clr, expected, track.iloc[:, :4], "cis", 10, qrange=(0, 1))
+    S32, C32 = saddle.saddle(
+        clr, expected, track.iloc[:, :4], "cis", 10, qrange=(0, 1), dtype=np.float32
+    )
+    # only the OBS/EXP matrices are float32, the sums are accumulated in float64:
+    assert S32.dtype == np.float64
+    assert np.array_equal(C32, C)
+    assert np.allclose(S32, S, rtol=1e-6)
@@ -0,0 +1,84 @@
+import os.path as op
+
+import numpy as np
+import pandas as pd
+import bioframe
+from click.testing import CliRunner
+from cooltools.cli import cli
+
+from cooltools.api.directionality import directionality
+import cooler
+
+
+def _directionality_dense(A, window, ignore_diags):
+    # upstream and downstream sums within the window, outside ignored diagonals
+    N = A.shape[0]
+    a = np.zeros(N)
+    b = np.zeros(N)
+    for i in range(N):
+        if i >= ignore_diags:
+            a[i] = np.nansum(A[max(0, i - window + 1) : i - ignore_diags + 1, i])
+        b[i] = np.nansum(A[i, i + ignore_diags : i + window])
+    with np.errstate(all="ignore"):
+        ratio = (b - a) / (a + b)
+        e = (a + b) / 2.0
+        index = np.sign(b - a) * ((a - e) ** 2 + (b - e) ** 2) / e
+    return ratio, index
+
+
+def test_directionality(request):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    windows = [50, 100]
+    view_df = bioframe.make_viewframe(
+        [
+            ("chr1", 0, 500, "chr1p"),
+            ("chr1", 500, 1000, "chr1q"),
+            ("chr3", 0, 3000, "chr3"),
+        ]
+    )
+
+    dir_table = directionality(
+        clr, window_bp=windows, view_df=view_df, min_dist_bad_bin=0, chunksize=1000
+    )
+    assert len(dir_table) == 50 + 50 + 300
+    assert (dir_table["region"].unique() == view_df["name"].values).all()
+
+    for region in view_df.itertuples():
+        A = clr.matrix().fetch((region.chrom, region.start, region.end))
+        dir_region = dir_table[dir_table["region"] == region.name]
+        for w in windows:
+            ratio, index = _directionality_dense(A, w // 10, ignore_diags=2)
+            assert np.allclose(
+                dir_region[f"directionality_ratio_{w}"], ratio, equal_nan=True
+            )
+            assert np.allclose(
+                dir_region[f"directionality_index_{w}"], index, equal_nan=True
+            )
+
+    # one process per region and prefetched reads give the same results
+    dir_table_nproc = directionality(
+        clr,
+        window_bp=windows,
+        view_df=view_df,
+        min_dist_bad_bin=0,
+        chunksize=1000,
+        prefetch=2,
+        nproc=3,
+    )
+    pd.testing.assert_frame_equal(dir_table, dir_table_nproc)
+
+
+def test_directionality_cli(request, tmpdir):
+    in_cool = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
+    out_path = op.join(tmpdir, "sin_eigs_mat.directionality.tsv")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["directionality", "-o", out_path, "--window-pixels", in_cool, "5", "10"],
+    )
+    assert result.exit_code == 0
+    dir_table = pd.read_table(out_path)
+    assert len(dir_table) == len(cooler.Cooler(in_cool).bins())
+    for w in [50, 100]:
+        assert f"directionality_ratio_{w}" in dir_table.columns
+        assert f"directionality_index_{w}" in dir_table.columns
@@ -2,11 +2,14 @@
 
 import numpy as np
 import pandas as pd
+import cooler
+import pytest
 
 import os.path as op
 
 from cooltools.api import dotfinder
 from cooltools.lib.numutils import LazyToeplitz
+from cooltools.lib.common import make_cooler_view
 
 
 # adjust the path for data:
@@ -213,3 +216,425 @@ def test_adjusted_expected_tile_some_nans_and_square_tiling_diag_band():
         mock_res_sorted["la_expected"],
         equal_nan=True,
     ).all()
+
+
+def test_adjusted_expected_tile_band_and_nans_filters():
+    # filtering candidate pixels on the fly must agree with filtering
+    # the complete table of a tile afterwards:
+    nnans = 2
+    band_idx = int(band_1 / b)
+    kernels = {"donut": kernel, "footprint": np.ones_like(kernel)}
+    for tilei, tilej in dotfinder.square_matrix_tiling(
+        start, stop, step=40, edge=w, square=False
+    ):
+        args = dict(
+            origin=(tilei[0], tilej[0]),
+            observed=mock_M_raw[slice(*tilei), slice(*tilej)],
+            expected=mock_exp[slice(*tilei), slice(*tilej)],
+            bal_weights=(mock_v_ice[slice(*tilei)], mock_v_ice[slice(*tilej)]),
+            kernels=kernels,
+        )
+        res = dotfinder.get_adjusted_expected_tile_some_nans(**args)
+        is_inside_band = res["bin1_id"] > (res["bin2_id"] - band_idx)
+        does_comply_nans = np.all(
+            res[[f"la_exp.{k}.nnans" for k in kernels]] < nnans, axis=1
+        )
+        res = res[is_inside_band & does_comply_nans].reset_index(drop=True)
+
+        filtered = pd.DataFrame(
+            dotfinder._adjusted_expected_tile_arrays(
+                band_to_cover=band_idx, nans_tolerated=nnans, **args
+            )
+        )
+        pd.testing.assert_frame_equal(filtered, res)
+
+
+def test_adaptive_matrix_tiling():
+    # without edges, tiles must cover every pixel of the band exactly once:
+    rng = np.random.RandomState(0)
+    step, band_bins = 30, 45
+    valid = rng.rand(300) > 0.2
+    valid[100:180] = False
+    coverage = np.zeros((300, 300), dtype=int)
+    for tilei, tilej in dotfinder.adaptive_matrix_tiling(
+        0, 300, step, 0, band_bins, valid
+    ):
+        assert (tilei[1] - tilei[0]) * (tilej[1] - tilej[0]) <= step * step
+        coverage[slice(*tilei), slice(*tilej)] += 1
+    i, j = np.indices(coverage.shape)
+    in_band = (j >= i) & (j - i < band_bins)
+    assert np.all(coverage[in_band] == 1)
+
+    # and must reproduce the results of the regular tiling:
+    nnans = 1
+    band_idx = int(band / b)
+    kernels = {"donut": kernel, "footprint": np.ones_like(kernel)}
+    res_df = []
+    for tilei, tilej in dotfinder.adaptive_matrix_tiling(
+        start, stop, step=40, edge=w, band=band_idx
+    ):
+        res = dotfinder.get_adjusted_expected_tile_some_nans(
+            origin=(tilei[0], tilej[0]),
+            observed=mock_M_raw[slice(*tilei), slice(*tilej)],
+            expected=mock_exp[slice(*tilei), slice(*tilej)],
+            bal_weights=(mock_v_ice[slice(*tilei)], mock_v_ice[slice(*tilej)]),
+            kernels=kernels,
+        )
+        is_inside_band = res["bin1_id"] > (res["bin2_id"] - band_idx)
+        does_comply_nans = res["la_exp.footprint.nnans"] < nnans
+        res_df.append(res[is_inside_band & does_comply_nans])
+    res_df = pd.concat(res_df, ignore_index=True)
+    assert not res_df.duplicated().any()
+    res_df = res_df.sort_values(by=["bin1_id", "bin2_id"]).reset_index(drop=True)
+
+    mock_res_sorted = (
+        mock_res.drop_duplicates()
+        .sort_values(by=["bin1_id", "bin2_id"])
+        .reset_index(drop=True)
+    )
+    assert res_df[["bin1_id", "bin2_id"]].equals(
+        mock_res_sorted[["bin1_id", "bin2_id"]]
+    )
+    assert np.isclose(
+        res_df["la_exp.donut.value"], mock_res_sorted["la_expected"], equal_nan=True
+    ).all()
+
+
+def test_heatmap_tiles_generator_diag_skips_empty_tiles(tmpdir):
+    binsize = 1000
+    chromsizes = pd.Series({"chr1": 200 * binsize, "chrUn1": 30 * binsize})
+    bins = cooler.binnify(chromsizes, binsize)
+    # a masked stretch of chr1 and a fully masked contig:
+    bins["weight"] = 1.0
+    bins.loc[80:159, "weight"] = np.nan
+    bins.loc[200:, "weight"] = np.nan
+    i, j = np.triu_indices(200)
+    near = j - i < 70
+    pixels = pd.DataFrame({"bin1_id": i[near], "bin2_id": j[near], "count": 1})
+    cool_path = op.join(tmpdir, "test.cool")
+    cooler.create_cooler(cool_path, bins, pixels)
+    clr = cooler.Cooler(cool_path)
+    view_df = make_cooler_view(clr)
+
+    # chrUn1 has no pixels at all:
+    all_tiles = list(
+        dotfinder.heatmap_tiles_generator_diag(
+            clr, view_df, 2, 20, 60, clr_weight_name=None
+        )
+    )
+    assert {region for region, _, _ in all_tiles} == {"chr1"}
+    # tiles without valid rows or columns are skipped:
+    weights = bins["weight"].values
+    is_valid = lambda span: np.isfinite(weights[slice(*span)]).any()
+    tiles = list(dotfinder.heatmap_tiles_generator_diag(clr, view_df, 2, 20, 60))
+    assert tiles == [t for t in all_tiles if is_valid(t[1]) and is_valid(t[2])]
+    assert len(tiles) < len(all_tiles)
+
+
+def test_estimate_tile_costs(tmpdir):
+    clr, _ = _poisson_cooler_and_expected(op.join(tmpdir, "test.cool"))
+    tiles = [("chr1", (0, 40), (0, 40)), ("chr1", (0, 40), (40, 80))]
+    costs = dotfinder.estimate_tile_costs(clr, tiles, 10)
+    pixels = clr.pixels()[:]
+    nnz_rows = (pixels["bin1_id"] < 40).sum()
+    # the diagonal tile has 10 pixels within the band in 31 rows, and fewer in
+    # the last 9 rows, the off-diagonal one has 45 pixels within the band:
+    assert costs.tolist() == [nnz_rows + 31 * 10 + 45, nnz_rows + 45]
+
+
+def test_map_tiles(caplog):
+    tiles = list(range(20))
+    costs = [tile % 7 for tile in tiles]
+    for nproc in [1, 2]:
+        with caplog.at_level("INFO"):
+            caplog.clear()
+            results = list(
+                dotfinder._map_tiles(lambda x: x ** 2, tiles, nproc, True, costs=costs)
+            )
+        # the costliest tiles first:
+        assert results == [x ** 2 for x in sorted(tiles, key=lambda x: -(x % 7))]
+        assert "20 tiles done" in caplog.text
+        assert "worker 0:" in caplog.text
+
+
+class _CountedPickles:
+    # counts how many times it was pickled in this process
+    n_pickled = 0
+
+    def __reduce__(self):
+        _CountedPickles.n_pickled += 1
+        return (_CountedPickles, ())
+
+
+def test_map_tiles_pickles_job_once_per_worker():
+    payload = _CountedPickles()
+    tiles = list(range(20))
+
+    def job(x):
+        return (payload, x ** 2)[1]
+
+    results = list(dotfinder._map_tiles(job, tiles, 2, False))
+    assert results == [x ** 2 for x in tiles]
+    # at most once for every worker, not for every tile:
+    assert _CountedPickles.n_pickled <= 2
+
+
+def test_checkpointed_map(tmpdir):
+    calls = []
+
+    def job(tile):
+        calls.append(tile)
+        if len(calls) > 25:
+            raise RuntimeError("interrupted")
+        return tile[0] * 2
+
+    tiles = [(i, (i, i + 1)) for i in range(40)]
+    checkpoint_dir = op.join(tmpdir, "tiles")
+    results = dotfinder._checkpointed_map(map, job, tiles, checkpoint_dir)
+    with pytest.raises(RuntimeError):
+        list(results)
+    # the first 2 batches of 10 tiles are persisted, only the rest is redone:
+    calls.clear()
+    results = list(dotfinder._checkpointed_map(map, job, tiles, checkpoint_dir))
+    assert sorted(results) == [i * 2 for i in range(40)]
+    assert calls == tiles[20:]
+
+
+def _poisson_cooler_and_expected(cool_path, n=300, binsize=1000, dots=()):
+    # Poisson counts decaying with the distance from the diagonal, with
+    # 10-fold enrichment at the pixels of "dots":
+    bins = cooler.binnify(pd.Series({"chr1": n * binsize}), binsize)
+    bins["weight"] = 1.0
+    i, j = np.triu_indices(n)
+    mean = 100 / (1 + j - i)
+    for dot_i, dot_j in dots:
+        mean[(i == dot_i) & (j == dot_j)] *= 10
+    rng = np.random.RandomState(0)
+    pixels = pd.DataFrame({"bin1_id": i, "bin2_id": j, "count": rng.poisson(mean)})
+    pixels = pixels[pixels["count"] > 0]
+    cooler.create_cooler(cool_path, bins, pixels)
+    expected = pd.DataFrame(
+        {"region1": "chr1", "region2": "chr1", "dist": np.arange(n)}
+    ).set_index(["region1", "region2", "dist"])
+    expected["balanced.avg"] = 100 / (1 + np.arange(n))
+    return cooler.Cooler(cool_path), expected
+
+
+def test_scoring_and_histogramming_step_resume(tmpdir):
+    clr, expected = _poisson_cooler_and_expected(op.join(tmpdir, "test.cool"))
+    view_df = make_cooler_view(clr)
+
+    kernels = {k: dotfinder.get_kernel(3, 1, k) for k in ["donut", "vertical"]}
+    ledges = np.r_[-np.inf, np.logspace(0, 39, num=40, base=2 ** (1 / 3)), np.inf]
+    tiles = list(dotfinder.heatmap_tiles_generator_diag(clr, view_df, 3, 40, 100))
+    args = (clr, expected, "balanced.avg", "weight")
+    kwargs = dict(
+        kernels=kernels,
+        ledges=ledges,
+        max_nans_tolerated=2,
+        loci_separation_bins=100,
+        nproc=1,
+        verbose=False,
+    )
+    hist = dotfinder.scoring_and_histogramming_step(*args, tiles=tiles, **kwargs)
+
+    # an interrupted run that got to score a part of the tiles:
+    checkpoint_dir = op.join(tmpdir, "histogramming")
+    dotfinder.scoring_and_histogramming_step(
+        *args, tiles=tiles[:7], checkpoint_dir=checkpoint_dir, **kwargs
+    )
+    hist_resumed = dotfinder.scoring_and_histogramming_step(
+        *args, tiles=tiles, checkpoint_dir=checkpoint_dir, **kwargs
+    )
+    for k in kernels:
+        pd.testing.assert_frame_equal(hist_resumed[k], hist[k])
+
+
+def test_scoring_step(tmpdir):
+    clr, expected = _poisson_cooler_and_expected(op.join(tmpdir, "test.cool"))
+    view_df = make_cooler_view(clr)
+
+    kernels = {k: dotfinder.get_kernel(3, 1, k) for k in ["donut", "vertical"]}
+    tiles = list(dotfinder.heatmap_tiles_generator_diag(clr, view_df, 3, 40, 100))
+    args = (clr, expected, "balanced.avg", "weight", tiles, kernels, 2, 100, None)
+    scores = pd.concat(
+        [
+            dotfinder.score_tile(
+                tile,
+                clr,
+                expected,
+                "balanced.avg",
+                "weight",
+                kernels,
+                2,
+                100,
+                None,
+                False,
+            )
+            for tile in tiles
+        ]
+    ).reset_index(drop=True)
+    # scored in the pool, pixels are still in the order of the tiles:
+    for nproc in [1, 2]:
+        pd.testing.assert_frame_equal(
+            dotfinder.scoring_step(*args, nproc, False), scores
+        )
+
+
+def test_single_pass_scoring_and_extraction(tmpdir):
+    dots = [(30, 40), (100, 125), (210, 218), (250, 290)]
+    clr, expected = _poisson_cooler_and_expected(
+        op.join(tmpdir, "test.cool"), dots=dots
+    )
+    view_df = make_cooler_view(clr)
+
+    kernels = {k: dotfinder.get_kernel(3, 1, k) for k in ["donut", "vertical"]}
+    ledges = np.r_[-np.inf, np.logspace(0, 39, num=40, base=2 ** (1 / 3)), np.inf]
+    tiles = list(dotfinder.heatmap_tiles_generator_diag(clr, view_df, 3, 40, 100))
+    fdr = 0.1
+    args = (clr, expected, "balanced.avg", "weight", tiles, kernels, ledges)
+
+    # two-pass reference:
+    hist = dotfinder.scoring_and_histogramming_step(*args, 2, 100, 1, False)
+    thresholds, _ = dotfinder.determine_thresholds(kernels, ledges, hist, fdr)
+    pixels = dotfinder.scoring_and_extraction_step(
+        *args, thresholds, 2, None, 100, None, 1, False
+    )
+    assert set(zip(pixels["bin1_id"], pixels["bin2_id"])) >= set(dots)
+
+    spill_dir = op.join(tmpdir, "candidates")
+    hist_sp, spill_paths = dotfinder.scoring_histogramming_and_spilling_step(
+        *args, fdr, 2, 100, spill_dir, 1, False, spill_size=100
+    )
+    for k in kernels:
+        pd.testing.assert_frame_equal(hist_sp[k], hist[k])
+    assert len(spill_paths) > 1
+    # candidates are a small superset of the extracted pixels:
+    candidates = pd.concat([pd.read_pickle(path) for path in spill_paths])
+    assert len(candidates) < hist["donut"].values.sum() / 10
+
+    thresholds_sp, _ = dotfinder.determine_thresholds(kernels, ledges, hist_sp, fdr)
+    pixels_sp = dotfinder.extraction_from_spill_step(
+        spill_paths, kernels, ledges, thresholds_sp, None, False
+    )
+    pd.testing.assert_frame_equal(pixels_sp, pixels)
+
+    # checkpointed tiles hold the candidates, which are not spilled again:
+    checkpoint_dir = op.join(tmpdir, "histogramming")
+    spill_dir = op.join(tmpdir, "candidates.checkpointed")
+    hist_cp, spill_paths = dotfinder.scoring_histogramming_and_spilling_step(
+        *args, fdr, 2, 100, spill_dir, 1, False, checkpoint_dir=checkpoint_dir
+    )
+    for k in kernels:
+        pd.testing.assert_frame_equal(hist_cp[k], hist[k])
+    assert not op.exists(spill_dir)
+    assert all(op.dirname(path) == checkpoint_dir for path in spill_paths)
+    pixels_cp = dotfinder.extraction_from_spill_step(
+        spill_paths, kernels, ledges, thresholds_sp, None, False
+    )
+    pd.testing.assert_frame_equal(pixels_cp, pixels)
+
+
+def test_annotate_pixels_with_qvalues():
+    kernels = {"donut": None, "vertical": None}
+    ledges = np.r_[-np.inf, np.logspace(0, 39, num=40, base=2 ** (1 / 3)), np.inf]
+    rng = np.random.RandomState(0)
+    scored_df = pd.DataFrame({"count": rng.poisson(5, 1000)})
+    for k in kernels:
+        scored_df[f"la_exp.{k}.value"] = rng.uniform(0.5, 10, 1000)
+    # lambda-chunks are closed on the right, and the labels of pd.cut intervals
+    # are rounded, e.g. (1.26, 1.587] for the chunk (1.2599, 1.5874]:
+    scored_df.loc[:9, "la_exp.donut.value"] = ledges[1:11]
+    scored_df.loc[10, "la_exp.donut.value"] = 1.58738
+    hist = dotfinder.histogram_scored_pixels(scored_df, kernels, ledges, False)
+    hist = dotfinder._drop_top_lambda_chunk(hist)
+    _, qvalues = dotfinder.determine_thresholds(kernels, ledges, hist, 0.1)
+
+    pixels = dotfinder.annotate_pixels_with_qvalues(
+        scored_df, qvalues, kernels, ledges=ledges
+    )
+    for k in kernels:
+        assert qvalues[k].shape == (len(ledges) - 2, scored_df["count"].max() + 1)
+        # q-values of the lambda-chunks the pixels were histogrammed in:
+        lbins = pd.cut(scored_df[f"la_exp.{k}.value"], ledges).cat.codes
+        assert np.array_equal(
+            pixels[f"la_exp.{k}.qval"],
+            qvalues[k][lbins, scored_df["count"]],
+            equal_nan=True,
+        )
+
+    # inplace is still the 4th positional argument, ledges are required:
+    dotfinder.annotate_pixels_with_qvalues(
+        scored_df, qvalues, kernels, True, ledges=ledges
+    )
+    assert "la_exp.donut.qval" in scored_df
+    with pytest.raises(ValueError, match="ledges"):
+        dotfinder.annotate_pixels_with_qvalues(scored_df, qvalues, kernels)
+
+
+def test_float32_scoring(tmpdir):
+    dots = [(30, 40), (100, 125), (210, 218), (250, 290)]
+    clr, expected = _poisson_cooler_and_expected(
+        op.join(tmpdir, "test.cool"), dots=dots
+    )
+    view_df = make_cooler_view(clr)
+
+    kernels = {k: dotfinder.get_kernel(3, 1, k) for k in ["donut", "vertical"]}
+    ledges = np.r_[-np.inf, np.logspace(0, 39, num=40, base=2 ** (1 / 3)), np.inf]
+    tiles = list(dotfinder.heatmap_tiles_generator_diag(clr, view_df, 3, 40, 100))
+    args = (clr, expected, "balanced.avg", "weight", tiles, kernels, ledges)
+
+    pixels = {}
+    for dtype in [np.float64, np.float32]:
+        hist = dotfinder.scoring_and_histogramming_step(
+            *args, 2, 100, 1, False, dtype=dtype
+        )
+        thresholds, _ = dotfinder.determine_thresholds(kernels, ledges, hist, 0.1)
+        pixels[dtype] = dotfinder.scoring_and_extraction_step(
+            *args, thresholds, 2, None, 100, None, 1, False, dtype=dtype
+        )
+
+    # rounding of float32 may only move a handful of pixels between the
+    # lambda-chunks, the calls are the same:
+    pd.testing.assert_frame_equal(
+        pixels[np.float32][["bin1_id", "bin2_id", "count"]],
+        pixels[np.float64][["bin1_id", "bin2_id", "count"]],
+    )
+    for k in kernels:
+        assert np.allclose(
+            pixels[np.float32][f"la_exp.{k}.value"],
+            pixels[np.float64][f"la_exp.{k}.value"],
+            rtol=1e-5,
+        )
+
+
+def test_dots_multires(tmpdir):
+    dots = [(40, 70), (100, 125), (160, 200), (250, 290)]
+    clr, _ = _poisson_cooler_and_expected(
+        op.join(tmpdir, "test.cool"), binsize=10000, dots=dots
+    )
+    coarse_path = op.join(tmpdir, "test.20000.cool")
+    cooler.coarsen_cooler(clr.uri, coarse_path, 2, chunksize=10 ** 6)
+    clr_coarse = cooler.Cooler(coarse_path)
+    cooler.balance_cooler(clr_coarse, ignore_diags=1, store=True)
+
+    clrs = {10000: clr, 20000: clr_coarse}
+    kwargs = dict(
+        max_loci_separation=1_000_000,
+        tile_size=400_000,
+        fdr=0.1,
+        dots_clustering_radius=30000,
+    )
+    calls, merged = dotfinder.dots_multires(clrs, **kwargs)
+    assert set(zip(calls[10000]["start1"], calls[10000]["start2"])) >= {
+        (i * 10000, j * 10000) for i, j in dots
+    }
+    # all of the coarse dots are close to the fine ones:
+    assert (merged["resolution"] == 10000).all()
+    assert len(merged) == len(calls[10000])
+
+    # a shared pool of workers gives the same results:
+    calls_parallel, merged_parallel = dotfinder.dots_multires(clrs, nproc=2, **kwargs)
+    for res in clrs:
+        pd.testing.assert_frame_equal(calls_parallel[res], calls[res])
+    pd.testing.assert_frame_equal(merged_parallel, merged)
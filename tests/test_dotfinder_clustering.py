@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial.distance import cdist
+
+from cooltools.api import dotfinder
+
+
+def make_blobs(n_blobs=30, seed=0):
+    # compact blobs of pixels, well separated from each other:
+    rng = np.random.RandomState(seed)
+    centers = np.c_[np.arange(n_blobs) * 50, np.arange(n_blobs) * 50 + 100]
+    sizes = rng.randint(1, 20, n_blobs)
+    coords = np.concatenate(
+        [c + rng.randint(-3, 4, (size, 2)) for c, size in zip(centers, sizes)]
+    )
+    coords = np.unique(coords, axis=0)
+    return pd.DataFrame({"bin1_id": coords[:, 0], "bin2_id": coords[:, 1]})
+
+
+def test_clust_2D_pixels():
+    pixels_df = make_blobs()
+    # a shuffled index must be carried over:
+    pixels_df.index = np.random.RandomState(1).permutation(len(pixels_df)) + 10
+    radius = 2.5
+    res = dotfinder.clust_2D_pixels(pixels_df, threshold_cluster=radius, verbose=False)
+    assert res.index.equals(pixels_df.index)
+
+    # brute force single-linkage clusters:
+    coords = pixels_df.values.astype(float)
+    n, labels = connected_components(cdist(coords, coords) <= radius, directed=False)
+    assert res["c_label"].nunique() == n
+    # same partition of the pixels:
+    assert len(pd.crosstab(labels, res["c_label"].values).values.nonzero()[0]) == n
+    for label in range(n):
+        in_cluster = labels == label
+        cluster = res[in_cluster]
+        assert np.all(cluster["c_size"] == in_cluster.sum())
+        assert np.allclose(
+            cluster[["cbin1_id", "cbin2_id"]], coords[in_cluster].mean(0)
+        )
+
+    # the Birch-based clustering reports the same columns:
+    res_birch = dotfinder.clust_2D_pixels(
+        pixels_df, threshold_cluster=radius, verbose=False, method="birch"
+    )
+    assert list(res_birch.columns) == list(res.columns)
+    assert res_birch.groupby("c_label")["c_size"].first().sum() == len(pixels_df)
+
+
+def test_clustering_step_parallel():
+    pixels_df = make_blobs(seed=2)
+    scores_df = pd.DataFrame(
+        {
+            "chrom1": "chr1",
+            "start1": pixels_df["bin1_id"] * 1000,
+            "chrom2": "chr1",
+            "start2": pixels_df["bin2_id"] * 1000,
+            "region": np.where(pixels_df["bin1_id"] < 725, "chr1_p", "chr1_q"),
+            "count": np.arange(len(pixels_df)),
+        }
+    )
+    centroids = dotfinder.clustering_step(
+        scores_df, ["chr1_p", "chr1_q"], 10000, False, nproc=1
+    )
+    centroids_parallel = dotfinder.clustering_step(
+        scores_df, ["chr1_p", "chr1_q"], 10000, False, nproc=2
+    )
+    pd.testing.assert_frame_equal(centroids, centroids_parallel)
+    # one brightest pixel per blob:
+    assert len(centroids) == 30
+    assert centroids["c_size"].sum() == len(scores_df)
+
+
+def test_merge_dot_calls():
+    def calls(chroms, starts1, starts2):
+        return pd.DataFrame(
+            {
+                "chrom1": chroms,
+                "chrom2": chroms,
+                "cstart1": starts1,
+                "cstart2": starts2,
+            }
+        )
+
+    calls_5kb = calls(["chr1", "chr1"], [100_000, 500_000], [300_000, 900_000])
+    calls_10kb = calls(
+        ["chr1", "chr1", "chr2"],
+        [110_000, 500_000, 100_000],
+        [310_000, 930_000, 300_000],
+    )
+    calls_25kb = calls(["chr1", "chr2"], [160_000, 125_000], [360_000, 325_000])
+    merged = dotfinder.merge_dot_calls(
+        {25000: calls_25kb, 5000: calls_5kb, 10000: calls_10kb}
+    )
+    # 10kb calls within 20kb from 5kb ones, and 25kb calls within 50kb from
+    # finer ones are dropped:
+    assert merged["resolution"].tolist() == [5000, 5000, 10000, 10000, 25000]
+    assert merged["cstart2"].tolist() == [300_000, 900_000, 930_000, 300_000, 360_000]
+
+    merged = dotfinder.merge_dot_calls({5000: calls_5kb, 10000: calls_10kb}, 50_000)
+    assert merged["resolution"].tolist() == [5000, 5000, 10000]
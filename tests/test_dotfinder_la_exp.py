@@ -4,10 +4,12 @@
 
 import numpy as np
 import pandas as pd
+from scipy.ndimage import convolve
 
 import os.path as op
 
 # try importing stuff from dotfinder:
+from cooltools.api import dotfinder
 from cooltools.api.dotfinder import get_adjusted_expected_tile_some_nans
 
 # adjust the path for data:
@@ -111,3 +113,32 @@ def test_adjusted_expected_tile_some_nans():
 
     # now we can only guess the size:
     assert len(res) > len(mock_res)
+
+
+def test_count_nans_in_footprint():
+    rng = np.random.RandomState(0)
+    kernels = [
+        dotfinder.get_kernel(w, p, ktype)
+        for w, p in [(1, 0), (3, 1), (5, 2)]
+        for ktype in ["donut", "vertical", "horizontal", "lowleft", "upright"]
+    ]
+    # asymmetric footprints, including even-sized ones:
+    kernels += [(rng.rand(*shape) < 0.5) for shape in [(3, 5), (4, 4), (2, 7)]]
+    N = rng.rand(30, 40) < 0.2
+    for kernel in kernels:
+        pad = max(kernel.shape)
+        nnans = dotfinder._count_nans_in_footprint(
+            dotfinder._nans_integral_image(N, pad),
+            pad,
+            dotfinder._footprint_rectangles(kernel),
+            np.arange(N.shape[0])[:, None],
+            np.arange(N.shape[1])[None, :],
+        )
+        # convolution of NaNs with the footprint, only NaNs beyond the boundary:
+        expected_nnans = convolve(
+            N.astype(np.int64),
+            (kernel != 0).astype(np.int64),
+            mode="constant",
+            cval=1,
+        )
+        assert np.array_equal(nnans, expected_nnans)
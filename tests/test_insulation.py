@@ -95,6 +95,25 @@ def test_find_boundaries(request):
     )
 
 
+def test_find_boundaries_nproc(request):
+    clr_path = op.join(request.fspath.dirname, "data/sin_eigs_mat.cool")
+    clr = cooler.Cooler(clr_path)
+    windows = [30, 100]
+
+    insulation = calculate_insulation_score(clr, windows)
+    boundaries = find_boundaries(insulation, min_dist_bad_bin=2)
+    for window in windows:
+        assert boundaries[f"boundary_strength_{window}"].notnull().any()
+        assert (boundaries[f"boundary_strength_{window}"].dropna() >= 0).all()
+
+    # Parallel calls and shuffled input give the same result in the same order:
+    shuffled = insulation.sample(frac=1, random_state=0)
+    boundaries_nproc = find_boundaries(shuffled, min_dist_bad_bin=2, nproc=2)
+    pd.testing.assert_frame_equal(
+        boundaries_nproc, boundaries.loc[shuffled.index, boundaries_nproc.columns]
+    )
+
+
 def test_insul_diamond(request):
     clr_path = op.join(request.fspath.dirname, "data/CN.mm9.1000kb.cool")
     clr = cooler.Cooler(clr_path)
@@ -1,5 +1,6 @@
 from scipy.linalg import toeplitz
 import numpy as np
+import pytest
 from cooltools.lib.numutils import LazyToeplitz
 
 
@@ -67,3 +68,84 @@ def test_nested():
         (slice(20, 30), slice(10, 40)),
     ]:
         assert np.allclose(L[si, sj], T[si, sj])
+
+
+def test_view():
+    for si, sj in [
+        (slice(10, 20), slice(10, 20)),
+        (slice(10, 20), slice(15, 45)),
+        (slice(30, 45), slice(10, 20)),
+        (slice(0, 100), slice(0, 149)),
+        (slice(10, 10), slice(10, 20)),
+    ]:
+        V = L.view((si.start, si.stop), (sj.start, sj.stop))
+        assert V.shape == T[si, sj].shape
+        assert np.array_equal(V, T[si, sj])
+        if V.size:
+            assert np.shares_memory(V, L._buf)
+            assert not V.flags.writeable
+
+
+def test_band():
+    i, j = np.indices(T.shape)
+    for si, sj in [
+        (slice(10, 20), slice(10, 20)),
+        (slice(10, 20), slice(15, 45)),
+        (slice(30, 45), slice(10, 20)),
+        (slice(0, 100), slice(0, 149)),
+    ]:
+        for min_diag, max_diag in [(0, 1), (0, 5), (2, 8), (3, 1000)]:
+            B = L.band((si.start, si.stop), (sj.start, sj.stop), max_diag, min_diag)
+            dist = np.abs(j - i)[si, sj]
+            in_band = (dist >= min_diag) & (dist < max_diag)
+            assert np.array_equal(B.toarray(), np.where(in_band, T[si, sj], 0))
+
+
+def test_gather():
+    rng = np.random.RandomState(0)
+    i = rng.randint(0, T.shape[0], 1000)
+    j = rng.randint(0, T.shape[1], 1000)
+    assert np.array_equal(L.gather(i, j), T[i, j])
+    assert np.array_equal(L.gather(i[:, None], j[None, :20]), T[i[:, None], j[:20]])
+    with pytest.raises(IndexError):
+        L.gather([0, T.shape[0]], [0, 0])
+
+
+def test_translation_invariance():
+    # blocks of a region's expected are queried with genome-wide bin ids
+    for si, sj in [
+        (slice(510, 530), slice(520, 560)),
+        (slice(560, 600), slice(505, 520)),
+        (slice(500, 600), slice(500, 649)),
+    ]:
+        block = T[si.start - 500 : si.stop - 500, sj.start - 500 : sj.stop - 500]
+        assert np.array_equal(L[si, sj], block)
+        assert np.array_equal(L.view((si.start, si.stop), (sj.start, sj.stop)), block)
+
+
+def test_out_of_bounds():
+    L10 = LazyToeplitz(np.arange(10))
+    # diagonals 13 to 17 are not stored
+    with pytest.raises(IndexError):
+        L10[0:3, 15:18]
+    with pytest.raises(IndexError):
+        L10.view((0, 3), (15, 18))
+    with pytest.raises(IndexError):
+        L10.view((-3, 5), (-3, 5))
+    # blocks past the shape are not clipped to the stored diagonals
+    for si, sj in [
+        (slice(500, 620), slice(500, 620)),
+        (slice(500, 510), slice(640, 660)),
+    ]:
+        with pytest.raises(IndexError):
+            L[si, sj]
+        with pytest.raises(IndexError):
+            L.view((si.start, si.stop), (sj.start, sj.stop))
+    with pytest.raises(IndexError):
+        L.band((500, 620), (500, 620), 1000)
+    # the band of a block only needs its own diagonals to be stored
+    B = L.band((500, 620), (500, 620), 5)
+    i, j = np.indices((120, 120))
+    d = j - i
+    dense = np.where(d >= 0, r[np.clip(d, 0, 4)], c[np.clip(-d, 0, 4)])
+    assert np.array_equal(B.toarray(), np.where(np.abs(d) < 5, dense, 0))
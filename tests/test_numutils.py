@@ -0,0 +1,332 @@
+import os.path as op
+import subprocess
+import sys
+
+import cooler
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+from cooltools.lib import numutils
+
+
+def _observed_over_expected_reference(matrix, mask, dist_bin_edge_ratio=1.03):
+    # straightforward two-pass implementation with a dense 2D mask
+    N = matrix.shape[0]
+    if mask.ndim == 1 and mask.size > 0:
+        mask = mask[:, None] & mask[None, :]
+    data = matrix.astype(np.float64)
+    dist_bins = np.r_[0, numutils._logbins_numba(1, N, dist_bin_edge_ratio)]
+    for lo, hi in zip(dist_bins[:-1], dist_bins[1:]):
+        pixels = [
+            (offset + j, j)
+            for offset in range(lo, hi)
+            for j in range(N - offset)
+            if mask.size == 0 or mask[offset + j, j]
+        ]
+        if not pixels:
+            continue
+        mean_pixel = np.mean([data[i, j] for i, j in pixels])
+        if mean_pixel == 0:
+            continue
+        for i, j in pixels:
+            data[i, j] /= mean_pixel
+            if i != j:
+                data[j, i] /= mean_pixel
+    return data
+
+
+@pytest.mark.parametrize("N", [2, 7, 64])
+def test_observed_over_expected(N):
+    rng = np.random.RandomState(N)
+    mat = rng.rand(N, N)
+    mat = mat + mat.T
+    masks = [
+        np.empty(shape=(0), dtype=np.bool_),
+        rng.rand(N) > 0.2,
+        rng.rand(N, N) > 0.3,
+    ]
+    for mask in masks:
+        expected = _observed_over_expected_reference(mat, mask)
+        OE, dist_bins, sum_pixels, n_pixels = numutils.observed_over_expected(mat, mask)
+        assert np.allclose(OE, expected)
+        assert dist_bins[0] == 0 and dist_bins[-1] == N
+        assert len(sum_pixels) == len(n_pixels) == len(dist_bins) - 1
+
+        # in-place normalization on the output buffer
+        buf = mat.copy()
+        OE, _, _, _ = numutils.observed_over_expected(buf, mask, out=buf)
+        assert OE is buf
+        assert np.allclose(buf, expected)
+
+    with pytest.raises(ValueError):
+        numutils.observed_over_expected(mat, out=np.empty((N, N), dtype=np.int64))
+
+
+def _adaptive_coarsegrain_reference(ar, countar, cutoff=5, max_levels=8, min_shape=8):
+    # pads to a square power-of-two array and keeps the whole pyramid
+    n, m = ar.shape
+    N = 2 ** int(np.ceil(np.log2(max(n, m))))
+    ar_pad = np.full((N, N), np.nan)
+    ar_pad[:n, :m] = ar
+    countar_pad = np.zeros((N, N))
+    countar_pad[:n, :m] = countar
+    mask = np.isfinite(ar_pad)
+    countar_pad[~mask] = 0
+    ar_pad[~mask] = 0
+
+    def coarsen(x, operation=np.sum):
+        M = x.shape[0] // 2
+        return operation(operation(x.reshape(M, 2, M, 2), axis=1), axis=2)
+
+    def expand(x):
+        return np.repeat(np.repeat(x, 2, axis=0), 2, axis=1)
+
+    levels = [(ar_pad, countar_pad, mask.astype(float))]
+    for _ in range(max_levels):
+        if levels[-1][0].shape[0] > min_shape:
+            levels.append(tuple(coarsen(x) for x in levels[-1]))
+
+    ar_cur, _, mask_cur = levels.pop()
+    while levels:
+        ar_next, countar_next, mask_next = levels.pop()
+        with np.errstate(invalid="ignore"):
+            addar = expand(ar_cur / mask_cur) * mask_next
+        replace = expand(coarsen(countar_next, operation=np.min)) < cutoff
+        ar_next[replace] = addar[replace]
+        ar_next[mask_next == 0] = 0
+        ar_cur, mask_cur = ar_next, mask_next
+    ar_cur[mask_cur == 0] = np.nan
+    return ar_cur[:n, :m]
+
+
+@pytest.mark.parametrize("shape", [(64, 64), (50, 50), (37, 90), (130, 17)])
+def test_adaptive_coarsegrain(shape):
+    rng = np.random.RandomState(sum(shape))
+    countar = rng.poisson(rng.rand(*shape) * 6)
+    ar = countar * rng.rand(*shape)
+    ar[rng.rand(*shape) < 0.1] = np.nan
+    ar[:, 3] = np.nan
+
+    for cutoff, max_levels in [(5, 8), (2, 8), (20, 2)]:
+        expected = _adaptive_coarsegrain_reference(
+            ar, countar, cutoff=cutoff, max_levels=max_levels
+        )
+        result = numutils.adaptive_coarsegrain(
+            ar, countar, cutoff=cutoff, max_levels=max_levels
+        )
+        assert result.shape == shape
+        assert np.array_equal(np.isnan(result), np.isnan(ar))
+        assert np.allclose(result, expected, equal_nan=True)
+
+    # the input is left intact
+    assert np.isnan(ar[:, 3]).all() and np.isfinite(ar).sum() > 0
+
+
+@pytest.mark.parametrize("pad_zeros", [True, False])
+def test_interp_nan(pad_zeros):
+    rng = np.random.RandomState(0)
+
+    v = rng.rand(50)
+    v[[10, 11, 12, 30, 45]] = np.nan
+    if pad_zeros:
+        v[[0, 49]] = np.nan
+    expected = numutils._interp_nan_scipy(v, pad_zeros=pad_zeros)
+    assert np.allclose(numutils.interp_nan(v, pad_zeros=pad_zeros), expected)
+    assert np.allclose(numutils.interp_nan(v[None, :], pad_zeros=pad_zeros), expected)
+
+    mat = rng.rand(40, 30)
+    if pad_zeros:
+        mat[[0, 5, 6, 20], :] = np.nan
+        mat[:, [3, 17, 29]] = np.nan
+    else:
+        # edges have to be NaN-free
+        mat[[5, 6, 20], 1:-1] = np.nan
+        mat[1:-1, [3, 17]] = np.nan
+    expected = numutils._interp_nan_scipy(mat, pad_zeros=pad_zeros)
+    result = numutils.interp_nan(mat, pad_zeros=pad_zeros)
+    assert np.isnan(mat).any() and not np.isnan(result).any()
+    assert np.allclose(result, expected)
+
+    # in place
+    buf = mat.copy()
+    assert numutils.interp_nan(buf, pad_zeros=pad_zeros, copy=False) is buf
+    assert np.allclose(buf, expected)
+
+    mat[1, 1] = np.nan
+    with pytest.raises(AssertionError):
+        numutils.interp_nan(mat, pad_zeros=pad_zeros)
+    if not pad_zeros:
+        mat[0, 0] = np.nan
+        with pytest.raises(ValueError):
+            numutils.interp_nan(mat, pad_zeros=pad_zeros)
+
+
+def test_interpolate_bad_singletons():
+    N = 20
+    mat = np.fromfunction(lambda i, j: 1.0 / (1 + np.abs(i - j)), (N, N))
+    bad = [5, 11, 12]  # one singleton, and a pair of bad bins
+    mat[bad, :] = 0
+    mat[:, bad] = 0
+
+    result, mask = numutils.interpolate_bad_singletons(
+        mat, fillDiagonal=False, returnMask=True
+    )
+    assert np.allclose(result, result.T, equal_nan=True)
+    # the singleton is interpolated along the diagonal
+    assert np.isclose(result[5, 15], (mat[4, 14] + mat[6, 16]) / 2)
+    assert np.isclose(result[15, 5], result[5, 15])
+    assert mask[5, 15] and mask[15, 5]
+    # but not at the intersections with the other bad bins
+    assert np.isnan(result[5, 11]) and np.isnan(result[11, 5])
+    assert np.isnan(result[11]).all() and np.isnan(result[:, 12]).all()
+
+    buf = mat.copy()
+    result = numutils.interpolate_bad_singletons(buf, copy=False)
+    assert result is buf
+    assert np.isnan(np.diag(buf)).all() and np.isfinite(buf[5, 15])
+
+
+def test_coarsen_sparse():
+    rng = np.random.RandomState(0)
+    dense = rng.poisson(0.3, size=(30, 21)).astype(float)
+    for fmt in ["coo", "csr"]:
+        x = scipy.sparse.coo_matrix(dense).asformat(fmt)
+
+        result = numutils.coarsen_sparse(x, {0: 3, 1: 7})
+        assert result.format == fmt
+        assert np.allclose(
+            result.toarray(), numutils.coarsen(np.sum, dense, {0: 3, 1: 7})
+        )
+
+        result = numutils.coarsen_sparse(x, 4, trim_excess=True)
+        assert np.allclose(
+            result.toarray(),
+            numutils.coarsen(np.sum, dense, {0: 4, 1: 4}, trim_excess=True),
+        )
+
+        # excess rows and columns are summed into smaller blocks
+        result = numutils.coarsen_sparse(x, 4)
+        assert result.shape == (8, 6)
+        assert np.isclose(result.sum(), dense.sum())
+        assert np.isclose(result.toarray()[-1, -1], dense[28:, 20:].sum())
+
+
+def test_zoom_sparse():
+    rng = np.random.RandomState(0)
+    dense = rng.poisson(0.3, size=(30, 21)).astype(float)
+    x = scipy.sparse.csr_matrix(dense)
+
+    result = numutils.zoom_sparse(x, (10, 7))
+    assert result.format == "csr"
+    assert np.allclose(result.toarray(), numutils.coarsen(np.mean, dense, {0: 3, 1: 3}))
+
+    result = numutils.zoom_sparse(x, (7, 4), same_sum=True)
+    assert result.shape == (7, 4)
+    assert np.isclose(result.sum(), dense.sum())
+    ones = numutils.zoom_sparse(scipy.sparse.csr_matrix(np.ones((30, 21))), (7, 4))
+    assert np.allclose(ones.toarray(), 1)
+
+    with pytest.raises(ValueError):
+        numutils.zoom_sparse(x, (60, 7))
+
+
+@pytest.mark.parametrize(
+    "region1,region2",
+    [(None, None), ("chr2", None), ("chr1", "chr3"), ("chr3", "chr2:0-1000")],
+)
+def test_coarsen_cooler(request, region1, region2):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    for balance in ["weight", False]:
+        dense = clr.matrix(balance=balance)
+        if region1 is None:
+            dense = dense[:]
+        else:
+            dense = dense.fetch(region1, region2)
+        expected = numutils.coarsen(np.nansum, dense, {0: 7, 1: 3}, trim_excess=True)
+        result = numutils.coarsen_cooler(
+            clr,
+            {0: 7, 1: 3},
+            region1,
+            region2,
+            clr_weight_name=balance or None,
+            trim_excess=True,
+            chunksize=1000,
+            prefetch=1,
+        )
+        assert np.allclose(result.toarray(), expected)
+
+    # blocks at the edges are smaller
+    result = numutils.coarsen_cooler(clr, 7, region1, region2)
+    assert np.isclose(result.sum(), dense.sum())
+
+
+def test_weighted_groupby_mean():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {
+            "region": rng.choice(["chr1", "chr2", "chr10"], 300),
+            "dist_bin_id": rng.randint(0, 10, 300),
+            "P": rng.rand(300) + 0.1,
+            "n_valid": rng.randint(1, 100, 300),
+        }
+    )
+    groups = df.groupby(["region", "dist_bin_id"])
+
+    for mode in ["mean", "std", "logstd", "median"]:
+        result = numutils.weighted_groupby_mean(
+            df, ["region", "dist_bin_id"], "n_valid", mode=mode
+        )
+        assert result.index.equals(groups.size().index)
+        assert list(result.columns) == ["P", "n_valid"]
+        assert np.array_equal(result["n_valid"], groups["n_valid"].sum())
+
+        for key, group in groups:
+            x, w = group["P"].values, group["n_valid"].values
+            if mode == "logstd":
+                x = np.log(x)
+            mean = np.average(x, weights=w)
+            std = np.sqrt(np.average((x - mean) ** 2, weights=w))
+            if mode == "median":
+                order = np.argsort(x)
+                cum_w = np.cumsum(w[order])
+                expected = x[order][np.searchsorted(cum_w, cum_w[-1] / 2)]
+            else:
+                expected = {"mean": mean, "std": std, "logstd": np.exp(std)}[mode]
+            assert np.isclose(result.loc[key, "P"], expected)
+
+    with pytest.raises(NotImplementedError):
+        numutils.weighted_groupby_mean(df, "region", "n_valid", mode="max")
+
+
+def test_persistent_log_bins():
+    bins = numutils.persistent_log_bins(5, bins_per_order_magnitude=10)
+    assert bins[0] == 1 and bins[-1] == 10 ** 5
+    assert np.all(np.diff(np.diff(bins)) >= 0)
+
+    # the bins are memoized and shared between the callers, hence read-only
+    with pytest.raises(ValueError):
+        bins[0] = -1
+    again = numutils.persistent_log_bins(5, bins_per_order_magnitude=10)
+    assert again is bins
+    assert numutils._persistent_log_bins.cache_info().hits > 0
+
+
+def test_get_mp_context_after_parallel_kernel():
+    # forking a process after the threads of the TBB or OpenMP threading
+    # layers were started hangs it at exit, or aborts the workers:
+    script = "\n".join(
+        [
+            "import numpy as np",
+            "from cooltools.lib import numutils",
+            "if __name__ == '__main__':",
+            "    a = np.random.RandomState(0).rand(100, 100)",
+            "    numutils.observed_over_expected(a + a.T)",
+            "    pool = numutils.get_mp_context().Pool(2)",
+            "    assert pool.map(abs, [-1, -2]) == [1, 2]",
+            "    pool.close()",
+        ]
+    )
+    result = subprocess.run([sys.executable, "-c", script], timeout=300)
+    assert result.returncode == 0
@@ -0,0 +1,70 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from cooltools.lib import peaks
+
+
+def _find_peak_prominence_reference(arr, max_dist=None):
+    # direct search of the adjacent higher peaks with nested loops
+    arr = np.asarray(arr, dtype=float)
+    n = len(arr)
+    max_dist = n if max_dist is None else int(max_dist)
+    idxs_nonans = np.where(~np.isnan(arr))[0]
+    arr_nonans = arr[idxs_nonans]
+    is_loc_max = np.r_[False, arr_nonans[:-1] < arr_nonans[1:]] & np.r_[
+        arr_nonans[:-1] > arr_nonans[1:], False
+    ]
+    loc_max_poss = idxs_nonans[is_loc_max]
+
+    proms = []
+    for pos in loc_max_poss:
+        left_prom, right_prom = np.nan, np.nan
+        for j in range(pos - 1, -1, -1):
+            if (arr[j] > arr[pos]) or (pos - j > max_dist):
+                left_prom = arr[pos] - np.nanmin(arr[j:pos])
+                break
+        for j in range(pos + 1, n):
+            if (arr[j] > arr[pos]) or (j - pos > max_dist):
+                right_prom = arr[pos] - np.nanmin(arr[pos:j])
+                break
+        proms.append(np.nanmin([left_prom, right_prom]))
+    return loc_max_poss, np.array(proms)
+
+
+@pytest.mark.parametrize("max_dist", [None, 1, 5, 50])
+def test_find_peak_prominence(max_dist):
+    rng = np.random.RandomState(0)
+    for n, nan_frac in [(10, 0), (1000, 0), (1000, 0.1)]:
+        arr = np.cumsum(rng.randn(n))
+        arr[rng.rand(n) < nan_frac] = np.nan
+
+        poss, proms = peaks.find_peak_prominence(arr, max_dist=max_dist)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            ref_poss, ref_proms = _find_peak_prominence_reference(arr, max_dist)
+
+        assert np.array_equal(poss, ref_poss)
+        # the global maximum has no adjacent higher peaks and is treated apart
+        is_global_max = arr[poss] == np.nanmax(arr)
+        assert np.allclose(
+            proms[~is_global_max], ref_proms[~is_global_max], equal_nan=True
+        )
+        assert np.all(proms >= 0)
+
+
+def test_range_nanmin():
+    rng = np.random.RandomState(0)
+    for n in [1, 63, 64, 65, 1000]:
+        arr = rng.randn(n)
+        arr[rng.rand(n) < 0.3] = np.nan
+        for block in [1, 4, 64]:
+            table = peaks._block_sparse_table(arr, block)
+            for lo, hi in rng.randint(0, n + 1, size=(200, 2)):
+                lo, hi = min(lo, hi), max(lo, hi)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    expected = np.nanmin(arr[lo:hi]) if hi > lo else np.nan
+                result = peaks._range_nanmin(arr, table, block, lo, hi)
+                assert np.isclose(result, expected, equal_nan=True)
@@ -0,0 +1,80 @@
+import os.path as op
+
+import numpy as np
+import pytest
+
+import cooler
+from cooltools.lib._query import CSRSelector, prefetch_iter
+
+
+@pytest.mark.parametrize("max_diag", [None, 1, 7])
+def test_csr_selector(request, max_diag):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    nbins = clr.info["nbins"]
+    selector = CSRSelector(
+        clr.open("r"),
+        shape=(nbins, nbins),
+        field="count",
+        chunksize=1000,
+        max_diag=max_diag,
+    )
+
+    for (i0, i1), (j0, j1) in [
+        ((0, nbins), (0, nbins)),
+        ((150, 330), (170, 400)),
+        ((20, 21), (0, nbins)),
+    ]:
+        query = selector[i0:i1, j0:j1]
+        assert query.n_chunks >= 1
+        result = query.read(include_index=True)
+
+        pixels = clr.pixels()[:]
+        mask = (
+            (pixels["bin1_id"] >= i0)
+            & (pixels["bin1_id"] < i1)
+            & (pixels["bin2_id"] >= j0)
+            & (pixels["bin2_id"] < j1)
+        )
+        if max_diag is not None:
+            mask &= pixels["bin2_id"] - pixels["bin1_id"] < max_diag
+        expected = pixels[mask]
+
+        for key in ["bin1_id", "bin2_id", "count"]:
+            assert np.array_equal(result[key], expected[key].values)
+            assert result[key].dtype == expected[key].dtype
+
+        index = np.concatenate(
+            [chunk["__index"] for chunk in query.read_chunked(include_index=True)]
+        )
+        assert np.array_equal(index, expected.index.values)
+
+
+def test_prefetch(request):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    nbins = clr.info["nbins"]
+    selector = CSRSelector(
+        clr.open("r"), shape=(nbins, nbins), field="count", chunksize=500
+    )
+    query = selector[0:nbins, 0:nbins]
+    assert query.n_chunks > 3
+
+    chunks = list(query.read_chunked())
+    for prefetch in [1, 2, 100]:
+        prefetched = list(query.read_chunked(prefetch=prefetch))
+        assert len(prefetched) == len(chunks)
+        for chunk, expected in zip(prefetched, chunks):
+            for key in expected:
+                assert np.array_equal(chunk[key], expected[key])
+
+    # the consumer can stop early
+    for i, _ in enumerate(query.read_chunked(prefetch=2)):
+        if i == 1:
+            break
+
+    # errors of the background reader are raised in the consumer
+    def failing():
+        yield 1
+        raise KeyError("failed read")
+
+    with pytest.raises(KeyError):
+        list(prefetch_iter(failing(), 2))
@@ -422,3 +422,34 @@ def test_cooler_snipper_with_view(request):
         matrix, "foo", "foo", (110_000_000, 120_000_000, 110_000_000, 120_000_000)
     )
     assert snippet.shape is not None
+
+
+def test_pileup_float32(request):
+    clr = cooler.Cooler(op.join(request.fspath.dirname, "data/sin_eigs_mat.cool"))
+    view_df = cooltools.lib.common.make_cooler_view(clr).iloc[:2]
+    exp = cooltools.api.expected.expected_cis(clr, view_df=view_df, smooth=False)
+    # the last feature is out of the view:
+    features = pd.DataFrame(
+        {
+            "chrom": ["chr1", "chr1", "chr2", "chr3"],
+            "start": [200, 500, 1200, 900],
+            "end": [210, 510, 1210, 910],
+        }
+    )
+
+    for expected_df in [None, exp]:
+        stacks = {
+            dtype: cooltools.api.snipping.pileup(
+                clr,
+                features,
+                view_df=view_df,
+                expected_df=expected_df,
+                flank=50,
+                dtype=dtype,
+            )
+            for dtype in [np.float64, np.float32]
+        }
+        assert stacks[np.float32].dtype == np.float32
+        assert np.allclose(
+            stacks[np.float32], stacks[np.float64], rtol=1e-6, equal_nan=True
+        )